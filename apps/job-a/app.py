@@ -1,27 +1,66 @@
 import csv
 import os
+import numpy as np
 from sklearn.decomposition import PCA
 from sklearn.preprocessing import StandardScaler
 from verse import common
 
 DATA_PATH = os.environ.get("DATA_PATH", "/static_data/LD2011_2014.csv")
+# "stream" accumulates a meters x meters Gram matrix chunk by chunk, "exact"
+# loads the full frame and runs sklearn
+PCA_MODE = os.environ.get("PCA_MODE", "stream")
+PCA_CHUNKSIZE = int(os.environ.get("PCA_CHUNKSIZE", "2000"))
 
 logging = common.logging
 
 
+def streaming_pca(chunks, n_components: int) -> np.ndarray:
+    """
+    Returns the principal components of the meters (samples) over timestamps
+    (features), i.e. `PCA().fit_transform(StandardScaler().fit_transform(X.T))`
+    for the (timestamps, meters) matrix X, from an iterator of row blocks of X.
+
+    Each timestamp row is standardized across meters as it arrives and only the
+    meters x meters Gram matrix is kept, so peak memory is one chunk plus
+    meters^2 float64s. Its eigendecomposition gives the exact scores U * S,
+    which match sklearn's svd_solver="full" PCA on the same float64 inputs to
+    ~1e-10 relative, up to the sign of each component (fixed here so the
+    largest absolute score is positive). sklearn's default randomized solver
+    is itself approximate and may disagree when leading eigenvalues are close.
+    """
+    gram = None
+    for block in chunks:
+        block = block.astype(np.float64)
+        block -= block.mean(axis=1, keepdims=True)
+        std = block.std(axis=1, keepdims=True)
+        std[std == 0] = 1.0
+        block /= std
+        gram = block.T @ block if gram is None else gram + block.T @ block
+    eigvals, eigvecs = np.linalg.eigh(gram)
+    top = np.argsort(eigvals)[::-1][:n_components]
+    scores = eigvecs[:, top] * np.sqrt(np.clip(eigvals[top], 0, None))
+    signs = np.sign(scores[np.abs(scores).argmax(axis=0), np.arange(len(top))])
+    return scores * signs
+
+
 @common.elapsed_time
 def main():
     logging.info("job_starting")
-    logging.info("loading_data", source=DATA_PATH)
-    df = common.load_data(DATA_PATH, delimiter=";", decimal=",")
-    data = df.drop(columns=["Unnamed: 0"]).to_numpy()  # drop the time stamp column
+    logging.info("loading_data", source=DATA_PATH, mode=PCA_MODE)
 
     dim = 2
     logging.info("calculating_pca", n_components=dim)
-    scaler = StandardScaler()
-    scaled_data = scaler.fit_transform(data.T)
-    pca = PCA(n_components=dim)
-    principal_components = pca.fit_transform(scaled_data)
+    with common.span("pca", mode=PCA_MODE):
+        if PCA_MODE == "exact":
+            with common.span("load"):
+                data = common.load_meter_data(DATA_PATH).to_numpy()
+            scaler = StandardScaler()
+            scaled_data = scaler.fit_transform(data.T)
+            pca = PCA(n_components=dim)
+            principal_components = pca.fit_transform(scaled_data)
+        else:
+            chunks = common.iter_meter_chunks(DATA_PATH, chunksize=PCA_CHUNKSIZE)
+            principal_components = streaming_pca(chunks, dim)
 
     outfile = "output.csv"
     logging.info("writing_principal_components", output_path=outfile)
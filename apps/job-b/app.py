@@ -1,48 +1,241 @@
-import csv
+import argparse
+import functools
+import hashlib
+import json
 import os
-import pandas as pd
+import shutil
+from pathlib import Path
+import numpy as np
+import torch
 from verse import common
 from sentence_transformers import SentenceTransformer
 
 
 DATA_PATH = os.environ.get("DATA_PATH", "/static_data/enron_emails_1702.csv")
+MODEL_NAME = "all-MiniLM-L6-v2"
 
 logging = common.logging
 
 
+class EmbeddingStore:
+    """
+    Persistent content-hash -> float32 vector store. Vectors are appended to a
+    raw float32 file that is memory-mapped for reads and keys (16-byte blake2b
+    digests) to a parallel file that doubles as the index. The store is wiped
+    when the model name or dimension changes.
+    """
+
+    KEY_BYTES = 16
+
+    def __init__(self, directory: Path, model_name: str, dim: int):
+        self.directory = Path(directory)
+        self.dim = dim
+        self.keys_path = self.directory / "keys.bin"
+        self.vectors_path = self.directory / "vectors.f32"
+        meta_path = self.directory / "meta.json"
+        meta = {"model": model_name, "dim": dim}
+        try:
+            stale = json.loads(meta_path.read_text()) != meta
+        except (OSError, ValueError):
+            stale = True
+        if stale:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory.mkdir(parents=True)
+            meta_path.write_text(json.dumps(meta))
+            self.keys_path.touch()
+            self.vectors_path.touch()
+        # Drop a partially appended tail left by an interrupted run
+        rows = min(
+            self.keys_path.stat().st_size // self.KEY_BYTES,
+            self.vectors_path.stat().st_size // (4 * dim),
+        )
+        os.truncate(self.keys_path, rows * self.KEY_BYTES)
+        os.truncate(self.vectors_path, rows * 4 * dim)
+        keys = self.keys_path.read_bytes()
+        self.index = {
+            keys[i : i + self.KEY_BYTES]: i // self.KEY_BYTES
+            for i in range(0, len(keys), self.KEY_BYTES)
+        }
+
+    @classmethod
+    def key(cls, text: str) -> bytes:
+        return hashlib.blake2b(text.encode(), digest_size=cls.KEY_BYTES).digest()
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def lookup(self, keys: list[bytes]) -> np.ndarray:
+        """Returns the store row of every key, -1 where it is missing"""
+        return np.fromiter((self.index.get(k, -1) for k in keys), np.int64, len(keys))
+
+    def append(self, keys: list[bytes], vectors: np.ndarray) -> None:
+        """
+        Appends the rows whose key is not stored yet, the first of any repeated
+        key only; keys are written last so they commit the vectors
+        """
+        new = {}
+        for pos, k in enumerate(keys):
+            if k not in self.index:
+                new.setdefault(k, pos)
+        if not new:
+            return
+        vectors = np.ascontiguousarray(vectors[list(new.values())], dtype=np.float32)
+        start = self.vectors_path.stat().st_size // (4 * self.dim)
+        with open(self.vectors_path, "ab") as f:
+            f.write(vectors.tobytes())
+        with open(self.keys_path, "ab") as f:
+            f.write(b"".join(new))
+        for row, k in enumerate(new, start):
+            self.index[k] = row
+
+    def vectors(self) -> np.ndarray:
+        """Returns a read-only memory map of every stored vector"""
+        if not self.index:
+            return np.empty((0, self.dim), dtype=np.float32)
+        return np.memmap(
+            self.vectors_path, dtype=np.float32, mode="r", shape=(len(self), self.dim)
+        )
+
+
+_worker_model = None
+
+
+def _init_worker(threads: int):
+    """Loads the model once in each `--workers` process"""
+    global _worker_model
+    torch.set_num_threads(threads)
+    _worker_model = SentenceTransformer(MODEL_NAME)
+
+
+def _encode_partition(texts: np.ndarray, batch_size: int) -> np.ndarray:
+    return _worker_model.encode(
+        texts.tolist(),
+        batch_size=batch_size,
+        convert_to_numpy=True,
+        show_progress_bar=False,
+    )
+
+
 @common.elapsed_time
 def load():
     logging.info(
         "loading_data", msg="loading embedding model and email data", source=DATA_PATH
     )
-    model = SentenceTransformer("all-MiniLM-L6-v2")
-    df = pd.read_csv(DATA_PATH)
+    model = SentenceTransformer(MODEL_NAME)
+    df = common.load_data(DATA_PATH, cache=True)
     return model, df
 
 
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Embed Enron emails")
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=int(os.environ.get("EMBED_LIMIT", "0")),
+        help="number of emails to embed, 0 for all",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=int(os.environ.get("EMBED_BATCH_SIZE", "64")),
+        help="sentences per model forward pass",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="torch intra-op threads, defaults to every CPU core",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.environ.get("EMBED_WORKERS", "1")),
+        help="encode in this many processes, splitting --threads between them",
+    )
+    parser.add_argument(
+        "--output",
+        default=os.environ.get("OUTPUT_PATH", "output.npy"),
+        help="float32 embedding matrix; row ids go to <output>_ids.npy",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=os.environ.get("EMBED_CACHE_DIR", ".embedding_cache"),
+        help="persistent embedding store reused across runs",
+    )
+    return parser.parse_args()
+
+
 @common.elapsed_time
-def main():
+def main(args: argparse.Namespace):
     logging.info("job_starting")
     logging.info("loading_data", source=DATA_PATH)
+    torch.set_num_threads(args.threads)
     model, df = load()
 
-    N = 10
-    outfile = "output.csv"
+    content = df.content[: args.limit or None].fillna("").astype(str)
+    texts = content.to_numpy()
+    ids = content.index.to_numpy(dtype=np.int64)
+    keys = [EmbeddingStore.key(t) for t in texts]
+
+    dim = model.get_sentence_embedding_dimension()
+    store = EmbeddingStore(Path(args.cache_dir), MODEL_NAME, dim)
+    rows = store.lookup(keys)
+    # Encode each missing content once, even if it repeats across emails
+    missing = list({keys[i]: i for i in np.flatnonzero(rows < 0)}.values())
+    logging.info(
+        "embedding_cache",
+        hits=int((rows >= 0).sum()),
+        misses=len(missing),
+        stored=len(store),
+        model=MODEL_NAME,
+    )
+
+    outfile = Path(args.output)
+    ids_file = outfile.with_name(f"{outfile.stem}_ids.npy")
     logging.info(
         "create_embeddings",
-        msg=f"generate embedding vectors for first {N} emails",
-        output_path=outfile,
-    )
-    with open(outfile, "w", newline="") as csvfile:
-        writer = csv.writer(csvfile)
-        for s in df.content[:N]:
-            logging.debug(
-                "create_embeddings", msg="encoding and saving to CSV", email=s[:1024]
+        msg=f"generate embedding vectors for {len(missing)} new emails",
+        batch_size=args.batch_size,
+        threads=args.threads,
+        output_path=str(outfile),
+    )
+    # Longest first so every batch holds similar lengths and pads little
+    lengths = np.array([len(texts[i]) for i in missing], dtype=np.int64)
+    order = np.array(missing, dtype=np.int64)[np.argsort(-lengths, kind="stable")]
+    if args.workers > 1 and len(order):
+        # Deal the length-sorted rows round-robin so every worker gets a similar mix
+        shares = np.concatenate([order[w :: args.workers] for w in range(args.workers)])
+        vectors = common.parallel_apply(
+            functools.partial(_encode_partition, batch_size=args.batch_size),
+            texts[shares],
+            workers=args.workers,
+            initializer=_init_worker,
+            initargs=(max(1, args.threads // args.workers),),
+        )
+        store.append([keys[i] for i in shares], np.vstack(vectors))
+        order = order[:0]
+    # Encode a few batches at a time and append them to the store
+    step = args.batch_size * 16
+    for start in range(0, len(order), step):
+        batch = order[start : start + step]
+        logging.debug("create_embeddings", msg="encoding batch", rows=len(batch))
+        with common.span("encode", log=False):
+            vectors = model.encode(
+                texts[batch].tolist(),
+                batch_size=args.batch_size,
+                convert_to_numpy=True,
+                show_progress_bar=False,
             )
-            v = model.encode(s)
-            writer.writerow(v)
+        store.append([keys[i] for i in batch], vectors)
+
+    out = np.lib.format.open_memmap(
+        outfile, mode="w+", dtype=np.float32, shape=(len(texts), dim)
+    )
+    out[:] = store.vectors()[store.lookup(keys)]
+    out.flush()
+    np.save(ids_file, ids)
 
-    logging.info("job_complete")
+    logging.info("job_complete", ids_path=str(ids_file))
 
 
 @common.profile_memory
@@ -51,5 +244,5 @@ def cleanup():
 
 
 if __name__ == "__main__":
-    main()
+    main(parse_args())
     cleanup()
@@ -1,8 +1,16 @@
+import os
+
 import uvicorn
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from verse import metrics
 from verse.common import get_memory_usage
 
+HOST = os.environ.get("HOST", "0.0.0.0")
+PORT = int(os.environ.get("PORT", "8080"))
+
 app = FastAPI()
+app.add_middleware(metrics.MetricsMiddleware)
 
 
 @app.get("/echo/{msg}")
@@ -11,9 +19,14 @@ def echo(msg: str):
 
 
 @app.get("/metrics/memory")
-def metrics():
+def memory_metrics():
     return get_memory_usage()
 
 
+@app.get("/metrics")
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8080)
+    uvicorn.run(app, host=HOST, port=PORT)
@@ -1,21 +1,91 @@
 import asyncio
+import os
+import time
 import grpc
 import service_pb2 as pb
 import service_pb2_grpc as rpc
+from concurrent.futures import ThreadPoolExecutor
+from verse import metrics
 from verse.common import get_memory_usage
 from grpc_reflection.v1alpha import reflection
 
+ADDRESS = os.environ.get("GRPC_ADDRESS", "0.0.0.0:5000")
+# Port of the plain-HTTP Prometheus scrape endpoint, 0 disables it
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9100"))
+# StreamMemory interval when the request leaves it at 0, and the floor it is clamped to
+STREAM_INTERVAL_MS = int(os.environ.get("STREAM_INTERVAL_MS", "1000"))
+MIN_STREAM_INTERVAL_MS = int(os.environ.get("MIN_STREAM_INTERVAL_MS", "10"))
+# Server tuning; 0 leaves the gRPC default in place
+MAX_CONCURRENT_STREAMS = int(os.environ.get("GRPC_MAX_CONCURRENT_STREAMS", "0"))
+MAX_CONCURRENT_RPCS = int(os.environ.get("GRPC_MAX_CONCURRENT_RPCS", "0"))
+MAX_MESSAGE_BYTES = int(os.environ.get("GRPC_MAX_MESSAGE_BYTES", "0"))
+KEEPALIVE_TIME_MS = int(os.environ.get("GRPC_KEEPALIVE_TIME_MS", "0"))
+KEEPALIVE_TIMEOUT_MS = int(os.environ.get("GRPC_KEEPALIVE_TIMEOUT_MS", "0"))
+KEEPALIVE_WITHOUT_CALLS = os.environ.get("GRPC_KEEPALIVE_WITHOUT_CALLS", "0") == "1"
+# Threads of the executor running any non-async handlers
+THREADS = int(os.environ.get("GRPC_THREADS", "0"))
+
 
 class ServerThree(rpc.VerseServiceServicer):
     async def Echo(self, request, context):
         return pb.EchoReply(msg=request.msg)
 
+    async def EchoBatch(self, request, context):
+        return pb.EchoBatchReply(msgs=request.msgs)
+
+    async def EchoStream(self, request_iterator, context):
+        async for request in request_iterator:
+            yield pb.EchoReply(msg=request.msg)
+
     async def GetMemory(self, request, context):
         return pb.MemReply(usage=get_memory_usage())
 
+    async def StreamMemory(self, request, context):
+        interval_ms = max(
+            request.interval_ms or STREAM_INTERVAL_MS, MIN_STREAM_INTERVAL_MS
+        )
+        interval = interval_ms / 1000
+        sent = 0
+        while not request.count or sent < request.count:
+            if sent:
+                await asyncio.sleep(interval)
+            yield pb.MemReply(
+                usage=get_memory_usage(max_age=interval), timestamp=time.time()
+            )
+            sent += 1
+
+    async def GetMetrics(self, request, context):
+        return pb.MetricsReply(text=metrics.render())
+
+
+def _server_options() -> list[tuple[str, int]]:
+    """Channel arguments for the env settings that are set"""
+    options = []
+    if MAX_CONCURRENT_STREAMS:
+        options.append(("grpc.max_concurrent_streams", MAX_CONCURRENT_STREAMS))
+    if MAX_MESSAGE_BYTES:
+        options.append(("grpc.max_receive_message_length", MAX_MESSAGE_BYTES))
+        options.append(("grpc.max_send_message_length", MAX_MESSAGE_BYTES))
+    if KEEPALIVE_TIME_MS:
+        options.append(("grpc.keepalive_time_ms", KEEPALIVE_TIME_MS))
+        # Let clients ping as often as the server does
+        options.append(
+            ("grpc.http2.min_ping_interval_without_data_ms", KEEPALIVE_TIME_MS)
+        )
+    if KEEPALIVE_TIMEOUT_MS:
+        options.append(("grpc.keepalive_timeout_ms", KEEPALIVE_TIMEOUT_MS))
+    if KEEPALIVE_WITHOUT_CALLS:
+        options.append(("grpc.keepalive_permit_without_calls", 1))
+    return options
+
 
 async def serve():
-    server = grpc.aio.server()
+    server = grpc.aio.server(
+        migration_thread_pool=ThreadPoolExecutor(THREADS) if THREADS else None,
+        interceptors=[metrics.grpc_interceptor()],
+        options=_server_options(),
+        maximum_concurrent_rpcs=MAX_CONCURRENT_RPCS or None,
+    )
     rpc.add_VerseServiceServicer_to_server(ServerThree(), server)
 
     SERVICE_NAMES = (
@@ -24,11 +94,13 @@ async def serve():
     )
     reflection.enable_server_reflection(SERVICE_NAMES, server=server)
 
-    server.add_insecure_port("0.0.0.0:5000")
+    server.add_insecure_port(ADDRESS)
     await server.start()
+    if METRICS_PORT:
+        metrics.start_http_server(METRICS_PORT)
     await server.wait_for_termination()
 
 
 if __name__ == "__main__":
-    print("gRPC server running on port 5000")
+    print(f"gRPC server running on {ADDRESS}")
     asyncio.run(serve())
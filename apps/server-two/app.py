@@ -1,47 +1,389 @@
+import datetime
+import functools
+import math
 import os
+import shutil
+import tempfile
+import numpy as np
 import pandas as pd
 import uvicorn
-from fastapi import FastAPI
-from verse import common
+from fastapi import FastAPI, HTTPException, Query, Response
+from fastapi.responses import ORJSONResponse, PlainTextResponse
+from pydantic import BaseModel, Field
+from verse import common, metrics
 
 DATA_PATH = os.environ.get("DATA_PATH", "/static_data/LD2011_2014.csv")
+HOST = os.environ.get("HOST", "0.0.0.0")
+PORT = int(os.environ.get("PORT", "8080"))
+TOP_K = int(os.environ.get("CORR_TOP_K", "10"))
+# Rows per chunk when streaming the correlation from disk; 0 loads the full frame
+CORR_CHUNKSIZE = int(os.environ.get("CORR_CHUNKSIZE", "0"))
+# Meters per tile when the correlation matrix is built on disk and memory-mapped
+# from CORR_MATRIX_PATH instead of held in memory; 0 keeps it in memory
+CORR_BLOCK_SIZE = int(os.environ.get("CORR_BLOCK_SIZE", "0"))
+CORR_MATRIX_PATH = os.environ.get(
+    "CORR_MATRIX_PATH", os.path.join(tempfile.gettempdir(), "server-two-corr.npy")
+)
+# More than one worker loads once and shares the arrays through memory-mapped files
+WORKERS = int(os.environ.get("SERVER_WORKERS", "1"))
+SHARE_METER_DATA = os.environ.get("SHARE_METER_DATA", "0") == "1"
+# Docker's default /dev/shm is 64MB, raise --shm-size when sharing meter data
+SHARED_ROOT = os.environ.get("SHARED_ROOT") or (
+    "/dev/shm" if os.path.isdir("/dev/shm") else None
+)
+SHARED_DIR_ENV = "SERVER_TWO_SHARED_DIR"
+# CORR_WINDOWS=1 enables `GET /corr/{meter_id}?start=&end=` from per-day prefix sums
+# kept in CORR_WINDOW_DIR (about days x meters^2 x 4 bytes of disk) and reused
+# across restarts while the meter data is unchanged
+CORR_WINDOWS = os.environ.get("CORR_WINDOWS", "0") == "1"
+CORR_WINDOW_DIR = os.environ.get(
+    "CORR_WINDOW_DIR", os.path.join(tempfile.gettempdir(), "server-two-windows")
+)
+# Rendered /corr responses kept per worker, and the most IDs one POST /corr takes
+CORR_CACHE_SIZE = int(os.environ.get("CORR_CACHE_SIZE", "4096"))
+BATCH_LIMIT = int(os.environ.get("CORR_BATCH_LIMIT", "1000"))
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
+app.add_middleware(metrics.MetricsMiddleware)
 logging = common.logging
 
 
+class CorrBatch(BaseModel):
+    meters: list[str]
+    k: int | None = Field(default=None, ge=1)
+
+
 @app.get("/corr/{meter_id}")
-def corr(meter_id: str):
-    k, v = find_most_correlated_meter(meter_id)
-    return {"meter": k, "corr": v}
+async def corr(
+    meter_id: str,
+    k: int | None = Query(default=None, ge=1),
+    start: datetime.date | None = None,
+    end: datetime.date | None = None,
+):
+    """
+    Most correlated meter, or the top `k`, over the whole history or only the
+    days `start` to `end` (inclusive, either may be left open)
+    """
+    return Response(_corr_body(meter_id, k, start, end), media_type="application/json")
+
+
+@app.post("/corr")
+async def corr_batch(batch: CorrBatch):
+    """
+    Answers `GET /corr/{meter_id}` for every ID in one pass over the neighbor
+    index; results follow the request order and unknown meters are null.
+    """
+    if len(batch.meters) > BATCH_LIMIT:
+        raise HTTPException(
+            status_code=413, detail=f"At most {BATCH_LIMIT} meters per request"
+        )
+    return ORJSONResponse({"results": find_batch(batch.meters, batch.k)})
 
 
 @app.get("/metrics/memory")
-def metrics():
+async def memory_metrics():
     return common.get_memory_usage()
 
 
-def find_most_correlated_meter(m: str) -> tuple[str, float]:
-    ix = int(m.split("_")[1]) - 1
-    corrs = app.corr_matrix[ix]
-    mt, max_corr = "MT_000", float("-inf")
-    for i, c in enumerate(corrs):
-        if i == ix:
-            continue
-        if c > max_corr:
-            mt, max_corr = f"MT_{str(i).zfill(3)}", c
-    return mt, max_corr
+@app.get("/metrics/cache")
+async def cache_metrics():
+    info = _corr_body.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "size": info.currsize,
+        "maxsize": info.maxsize,
+        "hit_rate": info.hits / lookups if lookups else None,
+    }
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@functools.lru_cache(maxsize=CORR_CACHE_SIZE)
+def _corr_body(
+    meter_id: str,
+    k: int | None,
+    start: datetime.date | None = None,
+    end: datetime.date | None = None,
+) -> bytes:
+    """Rendered JSON of `GET /corr/{meter_id}`; errors raise and are not cached"""
+    if start is not None or end is not None:
+        return ORJSONResponse(find_window_neighbors(meter_id, k, start, end)).body
+    if k is None:
+        m, v = find_most_correlated_meter(meter_id)
+        return ORJSONResponse({"meter": m, "corr": v}).body
+    neighbors = find_top_k_meters(meter_id, k)
+    return ORJSONResponse({"meter": meter_id, "neighbors": neighbors}).body
+
+
+@app.on_event("startup")
+def _attach_shared_state():
+    """Workers started by `_serve_shared` map the loader's arrays read-only"""
+    directory = os.environ.get(SHARED_DIR_ENV)
+    if directory is None or hasattr(app, "corr_matrix"):
+        return
+    arrays = common.attach_arrays(directory)
+    if "corr" in arrays:
+        app.corr_matrix = arrays["corr"]
+    else:
+        app.corr_matrix = common.open_corr_matrix(CORR_MATRIX_PATH)
+    app.neighbor_idx = arrays["neighbor_idx"]
+    app.neighbor_corr = arrays["neighbor_corr"]
+    app.meter_names = arrays["meter_cols"]
+    app.meter_cols = app.meter_names.tolist()
+    app.meter_ix = {m: i for i, m in enumerate(app.meter_cols)}
+    _corr_body.cache_clear()
+    if "meter_data" in arrays:
+        app.meter_data = arrays["meter_data"]
+        app.timestamps = arrays["timestamps"]
+    if CORR_WINDOWS:
+        app.windows = common.attach_arrays(CORR_WINDOW_DIR)
+    logging.info("shared_state_attached", source=directory, pid=os.getpid())
+
+
+def _meter_row(m: str) -> int:
+    ix = app.meter_ix.get(m)
+    if ix is None:
+        raise HTTPException(status_code=404, detail=f"Unknown meter {m}")
+    return ix
+
+
+def find_most_correlated_meter(m: str) -> tuple[str | None, float | None]:
+    ix = _meter_row(m)
+    if app.neighbor_idx.shape[1] == 0 or math.isinf(app.neighbor_corr[ix, 0]):
+        return None, None
+    return app.meter_cols[app.neighbor_idx[ix, 0]], float(app.neighbor_corr[ix, 0])
+
+
+def _neighbors(rows: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Top `k` neighbor indices and values of `rows`: sliced from the neighbor
+    index up to `TOP_K`, read from those rows of the correlation matrix beyond
+    """
+    if k <= app.neighbor_idx.shape[1]:
+        return app.neighbor_idx[rows, :k], app.neighbor_corr[rows, :k]
+    return common.top_k_neighbors(app.corr_matrix, k, rows=rows)
+
+
+def find_top_k_meters(m: str, k: int) -> list[dict]:
+    ix = _meter_row(m)
+    idx, vals = _neighbors(np.array([ix]), k)
+    return [
+        {"meter": app.meter_cols[j], "corr": float(c)}
+        for j, c in zip(idx[0], vals[0])
+        if not math.isinf(c)
+    ]
+
+
+def find_window_neighbors(
+    m: str,
+    k: int | None,
+    start: datetime.date | None,
+    end: datetime.date | None,
+) -> dict:
+    """
+    `find_most_correlated_meter`/`find_top_k_meters` over the days `start` to
+    `end` only, from the per-day prefix sums in O(meters) whatever the window
+    length. The response names the first and last day actually covered.
+    """
+    ix = _meter_row(m)
+    windows = getattr(app, "windows", None)
+    if windows is None:
+        raise HTTPException(
+            status_code=501,
+            detail="Windowed correlation is disabled, set CORR_WINDOWS=1",
+        )
+    if start is not None and end is not None and start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    days = windows["days"]
+    lo = 0 if start is None else int(np.searchsorted(days, np.datetime64(start, "D")))
+    hi = len(days)
+    if end is not None:
+        hi = int(np.searchsorted(days, np.datetime64(end, "D"), side="right"))
+    # Days without rows repeat the previous prefix, so an unchanged count
+    # means the window holds only such days
+    if lo >= hi or windows["count"][hi] == windows["count"][lo]:
+        raise HTTPException(
+            status_code=400,
+            detail=f"No data in the window, data covers {days[0]} to {days[-1]}",
+        )
+    row = common.window_corr_row(windows, ix, lo, hi)
+    idx, vals = common.top_k_row(row, 1 if k is None else k, ix)
+    window = {"start": str(days[lo]), "end": str(days[hi - 1])}
+    if k is None:
+        if len(vals) == 0 or math.isinf(vals[0]):
+            return {"meter": None, "corr": None, **window}
+        return {"meter": app.meter_cols[idx[0]], "corr": float(vals[0]), **window}
+    neighbors = [
+        {"meter": app.meter_cols[j], "corr": float(c)}
+        for j, c in zip(idx, vals)
+        if not math.isinf(c)
+    ]
+    return {"meter": m, "neighbors": neighbors, **window}
+
+
+def find_batch(meters: list[str], k: int | None) -> list[dict | None]:
+    """
+    Vectorized `find_most_correlated_meter`/`find_top_k_meters` over many
+    meters: the neighbor names and values of every known meter are gathered in
+    one NumPy indexing step and only the JSON shaping runs per meter.
+    """
+    rows = np.fromiter((app.meter_ix.get(m, -1) for m in meters), np.int64, len(meters))
+    known = rows >= 0
+    idx, vals = _neighbors(rows[known], 1 if k is None else k)
+    names = app.meter_names[idx].tolist()
+    finite = np.isfinite(vals).tolist()
+    vals = vals.tolist()
+    results: list[dict | None] = [None] * len(meters)
+    for pos, n, v, f in zip(np.flatnonzero(known).tolist(), names, vals, finite):
+        if k is None:
+            best = f[0] if f else False
+            results[pos] = {
+                "meter": n[0] if best else None,
+                "corr": v[0] if best else None,
+            }
+        else:
+            results[pos] = {
+                "meter": meters[pos],
+                "neighbors": [
+                    {"meter": nj, "corr": vj} for nj, vj, fj in zip(n, v, f) if fj
+                ],
+            }
+    return results
 
 
 def _load_meter_data() -> pd.DataFrame:
-    logging.info("mem_before_data_load", mem=common.get_memory_usage())
+    logging.info("mem_before_data_load", mem=common.get_memory_usage(max_age=0))
     logging.info("loading_meter_data", source=DATA_PATH)
-    df = common.load_data(DATA_PATH, delimiter=";", decimal=",")
-    logging.info("mem_after_data_load", mem=common.get_memory_usage())
+    df = common.load_meter_data(DATA_PATH)
+    logging.info("mem_after_data_load", mem=common.get_memory_usage(max_age=0))
     return df
 
 
+def _load_meter_values() -> tuple[list[str], np.ndarray, np.ndarray]:
+    """
+    Returns the meter names, (rows, meters) values and timestamps, memory-mapped
+    from the binary conversion of DATA_PATH when there is a current one
+    """
+    try:
+        values, timestamps, meter_cols = common.load_meter_binary(DATA_PATH)
+    except FileNotFoundError:
+        df = _load_meter_data()
+        return list(df.columns), df.to_numpy(), df.index.to_numpy()
+    return meter_cols, values, timestamps
+
+
+def _load_corr_matrix() -> tuple[list[str], np.ndarray]:
+    """
+    Returns the meter column names and their correlation matrix, memory-mapped
+    from CORR_MATRIX_PATH when CORR_BLOCK_SIZE is set
+    """
+    if CORR_BLOCK_SIZE > 0:
+        logging.info("mem_before_data_load", mem=common.get_memory_usage(max_age=0))
+        meter_cols, values, _ = _load_meter_values()
+        logging.info(
+            "building_blocked_corr",
+            path=CORR_MATRIX_PATH,
+            meters=len(meter_cols),
+            block_size=CORR_BLOCK_SIZE,
+        )
+        common.corr_blocked(values, CORR_MATRIX_PATH, block_size=CORR_BLOCK_SIZE)
+        logging.info("mem_after_data_load", mem=common.get_memory_usage(max_age=0))
+        return meter_cols, common.open_corr_matrix(CORR_MATRIX_PATH)
+    if CORR_CHUNKSIZE <= 0:
+        df = _load_meter_data()
+        meter_cols = common.get_meter_cols(df)
+        return meter_cols, common.corr(df, meter_cols)
+    logging.info("mem_before_data_load", mem=common.get_memory_usage(max_age=0))
+    logging.info("streaming_meter_data", source=DATA_PATH, chunksize=CORR_CHUNKSIZE)
+    meter_cols = common.read_meter_cols(DATA_PATH)
+    mat = common.corr_stream(
+        DATA_PATH, meter_cols, chunksize=CORR_CHUNKSIZE, delimiter=";", decimal=","
+    )
+    logging.info("mem_after_data_load", mem=common.get_memory_usage(max_age=0))
+    return meter_cols, mat
+
+
+def _build_neighbor_index(meter_cols: list[str]) -> None:
+    """Precomputes the top `TOP_K` neighbors of every meter once at startup"""
+    app.meter_cols = meter_cols
+    app.meter_names = np.array(meter_cols)
+    app.meter_ix = {m: i for i, m in enumerate(meter_cols)}
+    _corr_body.cache_clear()
+    app.neighbor_idx, app.neighbor_corr = common.top_k_neighbors(
+        app.corr_matrix, TOP_K, block_size=CORR_BLOCK_SIZE or None
+    )
+    logging.info("neighbor_index_built", meters=len(meter_cols), k=TOP_K)
+
+
+def _build_window_index() -> None:
+    """
+    Maps the per-day prefix sums behind windowed `/corr` queries, writing them
+    first unless CORR_WINDOW_DIR already holds them for the current meter data.
+    In blocked mode they are built CORR_BLOCK_SIZE meters at a time.
+    """
+    reused = common.prefix_sums_current(CORR_WINDOW_DIR, DATA_PATH)
+    if not reused:
+        meter_cols, values, timestamps = _load_meter_values()
+        if meter_cols != app.meter_cols:
+            raise RuntimeError(f"{DATA_PATH} meters changed while starting up")
+        common.daily_prefix_sums(
+            values,
+            timestamps,
+            CORR_WINDOW_DIR,
+            block_size=CORR_BLOCK_SIZE or None,
+            source=DATA_PATH,
+        )
+    app.windows = common.attach_arrays(CORR_WINDOW_DIR)
+    if app.windows["cross"].shape[1] != len(app.meter_cols):
+        raise RuntimeError(f"{CORR_WINDOW_DIR} does not match the meter data")
+    logging.info("window_index_ready", days=len(app.windows["days"]), reused=reused)
+
+
+def _serve_shared() -> None:
+    """
+    Writes the loaded state to a shared directory and runs `WORKERS` uvicorn
+    processes that attach to it, so RSS does not grow with the worker count.
+    """
+    directory = tempfile.mkdtemp(prefix="server-two-", dir=SHARED_ROOT)
+    try:
+        arrays = {
+            "neighbor_idx": app.neighbor_idx,
+            "neighbor_corr": app.neighbor_corr,
+            "meter_cols": np.array(app.meter_cols),
+        }
+        # A blocked matrix is already on disk; workers map CORR_MATRIX_PATH
+        if CORR_BLOCK_SIZE <= 0:
+            arrays["corr"] = app.corr_matrix
+        if SHARE_METER_DATA:
+            df = common.load_meter_data(DATA_PATH, app.meter_cols)
+            arrays["meter_data"] = df.to_numpy()
+            arrays["timestamps"] = df.index.to_numpy()
+            del df
+        common.share_arrays(directory, **arrays)
+        os.environ[SHARED_DIR_ENV] = directory
+        logging.info("shared_state_ready", path=directory, workers=WORKERS)
+        uvicorn.run("app:app", host=HOST, port=PORT, workers=WORKERS)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
 if __name__ == "__main__":
-    df = _load_meter_data()
-    app.corr_matrix = common.corr(df, common.get_meter_cols(df))
-    uvicorn.run(app, host="0.0.0.0", port=8080)
+    with common.span("startup"):
+        with common.span(
+            "corr_matrix", chunksize=CORR_CHUNKSIZE, block_size=CORR_BLOCK_SIZE
+        ):
+            meter_cols, app.corr_matrix = _load_corr_matrix()
+        with common.span("neighbor_index"):
+            _build_neighbor_index(meter_cols)
+        if CORR_WINDOWS:
+            with common.span("window_index"):
+                _build_window_index()
+    if WORKERS > 1:
+        _serve_shared()
+    else:
+        uvicorn.run(app, host=HOST, port=PORT)
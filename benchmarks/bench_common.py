@@ -0,0 +1,219 @@
+"""
+Micro-benchmarks of the verse.common hot paths on synthetic meter-style CSVs
+(the LD2011_2014 layout: ";" separated, "," decimals, MT_xxx columns).
+
+For every --sizes entry, ROWSxCOLS, it times `load_data` (cold and from its
+cache), `get_meter_cols` and `corr` as the best of --repeat runs, and records
+the peak traced allocation of one extra run under tracemalloc. The per-call
+overhead of `elapsed_time`, `profile_memory` and `span` is timed once.
+
+Results are compared with the stored --baseline and the run fails when a
+metric is more than --threshold (relative) worse and also past a small
+absolute noise floor. --save-baseline records the current run instead.
+
+    PYTHONPATH=lib python benchmarks/bench_common.py
+    PYTHONPATH=lib python benchmarks/bench_common.py --sizes 1000x10 --save-baseline
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import structlog
+from verse import common
+
+HERE = Path(__file__).resolve().parent
+DEFAULT_SIZES = "1000x10,10000x100,100000x100,1000000x10,10000x1000"
+READ_KWARGS = {"delimiter": ";", "decimal": ","}
+# Differences smaller than these are noise whatever the relative change
+NOISE_FLOOR = {"seconds": 0.002, "traced_peak_mb": 1.0, "overhead_us": 2.0}
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark verse.common")
+    parser.add_argument(
+        "--sizes",
+        default=os.environ.get("BENCH_SIZES", DEFAULT_SIZES),
+        help="comma separated ROWSxCOLS synthetic datasets",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per metric")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=float(os.environ.get("BENCH_THRESHOLD", "0.25")),
+        help="relative regression tolerated against the baseline",
+    )
+    parser.add_argument("--baseline", default=str(HERE / "baseline.json"))
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="write this run as the baseline instead of comparing",
+    )
+    parser.add_argument(
+        "--data-dir",
+        default=os.environ.get("BENCH_DATA_DIR", str(HERE / ".data")),
+        help="where generated CSVs are kept between runs",
+    )
+    parser.add_argument("--output", help="also write this run's results as JSON")
+    return parser.parse_args()
+
+
+def synthetic_meter_csv(data_dir: Path, rows: int, cols: int) -> Path:
+    """Writes (once) a reproducible meter CSV of `rows` 15 minute readings"""
+    path = Path(data_dir) / f"meters_{rows}x{cols}.csv"
+    if path.exists():
+        return path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(rows * 100_003 + cols)
+    index = pd.date_range("2011-01-01 00:15:00", periods=rows, freq="15min")
+    values = rng.gamma(2.0, 50.0, size=(rows, cols)).astype(np.float32)
+    # Real meters report zeros before they are installed
+    values[: rows // 10, :: max(cols // 5, 1)] = 0
+    columns = [f"MT_{i:03d}" for i in range(1, cols + 1)]
+    df = pd.DataFrame(values, index=index, columns=columns)
+    tmp = path.with_suffix(".tmp")
+    df.to_csv(tmp, sep=";", decimal=",", float_format="%.3f")
+    tmp.replace(path)
+    return path
+
+
+def _best_seconds(func, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _traced_peak_mb(func) -> float:
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / (1024**2)
+    finally:
+        tracemalloc.stop()
+
+
+def _measure(func, repeat: int) -> dict:
+    return {
+        "seconds": round(_best_seconds(func, repeat), 6),
+        "traced_peak_mb": round(_traced_peak_mb(func), 3),
+    }
+
+
+def bench_size(path: Path, label: str, repeat: int) -> dict:
+    results = {}
+    results[f"load_data[{label}]"] = _measure(
+        lambda: common.load_data(path, **READ_KWARGS), repeat
+    )
+    common.load_data(path, cache=True, **READ_KWARGS)
+    results[f"load_data_cached[{label}]"] = _measure(
+        lambda: common.load_data(path, cache=True, **READ_KWARGS), repeat
+    )
+    df = common.load_data(path, **READ_KWARGS)
+    results[f"get_meter_cols[{label}]"] = _measure(
+        lambda: common.get_meter_cols(df), repeat
+    )
+    cols = common.get_meter_cols(df)
+    results[f"corr[{label}]"] = _measure(lambda: common.corr(df, cols), repeat)
+    return results
+
+
+def bench_decorators(repeat: int, calls: int = 2000) -> dict:
+    """Per-call overhead in microseconds of each decorator over a bare call"""
+
+    def bare():
+        return None
+
+    def per_call_us(func):
+        return (
+            _best_seconds(lambda: [func() for _ in range(calls)], repeat) / calls * 1e6
+        )
+
+    base = per_call_us(bare)
+    wrapped = {
+        "elapsed_time": common.elapsed_time(bare),
+        "profile_memory": common.profile_memory(bare),
+        "span": common.span("bench", log=False)(bare),
+    }
+    return {
+        f"{name}_overhead": {"overhead_us": round(per_call_us(func) - base, 3)}
+        for name, func in wrapped.items()
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """Returns a description of every metric regressed past the threshold"""
+    regressions = []
+    for name, fields in results.items():
+        for field, value in fields.items():
+            base = baseline.get(name, {}).get(field)
+            if base is None:
+                continue
+            if value > base * (1 + threshold) and value - base > NOISE_FLOOR[field]:
+                regressions.append(
+                    f"{name} {field}: {value:g} vs baseline {base:g} "
+                    f"(+{(value / base - 1) * 100 if base else float('inf'):.0f}%)"
+                )
+    return regressions
+
+
+def main(args: argparse.Namespace) -> int:
+    results = {}
+    # Decorators log on every call; keep that cost but not the terminal output
+    with open(os.devnull, "w") as devnull:
+        structlog.configure(logger_factory=structlog.PrintLoggerFactory(devnull))
+        try:
+            for size in args.sizes.split(","):
+                rows, cols = (int(n) for n in size.lower().split("x"))
+                path = synthetic_meter_csv(Path(args.data_dir), rows, cols)
+                results.update(bench_size(path, f"{rows}x{cols}", args.repeat))
+            results.update(bench_decorators(args.repeat))
+        finally:
+            structlog.reset_defaults()
+
+    for name, fields in results.items():
+        print(
+            f"{name:<34} "
+            + "  ".join(f"{field} {value:>10.4f}" for field, value in fields.items())
+        )
+    report = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "cpus": os.cpu_count(),
+        "metrics": results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2, sort_keys=True))
+
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        baseline_path.write_text(json.dumps(report, indent=2, sort_keys=True) + "\n")
+        print(f"baseline written to {baseline_path}")
+        return 0
+    if not baseline_path.exists():
+        print(f"no baseline at {baseline_path}, run with --save-baseline to create it")
+        return 0
+    regressions = compare(
+        results, json.loads(baseline_path.read_text())["metrics"], args.threshold
+    )
+    for line in regressions:
+        print(f"REGRESSION {line}", file=sys.stderr)
+    print(
+        f"{len(regressions)} regression(s) beyond {args.threshold:.0%} "
+        f"of {baseline_path}"
+    )
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
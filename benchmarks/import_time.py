@@ -0,0 +1,183 @@
+"""
+Cold-start import budgets of the verse library and every app entry point.
+
+Each entry point is imported in a fresh interpreter under `python -X importtime`
+(the app's own directory and lib/ on the path, as in its image) and the
+cumulative time of everything it imports beyond interpreter startup is taken
+as the best of --repeat runs. The run fails when an entry point is over its
+budget or imports a module it must not pull in at startup, such as pandas in
+the servers that only report memory. Entry points whose dependencies are not
+installed are reported as skipped.
+
+    PYTHONPATH=lib python benchmarks/import_time.py
+    PYTHONPATH=lib python benchmarks/import_time.py --only server-one --repeat 10
+
+server-three's gRPC stubs are generated from its service.proto into a temporary
+directory first, as its image build does, which needs grpcio-tools.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+# Budgets in ms, roughly twice the time measured on one core of a dev machine;
+# `forbid` lists modules the entry point must not import and `proto` the service
+# definition whose stubs the app imports
+ENTRY_POINTS = {
+    "verse.common": {
+        "module": "verse.common",
+        "budget_ms": 60,
+        "forbid": ("numpy", "pandas", "structlog"),
+    },
+    "verse.metrics": {"module": "verse.metrics", "budget_ms": 40, "forbid": ()},
+    "verse.data": {"module": "verse.data", "budget_ms": 600, "forbid": ()},
+    "server-one": {"app": "server-one", "budget_ms": 600, "forbid": ("pandas",)},
+    "server-two": {"app": "server-two", "budget_ms": 1000, "forbid": ()},
+    "server-three": {
+        "app": "server-three",
+        "proto": "service.proto",
+        "budget_ms": 250,
+        "forbid": ("numpy", "pandas"),
+    },
+    "job-a": {"app": "job-a", "budget_ms": 2000, "forbid": ()},
+    "job-b": {"app": "job-b", "budget_ms": 10000, "forbid": ()},
+    "job-c": {"app": "job-c", "budget_ms": 600, "forbid": ()},
+}
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Check import-time budgets")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per entry point")
+    parser.add_argument(
+        "--only", action="append", help="entry point to check, may be repeated"
+    )
+    parser.add_argument(
+        "--extra-path",
+        default=os.environ.get("BENCH_EXTRA_PATH", ""),
+        help="os.pathsep separated directories added to every import path",
+    )
+    parser.add_argument(
+        "--scale",
+        type=float,
+        default=float(os.environ.get("BENCH_IMPORT_SCALE", "1")),
+        help="multiplier applied to every budget, for slower machines",
+    )
+    parser.add_argument("--output", help="also write the results as JSON")
+    return parser.parse_args()
+
+
+def import_times(code: str, cwd: Path, path: list[str]) -> tuple[dict, set]:
+    """
+    Runs `code` under -X importtime. Returns the cumulative microseconds of
+    each top-level import and the names of every module imported.
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(path))
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=cwd,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if proc.returncode:
+        error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else ""
+        raise ImportError(error or f"exit status {proc.returncode}")
+    top, names = {}, set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        names.add(name.strip())
+        if not name[1:].startswith(" "):
+            top[name.strip()] = int(cumulative)
+    return top, names
+
+
+def generate_stubs(proto: Path, out_dir: str) -> None:
+    """Generates the gRPC stubs of `proto` into `out_dir` with grpcio-tools"""
+    try:
+        from grpc_tools import protoc
+    except ImportError as e:
+        raise ImportError(f"grpcio-tools is required for the stubs: {e}") from e
+    status = protoc.main(
+        [
+            "grpc_tools.protoc",
+            f"-I{proto.parent}",
+            f"--python_out={out_dir}",
+            f"--grpc_python_out={out_dir}",
+            str(proto),
+        ]
+    )
+    if status != 0:
+        raise RuntimeError(f"protoc exited with {status} for {proto}")
+
+
+def measure(spec: dict, extra_path: list[str], repeat: int) -> dict:
+    """Best-of-`repeat` import time of one entry point in ms"""
+    path = [str(ROOT / "lib"), *extra_path]
+    cwd = ROOT
+    if "app" in spec:
+        cwd = ROOT / "apps" / spec["app"]
+        path.insert(0, str(cwd))
+        code = "import app"
+    else:
+        code = f"import {spec['module']}"
+    with tempfile.TemporaryDirectory() as stubs:
+        if "proto" in spec:
+            generate_stubs(cwd / spec["proto"], stubs)
+            path.append(stubs)
+        # Modules imported by interpreter startup alone are not the entry point's
+        startup, _ = import_times("pass", cwd, path)
+        best, names = float("inf"), set()
+        for _ in range(repeat):
+            top, names = import_times(code, cwd, path)
+            total = sum(us for name, us in top.items() if name not in startup)
+            best = min(best, total)
+    return {
+        "ms": round(best / 1000, 1),
+        "forbidden": sorted(m for m in spec["forbid"] if m in names),
+    }
+
+
+def main(args: argparse.Namespace) -> int:
+    extra_path = [p for p in args.extra_path.split(os.pathsep) if p]
+    results, failures = {}, []
+    for name, spec in ENTRY_POINTS.items():
+        if args.only and name not in args.only:
+            continue
+        budget = round(spec["budget_ms"] * args.scale, 1)
+        try:
+            result = measure(spec, extra_path, args.repeat)
+        except ImportError as e:
+            print(f"{name:<14} skipped ({e})")
+            results[name] = {"skipped": str(e)}
+            continue
+        result["budget_ms"] = budget
+        results[name] = result
+        verdict = "ok"
+        if result["ms"] > budget:
+            verdict = "OVER BUDGET"
+            failures.append(f"{name} imports in {result['ms']} ms > {budget} ms")
+        if result["forbidden"]:
+            verdict = "FORBIDDEN IMPORTS"
+            failures.append(f"{name} imports {', '.join(result['forbidden'])}")
+        print(
+            f"{name:<14} {result['ms']:>8.1f} ms  budget {budget:>7.1f} ms  {verdict}"
+        )
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2, sort_keys=True))
+    for line in failures:
+        print(f"FAIL {line}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
@@ -0,0 +1,425 @@
+"""
+Load-test harness for server-one, server-two and server-three. Each server is
+started as a subprocess on 127.0.0.1, warmed up and then driven for
+`--duration` seconds by `--concurrency` async clients issuing a weighted mix
+of requests. Throughput, latency percentiles (overall and per operation) and
+the server's RSS are written as JSON so runs can be diffed between commits.
+Nothing leaves the loopback interface and Docker is not needed.
+
+    PYTHONPATH=lib python benchmarks/loadtest.py --server all --duration 10
+    PYTHONPATH=lib python benchmarks/loadtest.py --server server-two \\
+        --mix corr=8,corr_k=1,batch=1 --concurrency 64 --output two.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import psutil
+
+ROOT = Path(__file__).resolve().parents[1]
+APPS = ROOT / "apps"
+SERVERS = ("server-one", "server-two", "server-three")
+# Default request mix of every server as operation -> weight
+MIXES = {
+    "server-one": {"echo": 9, "memory": 1},
+    "server-two": {"corr": 6, "corr_k": 2, "batch": 1, "memory": 1},
+    "server-three": {"echo": 6, "echo_batch": 2, "get_memory": 2},
+}
+# What a failed request or readiness probe raises: refused, reset or timed out
+# connections and malformed responses; gRPC errors are returned as a status
+REQUEST_ERRORS = (OSError, EOFError, ValueError)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Load-test the verse servers")
+    parser.add_argument("--server", choices=(*SERVERS, "all"), default="all")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--warmup", type=float, default=1.0, help="seconds")
+    parser.add_argument(
+        "--mix",
+        help="comma separated op=weight pairs replacing the default mix of a single "
+        "--server, e.g. corr=8,batch=1",
+    )
+    parser.add_argument(
+        "--data-path",
+        default=os.environ.get("DATA_PATH", "/static_data/LD2011_2014.csv"),
+        help="meter CSV loaded by server-two",
+    )
+    parser.add_argument("--batch-size", type=int, default=50, help="IDs per batch op")
+    parser.add_argument("--startup-timeout", type=float, default=300.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--output", default="loadtest.json", help="JSON results, - for stdout"
+    )
+    return parser.parse_args()
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _parse_mix(spec: str | None, default: dict[str, int]) -> dict[str, int]:
+    if not spec:
+        return default
+    mix = {}
+    for pair in spec.split(","):
+        op, _, weight = pair.partition("=")
+        if op not in default:
+            raise SystemExit(f"Unknown op {op!r}, expected one of {sorted(default)}")
+        mix[op] = int(weight or 1)
+    return mix
+
+
+class HttpConnection:
+    """Minimal keep-alive HTTP/1.1 client, cheap enough not to be the bottleneck"""
+
+    def __init__(self, port: int):
+        self.port = port
+        self.reader = self.writer = None
+
+    async def request(self, method: str, path: str, body: bytes = b"") -> int:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(
+                "127.0.0.1", self.port
+            )
+        head = f"{method} {path} HTTP/1.1\r\nHost: 127.0.0.1\r\n"
+        if body:
+            head += "Content-Type: application/json\r\n"
+        head += f"Content-Length: {len(body)}\r\n\r\n"
+        self.writer.write(head.encode() + body)
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionResetError("server closed the connection")
+        status = int(line.split()[1])
+        length = 0
+        while (line := await self.reader.readline()) not in (b"\r\n", b""):
+            name, _, value = line.partition(b":")
+            if name.lower() == b"content-length":
+                length = int(value)
+        await self.reader.readexactly(length)
+        return status
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+class ServerProcess:
+    """A server subprocess on a free loopback port with its RSS tracked"""
+
+    def __init__(self, name: str, args: argparse.Namespace):
+        self.name = name
+        self.args = args
+        self.port = _free_port()
+        self.workdir = None
+        self.proc = None
+
+    def start(self) -> None:
+        env = {
+            **os.environ,
+            "PYTHONPATH": os.pathsep.join(
+                p for p in (str(ROOT / "lib"), os.environ.get("PYTHONPATH")) if p
+            ),
+            "HOST": "127.0.0.1",
+            "PORT": str(self.port),
+            "GRPC_ADDRESS": f"127.0.0.1:{self.port}",
+            "METRICS_PORT": "0",
+            "DATA_PATH": self.args.data_path,
+        }
+        cwd = APPS / self.name
+        if self.name == "server-three":
+            # Generate the stubs the way the Dockerfile does, outside the tree
+            self.workdir = tempfile.mkdtemp(prefix="loadtest-")
+            shutil.copy(cwd / "app.py", self.workdir)
+            shutil.copy(cwd / "service.proto", self.workdir)
+            subprocess.run(
+                [
+                    sys.executable,
+                    "-m",
+                    "grpc_tools.protoc",
+                    "-I.",
+                    "--python_out=.",
+                    "--grpc_python_out=.",
+                    "service.proto",
+                ],
+                cwd=self.workdir,
+                check=True,
+            )
+            cwd = self.workdir
+        self.proc = subprocess.Popen(
+            [sys.executable, "app.py"],
+            cwd=cwd,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+    async def wait_ready(self, probe) -> None:
+        deadline = time.monotonic() + self.args.startup_timeout
+        while True:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f"{self.name} exited with {self.proc.returncode}")
+            try:
+                await probe()
+                return
+            except REQUEST_ERRORS:
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"{self.name} not ready after startup timeout")
+                await asyncio.sleep(0.2)
+
+    def rss_mb(self) -> float:
+        """RSS of the server and any worker processes it forked, in MB"""
+        try:
+            root = psutil.Process(self.proc.pid)
+            procs = [root, *root.children(recursive=True)]
+            return sum(p.memory_info().rss for p in procs) / (1024**2)
+        except psutil.NoSuchProcess:
+            return 0.0
+
+    def stop(self) -> None:
+        if self.proc is not None and self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(10)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+        if self.workdir:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+def _http_ops(server: ServerProcess, args: argparse.Namespace):
+    """Returns (ops, probe, new_connection); ops take their client's connection"""
+    rng = random.Random(args.seed)
+    ops = {"memory": lambda conn: conn.request("GET", "/metrics/memory")}
+    if server.name == "server-one":
+        ops["echo"] = lambda conn: conn.request("GET", "/echo/hello")
+    else:
+        from verse import common
+
+        meters = common.read_meter_cols(args.data_path)
+        ops["corr"] = lambda conn: conn.request("GET", f"/corr/{rng.choice(meters)}")
+        ops["corr_k"] = lambda conn: conn.request(
+            "GET", f"/corr/{rng.choice(meters)}?k=5"
+        )
+
+        def batch(conn):
+            ids = rng.sample(meters, min(args.batch_size, len(meters)))
+            return conn.request("POST", "/corr", json.dumps({"meters": ids}).encode())
+
+        ops["batch"] = batch
+
+    async def probe():
+        conn = HttpConnection(server.port)
+        try:
+            if await conn.request("GET", "/metrics/memory") != 200:
+                raise ConnectionError
+        finally:
+            await conn.close()
+
+    return ops, probe, lambda: HttpConnection(server.port)
+
+
+def _grpc_ops(server: ServerProcess, args: argparse.Namespace):
+    import grpc
+
+    sys.path.insert(0, server.workdir)
+    import service_pb2 as pb
+    import service_pb2_grpc as rpc
+
+    channel = grpc.aio.insecure_channel(f"127.0.0.1:{server.port}")
+    stub = rpc.VerseServiceStub(channel)
+    echo = pb.EchoRequest(msg="hello")
+    batch = pb.EchoBatchRequest(msgs=["hello"] * args.batch_size)
+    mem = pb.MemRequest()
+
+    async def call(method, request):
+        try:
+            await method(request)
+        except grpc.RpcError:
+            return 500
+        return 200
+
+    ops = {
+        "echo": lambda _: call(stub.Echo, echo),
+        "echo_batch": lambda _: call(stub.EchoBatch, batch),
+        "get_memory": lambda _: call(stub.GetMemory, mem),
+    }
+
+    async def probe():
+        await asyncio.wait_for(channel.channel_ready(), 1)
+
+    # Clients share one HTTP/2 channel, as a real gRPC client would
+    return ops, probe, lambda: None
+
+
+async def _client(ops, mix, connection, deadline, rng, samples):
+    names = list(mix)
+    weights = list(mix.values())
+    while time.perf_counter() < deadline:
+        op = rng.choices(names, weights)[0]
+        start = time.perf_counter()
+        try:
+            ok = await ops[op](connection) < 400
+        except REQUEST_ERRORS:
+            ok = False
+            if connection is not None:
+                await connection.close()
+                connection.writer = None
+        samples.append((op, time.perf_counter() - start, ok))
+    if connection is not None:
+        await connection.close()
+
+
+async def _drive(ops, mix, new_connection, seconds, args, seed) -> list[tuple]:
+    samples: list[tuple] = []
+    deadline = time.perf_counter() + seconds
+    await asyncio.gather(
+        *(
+            _client(
+                ops, mix, new_connection(), deadline, random.Random(seed + i), samples
+            )
+            for i in range(args.concurrency)
+        )
+    )
+    return samples
+
+
+def _latency_ms(seconds: np.ndarray) -> dict:
+    if not len(seconds):
+        return {}
+    ms = seconds * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {
+        "p50": round(p50, 3),
+        "p95": round(p95, 3),
+        "p99": round(p99, 3),
+        "mean": round(ms.mean(), 3),
+        "max": round(ms.max(), 3),
+    }
+
+
+def _summarize(samples: list[tuple], elapsed: float) -> dict:
+    ops = np.array([s[0] for s in samples])
+    latency = np.array([s[1] for s in samples])
+    ok = np.array([s[2] for s in samples], dtype=bool)
+    result = {
+        "requests": len(samples),
+        "errors": int((~ok).sum()),
+        "rps": round(len(samples) / elapsed, 1),
+        "latency_ms": _latency_ms(latency[ok]),
+        "ops": {},
+    }
+    for op in sorted(set(ops.tolist())):
+        mask = ops == op
+        result["ops"][op] = {
+            "requests": int(mask.sum()),
+            "errors": int((mask & ~ok).sum()),
+            "rps": round(mask.sum() / elapsed, 1),
+            "latency_ms": _latency_ms(latency[mask & ok]),
+        }
+    return result
+
+
+async def _sample_rss(server: ServerProcess, peak: list[float]):
+    while True:
+        peak[0] = max(peak[0], server.rss_mb())
+        await asyncio.sleep(0.1)
+
+
+async def run_server(name: str, args: argparse.Namespace) -> dict:
+    mix = _parse_mix(args.mix if args.server != "all" else None, MIXES[name])
+    server = ServerProcess(name, args)
+    server.start()
+    try:
+        if name == "server-three":
+            ops, probe, new_connection = _grpc_ops(server, args)
+        else:
+            ops, probe, new_connection = _http_ops(server, args)
+        started = time.perf_counter()
+        await server.wait_ready(probe)
+        startup = time.perf_counter() - started
+        rss_before = server.rss_mb()
+        await _drive(ops, mix, new_connection, args.warmup, args, args.seed)
+        peak = [server.rss_mb()]
+        sampler = asyncio.create_task(_sample_rss(server, peak))
+        started = time.perf_counter()
+        samples = await _drive(
+            ops, mix, new_connection, args.duration, args, args.seed + 1000
+        )
+        elapsed = time.perf_counter() - started
+        sampler.cancel()
+        result = {
+            "server": name,
+            "mix": mix,
+            "startup_s": round(startup, 3),
+            "elapsed_s": round(elapsed, 3),
+            **_summarize(samples, elapsed),
+            "rss_mb": {
+                "before": round(rss_before, 2),
+                "peak": round(peak[0], 2),
+                "after": round(server.rss_mb(), 2),
+            },
+        }
+        print(
+            f"{name:<13} {result['rps']:>9.1f} rps  "
+            f"p50 {result['latency_ms'].get('p50', 0):7.3f} ms  "
+            f"p95 {result['latency_ms'].get('p95', 0):7.3f} ms  "
+            f"p99 {result['latency_ms'].get('p99', 0):7.3f} ms  "
+            f"errors {result['errors']}  rss {result['rss_mb']['peak']:.1f} MB",
+            file=sys.stderr,
+        )
+        return result
+    finally:
+        server.stop()
+
+
+def _git_revision() -> str | None:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=False,
+        )
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+async def main(args: argparse.Namespace) -> dict:
+    names = SERVERS if args.server == "all" else (args.server,)
+    results = [await run_server(name, args) for name in names]
+    return {
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "concurrency": args.concurrency,
+        "duration_s": args.duration,
+        "warmup_s": args.warmup,
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = json.dumps(asyncio.run(main(args)), indent=2, sort_keys=True)
+    if args.output == "-":
+        print(report)
+    else:
+        Path(args.output).write_text(report + "\n")
@@ -0,0 +1,35 @@
+"""
+Compares the per-call cost of reading RSS the old way (a new psutil.Process
+per call) with `get_memory_usage()` served from the background sampler and
+with `max_age=0`, which forces a /proc read on a cached process handle.
+
+    PYTHONPATH=lib python benchmarks/memory_sampling.py
+"""
+
+import os
+import timeit
+
+import psutil
+from verse import common
+
+CALLS = int(os.environ.get("MEMORY_BENCH_CALLS", "20000"))
+
+
+def _uncached() -> float:
+    return psutil.Process().memory_info().rss / (1024**2)
+
+
+def main():
+    common.get_memory_usage()
+    cases = (
+        ("new_process_per_call", _uncached),
+        ("cached", common.get_memory_usage),
+        ("max_age_0", lambda: common.get_memory_usage(max_age=0)),
+    )
+    for name, func in cases:
+        best = min(timeit.repeat(func, number=CALLS, repeat=5)) / CALLS
+        print(f"{name:<22} {best * 1e6:8.3f} us/call")
+
+
+if __name__ == "__main__":
+    main()
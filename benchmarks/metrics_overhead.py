@@ -0,0 +1,106 @@
+"""
+Measures the per-request cost of verse.metrics instrumentation: the ASGI
+middleware around a trivial app and the gRPC interceptor around a trivial
+handler, each against the bare call. Exits non-zero when either overhead
+exceeds METRICS_BUDGET_US microseconds.
+
+    PYTHONPATH=lib python benchmarks/metrics_overhead.py
+"""
+
+import asyncio
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import grpc
+from verse import metrics
+
+BUDGET_US = float(os.environ.get("METRICS_BUDGET_US", "5"))
+REQUESTS = int(os.environ.get("METRICS_BENCH_REQUESTS", "200000"))
+ROUNDS = 5
+
+
+async def _http_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def _send(message):
+    pass
+
+
+async def _receive():
+    return {"type": "http.request"}
+
+
+async def _rpc(request, context):
+    return request
+
+
+class _Context:
+    def code(self):
+        return None
+
+
+async def _per_request_us(call, n: int) -> float:
+    """Best-of-`ROUNDS` mean cost of awaiting `call()` in microseconds"""
+    best = float("inf")
+    for _ in range(ROUNDS):
+        start = time.perf_counter_ns()
+        for _ in range(n):
+            await call()
+        best = min(best, (time.perf_counter_ns() - start) / n / 1000)
+    return best
+
+
+async def main() -> int:
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/echo/hi",
+        "route": SimpleNamespace(path="/echo/{msg}"),
+    }
+    middleware = metrics.MetricsMiddleware(_http_app)
+    bare_http = await _per_request_us(
+        lambda: _http_app(scope, _receive, _send), REQUESTS
+    )
+    http = await _per_request_us(lambda: middleware(scope, _receive, _send), REQUESTS)
+
+    handler = grpc.unary_unary_rpc_method_handler(_rpc)
+
+    async def continuation(details):
+        return handler
+
+    details = SimpleNamespace(method="/demo.v1.VerseService/Echo")
+    interceptor = metrics.grpc_interceptor()
+    context = _Context()
+
+    # grpc.aio runs the interceptor chain on every RPC, so both sides resolve
+    # the handler per call before invoking it
+    async def bare_call():
+        return await (await continuation(details)).unary_unary(b"", context)
+
+    async def intercepted_call():
+        resolved = await interceptor.intercept_service(continuation, details)
+        return await resolved.unary_unary(b"", context)
+
+    bare_rpc = await _per_request_us(bare_call, REQUESTS)
+    rpc = await _per_request_us(intercepted_call, REQUESTS)
+
+    failed = False
+    for name, bare, instrumented in (
+        ("asgi_middleware", bare_http, http),
+        ("grpc_interceptor", bare_rpc, rpc),
+    ):
+        overhead = instrumented - bare
+        failed |= overhead > BUDGET_US
+        print(
+            f"{name:<18} bare {bare:6.2f} us  instrumented {instrumented:6.2f} us  "
+            f"overhead {overhead:5.2f} us (budget {BUDGET_US:g} us)"
+        )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
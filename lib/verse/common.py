@@ -1,27 +1,208 @@
-import numpy as np
-import pandas as pd
+"""
+Process-level helpers shared by the verse apps: memory readings, timing and
+profiling spans, and the structlog logger. Only the standard library and
+psutil are imported here; the numpy/pandas helpers live in `verse.data` and
+are imported on first access through this module (PEP 562), so services that
+only read memory do not pay for importing pandas at startup.
+"""
+
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import tracemalloc
 import psutil
-import structlog
 import time
 
+from contextvars import ContextVar
 from pathlib import Path
 
-logging = structlog.get_logger("BaseStructLogger")
+
+class _LazyLogger:
+    """
+    Stands in for a structlog logger and imports structlog on first use, so
+    importing this module does not import structlog, whose dev console
+    renderer pulls in rich
+    """
+
+    def __init__(self, name: str) -> None:
+        self._name = name
+        self._logger = None
+
+    def __getattr__(self, attr: str):
+        if self._logger is None:
+            import structlog
+
+            self._logger = structlog.get_logger(self._name)
+        return getattr(self._logger, attr)
+
+
+logging = _LazyLogger("BaseStructLogger")
+
+# Names served from `verse.data`, imported the first time one is accessed
+_DATA_NAMES = frozenset(
+    {
+        "CACHE_DIR",
+        "CACHE_VERSION",
+        "load_data",
+        "load_meter_data",
+        "iter_meter_chunks",
+        "meter_binary_paths",
+        "convert_meter_csv",
+        "load_meter_binary",
+        "read_meter_cols",
+        "share_arrays",
+        "attach_arrays",
+        "parallel_apply",
+        "get_meter_cols",
+        "corr",
+        "top_k_neighbors",
+        "corr_blocked",
+        "top_k_row",
+        "daily_prefix_sums",
+        "prefix_sums_current",
+        "window_corr_row",
+        "open_corr_matrix",
+        "corr_stream",
+    }
+)
+
+
+def __getattr__(name: str):
+    if name in _DATA_NAMES:
+        from . import data
+
+        return getattr(data, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | _DATA_NAMES)
+
+
+# Seconds between background RSS samples while a `span` is open
+RSS_SAMPLE_INTERVAL = float(os.environ.get("VERSE_RSS_SAMPLE_INTERVAL", "0.01"))
+# When set, the per-run span summary is written here as JSON at exit
+PROFILE_PATH = os.environ.get("VERSE_PROFILE_PATH")
+# Seconds between background memory samples served by `get_memory_usage`,
+# 0 reads /proc on every call
+MEMORY_SAMPLE_INTERVAL = float(os.environ.get("VERSE_MEMORY_SAMPLE_INTERVAL", "1"))
+# Also sample USS, which walks /proc/<pid>/smaps and is much slower than RSS
+SAMPLE_USS = os.environ.get("VERSE_SAMPLE_USS", "0") == "1"
+
+
+class _MemorySampler:
+    """
+    Refreshes RSS, the highest RSS seen and optionally USS every `interval`
+    seconds on a daemon thread started by the first cached read. The latest
+    reading is a single tuple swapped in whole, so readers never lock.
+    """
+
+    def __init__(self, interval: float, uss: bool):
+        self.interval = interval
+        self.uss = uss
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """Forgets the parent's process handle and thread after a fork"""
+        self.process = psutil.Process()
+        # (time.monotonic(), rss, peak rss, uss or None) in bytes
+        self.sample = None
+        self.thread = None
+
+    def refresh(self) -> tuple:
+        if self.uss:
+            info = self.process.memory_full_info()
+            uss = info.uss
+        else:
+            info = self.process.memory_info()
+            uss = None
+        previous = self.sample
+        peak = info.rss if previous is None else max(info.rss, previous[2])
+        self.sample = sample = (time.monotonic(), info.rss, peak, uss)
+        return sample
+
+    def read(self, max_age: float | None) -> tuple:
+        if max_age is None:
+            # Allow one missed tick so scheduling jitter does not force a read
+            max_age = 2 * self.interval
+        if self.thread is None and self.interval > 0 and max_age > 0:
+            with self.lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(
+                        target=self._run, name="verse-memory-sampler", daemon=True
+                    )
+                    self.thread.start()
+        sample = self.sample
+        if sample is None or time.monotonic() - sample[0] > max_age:
+            sample = self.refresh()
+        return sample
+
+    def _run(self) -> None:
+        while True:
+            self.refresh()
+            time.sleep(self.interval)
+
+
+_memory_sampler = _MemorySampler(MEMORY_SAMPLE_INTERVAL, SAMPLE_USS)
+os.register_at_fork(after_in_child=_memory_sampler.reset)
 
 
-def get_memory_usage() -> float:
-    """Returns the RSS memory usage of the current process in MB."""
-    process = psutil.Process()
-    mem_info = process.memory_info()
-    return mem_info.rss / (1024**2)
+def get_memory_usage(max_age: float | None = None) -> float:
+    """
+    Returns the RSS memory usage of the current process in MB, as last read by
+    the background sampler. A reading older than `max_age` seconds (default
+    two sample intervals) is refreshed first; `max_age=0` always reads /proc.
+    """
+    return _memory_sampler.read(max_age)[1] / (1024**2)
+
+
+def get_memory_stats(max_age: float | None = None) -> dict:
+    """
+    Returns the sampler's RSS, highest sampled RSS and USS (None unless
+    VERSE_SAMPLE_USS=1) in MB with the age of the reading in seconds.
+    """
+    sampled_at, rss, peak, uss = _memory_sampler.read(max_age)
+    return {
+        "rss_mb": rss / (1024**2),
+        "peak_rss_mb": peak / (1024**2),
+        "uss_mb": None if uss is None else uss / (1024**2),
+        "age_s": time.monotonic() - sampled_at,
+    }
+
+
+def get_peak_memory_usage() -> float:
+    """Returns the peak RSS of the current process over its lifetime in MB."""
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere
+    peak = peak / (1024**2) if sys.platform == "darwin" else peak / 1024
+    # The kernel's high-water mark can trail psutil's current RSS slightly
+    return max(peak, get_memory_usage(max_age=0))
 
 
 def profile_memory(func):
-    """This is a function decorator around `get_memory_usage()` to log RSS memory"""
+    """
+    This is a function decorator around `get_memory_usage()` to log RSS memory
+    before the call, after it, the peak sampled during it and the lifetime peak
+    """
 
+    @functools.wraps(func)
     def inner(*args, **kwargs):
-        logging.info("memory_usage_snapshot", mb=float(f"{get_memory_usage():.2f}"))
-        return func(*args, **kwargs)
+        with span(func.__qualname__, log=False) as record:
+            res = func(*args, **kwargs)
+        logging.info(
+            "memory_usage_snapshot",
+            mb=record["rss_before_mb"],
+            mb_after=record["rss_after_mb"],
+            mb_peak=record["rss_peak_mb"],
+            mb_max=round(get_peak_memory_usage(), 2),
+        )
+        return res
 
     return inner
 
@@ -29,29 +210,207 @@ def profile_memory(func):
 def elapsed_time(func):
     """Decorator that logs the elapsed time in human readable format"""
 
+    @functools.wraps(func)
     def inner(*args, **kwargs):
-        start = time.time()
-        res = func(*args, **kwargs)
-        end = time.time()
-        elapsed = end - start
+        with span(func.__qualname__, log=False, memory=False) as record:
+            res = func(*args, **kwargs)
+        elapsed = record["duration_ms"] / 1000
         _mins = int(elapsed // 60)
         _secs = elapsed % 60
-        logging.info("elapsed_time", duration=f"{_mins} mins {_secs:.3f} secs")
+        logging.info(
+            "elapsed_time",
+            duration=f"{_mins} mins {_secs:.3f} secs",
+            function=func.__qualname__,
+        )
         return res
 
     return inner
 
 
-def load_data(path: Path, **kwargs) -> pd.DataFrame:
-    """Loads CSV file as a Pandas Data Frame"""
-    return pd.read_csv(path, **kwargs)
+_span_path: ContextVar[tuple[str, ...]] = ContextVar("verse_span_path", default=())
+# Running totals per span path, so long-lived processes keep constant memory
+_span_totals: dict[str, dict] = {}
+_span_lock = threading.Lock()
+
+
+class _RssSampler:
+    """
+    Background thread that samples RSS every `RSS_SAMPLE_INTERVAL` seconds
+    while at least one span is open and raises the `rss_peak_mb` of each one.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        # Open span records by id(): concurrent spans may hold equal records
+        self.active: dict[int, dict] = {}
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+
+    def add(self, record: dict) -> None:
+        with self.lock:
+            self.active[id(record)] = record
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self._run, name="verse-rss-sampler", daemon=True
+                )
+                self.thread.start()
+        self.wake.set()
+
+    def remove(self, record: dict) -> None:
+        with self.lock:
+            del self.active[id(record)]
+
+    def _run(self) -> None:
+        while True:
+            with self.lock:
+                idle = not self.active
+            if idle:
+                self.wake.wait()
+                self.wake.clear()
+                continue
+            mb = get_memory_usage(max_age=0)
+            with self.lock:
+                for record in self.active.values():
+                    record["rss_peak_mb"] = max(record["rss_peak_mb"], mb)
+            time.sleep(RSS_SAMPLE_INTERVAL)
+
+
+_rss_sampler = _RssSampler()
+os.register_at_fork(after_in_child=_rss_sampler.reset)
+
+
+class span:
+    """
+    Times a block as a nested profiling span, usable as a context manager or a
+    decorator. Records wall time (perf_counter_ns), process CPU time, RSS
+    before/after and the peak sampled on a background thread, plus the top
+    `trace_allocations` tracemalloc allocation sites when non-zero. The record
+    is logged as a structlog "span" event (unless `log=False`) with any extra
+    `fields` and kept for `span_summary`. Nested spans are named by their path,
+    e.g. "main/load". `memory=False` records only the times, skipping the /proc
+    reads and the sampler thread.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        trace_allocations: int = 0,
+        log: bool = True,
+        memory: bool = True,
+        **fields,
+    ):
+        self.name = name
+        self.trace_allocations = trace_allocations
+        self.log = log
+        self.memory = memory
+        self.fields = fields
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def inner(*args, **kwargs):
+            with span(
+                self.name,
+                self.trace_allocations,
+                self.log,
+                self.memory,
+                **self.fields,
+            ):
+                return func(*args, **kwargs)
+
+        return inner
+
+    def __enter__(self) -> dict:
+        path = (*_span_path.get(), self.name)
+        self._token = _span_path.set(path)
+        self.record = {"name": self.name, "path": "/".join(path), **self.fields}
+        if self.memory:
+            rss = get_memory_usage(max_age=0)
+            self.record["rss_before_mb"] = round(rss, 2)
+            self.record["rss_peak_mb"] = rss
+        self._started_tracing = False
+        if self.trace_allocations:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            self._snapshot = tracemalloc.take_snapshot()
+        if self.memory:
+            _rss_sampler.add(self.record)
+        self._cpu = time.process_time_ns()
+        self._start = time.perf_counter_ns()
+        return self.record
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        duration = time.perf_counter_ns() - self._start
+        cpu = time.process_time_ns() - self._cpu
+        _span_path.reset(self._token)
+        record = self.record
+        record["duration_ms"] = round(duration / 1e6, 3)
+        record["cpu_ms"] = round(cpu / 1e6, 3)
+        if self.memory:
+            _rss_sampler.remove(record)
+            rss = get_memory_usage(max_age=0)
+            record["rss_after_mb"] = round(rss, 2)
+            record["rss_peak_mb"] = round(max(record["rss_peak_mb"], rss), 2)
+        if exc_type is not None:
+            record["error"] = exc_type.__name__
+        if self.trace_allocations:
+            stats = tracemalloc.take_snapshot().compare_to(self._snapshot, "lineno")
+            record["top_allocations"] = [
+                f"{stat.traceback[0].filename}:{stat.traceback[0].lineno} "
+                f"{stat.size_diff / 1024:+.1f} KiB"
+                for stat in stats[: self.trace_allocations]
+            ]
+            if self._started_tracing:
+                tracemalloc.stop()
+        with _span_lock:
+            agg = _span_totals.get(record["path"])
+            if agg is None:
+                agg = _span_totals[record["path"]] = {
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "cpu_ms": 0.0,
+                }
+            agg["count"] += 1
+            agg["total_ms"] += record["duration_ms"]
+            agg["max_ms"] = max(agg["max_ms"], record["duration_ms"])
+            agg["cpu_ms"] += record["cpu_ms"]
+            if self.memory:
+                agg["rss_peak_mb"] = max(
+                    agg.get("rss_peak_mb", 0.0), record["rss_peak_mb"]
+                )
+        if self.log:
+            logging.info("span", **record)
+
+
+def span_summary() -> dict:
+    """
+    Aggregates every span recorded in this process by path: call count, total
+    and max wall time, total CPU time and, for spans that read memory, the
+    highest sampled RSS.
+    """
+    with _span_lock:
+        spans = {path: dict(agg) for path, agg in _span_totals.items()}
+    for agg in spans.values():
+        for key in ("total_ms", "max_ms", "cpu_ms"):
+            agg[key] = round(agg[key], 3)
+    return {
+        "pid": os.getpid(),
+        "argv": sys.argv,
+        "rss_max_mb": round(get_peak_memory_usage(), 2),
+        "spans": spans,
+    }
 
 
-def get_meter_cols(df: pd.DataFrame) -> list[str]:
-    """Returns a list of relevant meter series column names for this exercise"""
-    return [col for col in df.columns if col.startswith("MT_")]
+def write_span_summary(path: Path) -> Path:
+    """Writes `span_summary()` to `path` as JSON"""
+    path = Path(path)
+    path.write_text(json.dumps(span_summary(), indent=2))
+    return path
 
 
-def corr(df: pd.DataFrame, selected_cols: list[str]) -> np.ndarray:
-    """Returns the correlation matrix of `df` as an ndarray"""
-    return np.corrcoef(df[selected_cols].values.T)
+if PROFILE_PATH:
+    atexit.register(write_span_summary, PROFILE_PATH)
@@ -0,0 +1,904 @@
+"""
+The numpy/pandas helpers of verse: CSV loading and its cache, the meter
+dataset readers, shared arrays and correlation. They are re-exported lazily
+by `verse.common`, so importing it does not import pandas.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from collections.abc import Callable, Iterator
+from concurrent.futures import Executor, ProcessPoolExecutor
+from itertools import pairwise
+from multiprocessing import shared_memory
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .common import logging
+
+# Directory for `load_data(..., cache=True)` artifacts, defaults to next to the CSV
+CACHE_DIR = os.environ.get("VERSE_CACHE_DIR")
+CACHE_VERSION = 1
+
+
+def load_data(path: Path, cache: bool = False, **kwargs) -> pd.DataFrame:
+    """
+    Loads CSV file as a Pandas Data Frame. With `cache=True` the parsed frame is
+    also kept as a columnar binary cache next to the CSV (see `_write_cache`) and
+    later calls memory-map it instead of re-parsing, until the CSV changes.
+    """
+    if not cache or "chunksize" in kwargs or kwargs.get("iterator"):
+        return pd.read_csv(path, **kwargs)
+    path = Path(path)
+    cache_dir = _cache_dir(path, kwargs)
+    df = _read_cache(path, cache_dir)
+    if df is not None:
+        logging.info("data_cache_hit", source=str(path), cache=str(cache_dir))
+        return df
+    logging.info("data_cache_miss", source=str(path), cache=str(cache_dir))
+    df = pd.read_csv(path, **kwargs)
+    try:
+        _write_cache(path, cache_dir, df)
+    except (OSError, TypeError, ValueError) as e:
+        logging.warning("data_cache_write_failed", cache=str(cache_dir), error=str(e))
+    return df
+
+
+def _cache_dir(path: Path, read_kwargs: dict) -> Path:
+    """Returns the cache directory for `path` parsed with `read_kwargs`"""
+    key = hashlib.sha1(repr(sorted(read_kwargs.items())).encode()).hexdigest()[:12]
+    root = Path(CACHE_DIR) if CACHE_DIR else path.parent
+    return root / f".{path.name}.cache" / key
+
+
+def _file_digest(path: Path) -> str:
+    """Returns the blake2b content hash of the file at `path`"""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        while block := f.read(1 << 20):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _read_cache(path: Path, cache_dir: Path) -> pd.DataFrame | None:
+    """
+    Returns the cached frame for `path` or None when missing or stale. The
+    size and mtime are checked first; only when the mtime differs is the
+    content hash recomputed, so an untouched CSV is never re-read.
+    """
+    try:
+        meta = json.loads((cache_dir / "meta.json").read_text())
+        st = path.stat()
+    except (OSError, ValueError):
+        return None
+    source = meta.get("source", {})
+    if meta.get("version") != CACHE_VERSION or source.get("size") != st.st_size:
+        return None
+    if source.get("mtime_ns") != st.st_mtime_ns:
+        if source.get("digest") != _file_digest(path):
+            return None
+        # Same content with a new mtime (e.g. re-copied), skip the hash next time
+        source["mtime_ns"] = st.st_mtime_ns
+        try:
+            (cache_dir / "meta.json").write_text(json.dumps(meta))
+        except OSError:
+            pass
+    try:
+        return _frame_from_cache(cache_dir, meta)
+    except (OSError, ValueError, KeyError) as e:
+        logging.warning("data_cache_read_failed", cache=str(cache_dir), error=str(e))
+        return None
+
+
+def _frame_from_cache(cache_dir: Path, meta: dict) -> pd.DataFrame:
+    """Rebuilds the frame described by `meta`, memory-mapping numeric blocks"""
+    columns = meta["columns"]
+    position = {c: i for i, c in enumerate(columns)}
+    df = None
+    inserts = []
+    for block in meta["blocks"]:
+        # Blocks are stored column-major so each column is contiguous on disk;
+        # copy-on-write mapping keeps the frame writable without touching the file
+        values = np.load(cache_dir / block["file"], mmap_mode="c")
+        if df is None:
+            df = pd.DataFrame(values.T, columns=block["columns"], copy=False)
+        else:
+            inserts.extend(zip(block["columns"], values))
+    for col in meta["strings"]:
+        data = np.load(cache_dir / col["data"], mmap_mode="r").tobytes()
+        offsets = np.load(cache_dir / col["offsets"])
+        missing = np.load(cache_dir / col["missing"])
+        strings = [data[a:b].decode() for a, b in pairwise(offsets)]
+        for j in np.flatnonzero(missing):
+            strings[j] = np.nan
+        inserts.append((col["column"], pd.array(strings, dtype=col["dtype"])))
+    if df is None:
+        df = pd.DataFrame(index=pd.RangeIndex(meta["rows"]))
+    # Inserting in ascending final position keeps the original column order
+    for name, values in sorted(inserts, key=lambda item: position[item[0]]):
+        df.insert(position[name], name, values)
+    if meta["index"]:
+        df = df.set_index(meta["index"])
+        df.index.names = meta["index_names"]
+    return df
+
+
+def _write_cache(path: Path, cache_dir: Path, df: pd.DataFrame) -> None:
+    """
+    Writes `df` to `cache_dir` as one column-major .npy block per numeric dtype
+    plus utf-8 data/offset pairs for string columns. The directory is written
+    under a temporary name and swapped in, so readers never see a partial cache.
+    Frames with column types we cannot round-trip are not cached.
+    """
+    index, index_names = [], []
+    if not df.index.equals(pd.RangeIndex(len(df))):
+        index_names = list(df.index.names)
+        df = df.reset_index()
+        index = list(df.columns[: len(index_names)])
+    meta = {
+        "version": CACHE_VERSION,
+        "columns": list(df.columns),
+        "rows": len(df),
+        "index": index,
+        "index_names": index_names,
+        "blocks": [],
+        "strings": [],
+    }
+    cache_dir.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(dir=cache_dir.parent, prefix=".tmp-"))
+    try:
+        tmp_dir.chmod(0o755)
+        groups: dict[str, list[str]] = {}
+        for col, dtype in df.dtypes.items():
+            if isinstance(dtype, np.dtype) and dtype.kind in "biufcmM":
+                groups.setdefault(dtype.str, []).append(col)
+            elif dtype == object or pd.api.types.is_string_dtype(dtype):
+                missing = df[col].isna().to_numpy()
+                values = df[col][~missing]
+                if not values.map(type).eq(str).all():
+                    raise TypeError(f"column {col!r} is not all strings")
+                encoded = [b""] * len(missing)
+                for j, v in zip(np.flatnonzero(~missing), values):
+                    encoded[j] = v.encode()
+                offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+                np.cumsum([len(b) for b in encoded], out=offsets[1:])
+                i = len(meta["strings"])
+                data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+                np.save(tmp_dir / f"str_{i}.npy", data)
+                np.save(tmp_dir / f"str_{i}_offsets.npy", offsets)
+                np.save(tmp_dir / f"str_{i}_missing.npy", missing)
+                meta["strings"].append(
+                    {
+                        "column": col,
+                        "dtype": str(dtype),
+                        "data": f"str_{i}.npy",
+                        "offsets": f"str_{i}_offsets.npy",
+                        "missing": f"str_{i}_missing.npy",
+                    }
+                )
+            else:
+                raise TypeError(f"column {col!r} has unsupported dtype {dtype}")
+        # Largest block first so it becomes the zero-copy base of the frame
+        for i, cols in enumerate(sorted(groups.values(), key=len, reverse=True)):
+            block = np.ascontiguousarray(df[cols].to_numpy().T)
+            np.save(tmp_dir / f"block_{i}.npy", block)
+            meta["blocks"].append({"file": f"block_{i}.npy", "columns": cols})
+        st = path.stat()
+        meta["source"] = {
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "digest": _file_digest(path),
+        }
+        (tmp_dir / "meta.json").write_text(json.dumps(meta))
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        os.replace(tmp_dir, cache_dir)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def load_meter_data(
+    path: Path,
+    meter_cols: list[str] | None = None,
+    dtype: type = np.float32,
+    cache: bool = True,
+) -> pd.DataFrame:
+    """
+    Loads the semicolon/comma-decimal meter CSV with the timestamp parsed into
+    a DatetimeIndex and the meter columns as `dtype` (float32 by default, half
+    the float64 pandas infers). Only `meter_cols` are parsed when given,
+    otherwise every `MT_` column. A usable `convert_meter_csv` conversion is
+    read instead of the CSV, without parsing. Logs the frame size and the
+    memory saved against a float64 load.
+    """
+    if _meter_binary_meta(path) is not None:
+        values, timestamps, columns = load_meter_binary(path)
+        if meter_cols is None:
+            meter_cols = columns
+        if meter_cols != columns:
+            pos = {col: i for i, col in enumerate(columns)}
+            values = values[:, [pos[col] for col in meter_cols]]
+        df = pd.DataFrame(
+            np.asarray(values, dtype=dtype),
+            index=pd.DatetimeIndex(np.asarray(timestamps)),
+            columns=meter_cols,
+            copy=True,
+        )
+        _log_meter_data(df, dtype, "binary")
+        return df
+    kwargs = {"delimiter": ";", "decimal": ","}
+    header = pd.read_csv(path, nrows=0, **kwargs)
+    ts_col = header.columns[0]
+    if meter_cols is None:
+        meter_cols = get_meter_cols(header)
+    df = load_data(
+        path,
+        cache=cache,
+        usecols=[ts_col, *meter_cols],
+        index_col=ts_col,
+        parse_dates=True,
+        dtype={col: dtype for col in meter_cols},
+        **kwargs,
+    )
+    df.index.name = None
+    if list(df.columns) != meter_cols:
+        df = df[meter_cols]
+    _log_meter_data(df, dtype, "csv")
+    return df
+
+
+def _log_meter_data(df: pd.DataFrame, dtype: type, source: str) -> None:
+    mb = float(df.memory_usage(index=False).sum()) / (1024**2)
+    float64_mb = df.shape[0] * df.shape[1] * 8 / (1024**2)
+    logging.info(
+        "meter_data_loaded",
+        rows=df.shape[0],
+        meters=df.shape[1],
+        dtype=np.dtype(dtype).name,
+        mb=round(mb, 2),
+        saved_mb=round(float64_mb - mb, 2),
+        source=source,
+    )
+
+
+def iter_meter_chunks(
+    path: Path,
+    chunksize: int = 10_000,
+    meter_cols: list[str] | None = None,
+    dtype: type = np.float32,
+) -> Iterator[np.ndarray]:
+    """
+    Yields the meter columns of the semicolon/comma-decimal meter CSV as
+    (rows, meters) `dtype` blocks of up to `chunksize` rows, skipping the
+    timestamp, so callers can reduce the dataset without holding it in memory.
+    A usable `convert_meter_csv` conversion is sliced instead of parsing the
+    CSV; those blocks are read-only views of the memory map when no column
+    selection or dtype change is needed.
+    """
+    if _meter_binary_meta(path) is not None:
+        values, _, columns = load_meter_binary(path)
+        ix = None
+        if meter_cols is not None and meter_cols != columns:
+            pos = {col: i for i, col in enumerate(columns)}
+            ix = [pos[col] for col in meter_cols]
+        for start in range(0, values.shape[0], chunksize):
+            block = values[start : start + chunksize]
+            if ix is not None:
+                block = block[:, ix]
+            yield block.astype(dtype, copy=False)
+        return
+    kwargs = {"delimiter": ";", "decimal": ","}
+    if meter_cols is None:
+        meter_cols = get_meter_cols(pd.read_csv(path, nrows=0, **kwargs))
+    reader = pd.read_csv(
+        path,
+        usecols=meter_cols,
+        dtype={col: dtype for col in meter_cols},
+        chunksize=chunksize,
+        **kwargs,
+    )
+    for chunk in reader:
+        yield chunk[meter_cols].to_numpy()
+
+
+def meter_binary_paths(path: Path) -> dict[str, Path]:
+    """
+    Returns the `values` (float32 matrix), `timestamps` and `columns` (JSON
+    sidecar) paths `convert_meter_csv` writes next to the meter CSV `path`
+    """
+    path = Path(path)
+    stem = path.with_suffix("")
+    return {
+        "values": stem.with_name(f"{stem.name}.meters.npy"),
+        "timestamps": stem.with_name(f"{stem.name}.timestamps.npy"),
+        "columns": stem.with_name(f"{stem.name}.columns.json"),
+    }
+
+
+def _meter_binary_meta(path: Path) -> dict | None:
+    """
+    Returns the sidecar of the binary conversion of `path` when it can be used
+    instead of the CSV: the CSV is absent (images that ship only the binaries)
+    or has the size and mtime it was converted from.
+    """
+    try:
+        meta = json.loads(meter_binary_paths(path)["columns"].read_text())
+    except (OSError, ValueError):
+        return None
+    try:
+        st = Path(path).stat()
+    except FileNotFoundError:
+        return meta
+    source = meta.get("source", {})
+    if source.get("size") != st.st_size or source.get("mtime_ns") != st.st_mtime_ns:
+        return None
+    return meta
+
+
+def convert_meter_csv(
+    path: Path, chunksize: int = 50_000, force: bool = False
+) -> dict[str, Path]:
+    """
+    Converts the semicolon/comma-decimal meter CSV at `path` into the files of
+    `meter_binary_paths`: every `MT_` column as one (rows, meters) float32 .npy,
+    the timestamps as datetime64[ns] and the column names in a JSON sidecar.
+    The CSV is parsed `chunksize` rows at a time straight into the memory-mapped
+    output. The sidecar is written last and records the source size and mtime,
+    so readers ignore a partial or stale conversion; unless `force` is set a
+    conversion that is still current is kept as is.
+    """
+    path = Path(path)
+    paths = meter_binary_paths(path)
+    if not force and path.exists() and _meter_binary_meta(path) is not None:
+        return paths
+    kwargs = {"delimiter": ";", "decimal": ","}
+    header = pd.read_csv(path, nrows=0, **kwargs)
+    ts_col = header.columns[0]
+    meter_cols = get_meter_cols(header)
+    st = path.stat()
+    # Upper bound on the data rows; blank lines are the only lines pandas skips
+    with open(path, "rb") as f:
+        lines, last = 0, b"\n"
+        while block := f.read(1 << 24):
+            lines += block.count(b"\n")
+            last = block[-1:]
+    rows = max(lines + (last != b"\n") - 1, 0)
+
+    tmp = {name: p.with_name(f".{p.name}.tmp") for name, p in paths.items()}
+    try:
+        values = np.lib.format.open_memmap(
+            tmp["values"], mode="w+", dtype=np.float32, shape=(rows, len(meter_cols))
+        )
+        timestamps = np.empty(rows, dtype="datetime64[ns]")
+        filled = 0
+        reader = pd.read_csv(
+            path,
+            usecols=[ts_col, *meter_cols],
+            dtype={col: np.float32 for col in meter_cols},
+            chunksize=chunksize,
+            **kwargs,
+        )
+        for chunk in reader:
+            n = len(chunk)
+            values[filled : filled + n] = chunk[meter_cols].to_numpy()
+            timestamps[filled : filled + n] = pd.to_datetime(chunk[ts_col]).to_numpy(
+                dtype="datetime64[ns]"
+            )
+            filled += n
+        values.flush()
+        if filled != rows:
+            # Blank lines were counted as rows; rewrite at the parsed length
+            with open(tmp["timestamps"], "wb") as f:
+                np.save(f, values[:filled], allow_pickle=False)
+            os.replace(tmp["timestamps"], tmp["values"])
+        del values
+        with open(tmp["timestamps"], "wb") as f:
+            np.save(f, timestamps[:filled], allow_pickle=False)
+        meta = {
+            "columns": meter_cols,
+            "rows": filled,
+            "dtype": "float32",
+            "source": {"size": st.st_size, "mtime_ns": st.st_mtime_ns},
+        }
+        tmp["columns"].write_text(json.dumps(meta))
+        for name in ("values", "timestamps", "columns"):
+            os.replace(tmp[name], paths[name])
+    finally:
+        for p in tmp.values():
+            p.unlink(missing_ok=True)
+    logging.info(
+        "meter_data_converted",
+        source=str(path),
+        rows=filled,
+        meters=len(meter_cols),
+        mb=round(paths["values"].stat().st_size / (1024**2), 2),
+    )
+    return paths
+
+
+def load_meter_binary(path: Path) -> tuple[np.ndarray, np.ndarray, list[str]]:
+    """
+    Opens the conversion of the meter CSV `path` (see `convert_meter_csv`) as
+    read-only memory maps, raising FileNotFoundError when there is no usable
+    one. Returns the (rows, meters) float32 values, the datetime64[ns]
+    timestamps and the meter column names; pages are only read from disk as
+    they are touched.
+    """
+    meta = _meter_binary_meta(path)
+    if meta is None:
+        raise FileNotFoundError(f"No current binary conversion of {path}")
+    paths = meter_binary_paths(path)
+    values = np.load(paths["values"], mmap_mode="r")
+    timestamps = np.load(paths["timestamps"], mmap_mode="r")
+    return values, timestamps, meta["columns"]
+
+
+def read_meter_cols(path: Path) -> list[str]:
+    """
+    Returns the `MT_` column names of the meter CSV `path`, from its binary
+    conversion's sidecar when that is usable, otherwise from the CSV header
+    """
+    meta = _meter_binary_meta(path)
+    if meta is not None:
+        return meta["columns"]
+    return get_meter_cols(pd.read_csv(path, nrows=0, delimiter=";", decimal=","))
+
+
+def share_arrays(directory: Path, **arrays: np.ndarray) -> Path:
+    """
+    Writes each keyword array to `directory` as `<name>.npy` so other processes
+    can map the same pages with `attach_arrays` instead of holding a copy.
+    Use a RAM-backed directory such as /dev/shm to keep it off disk.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    for name, arr in arrays.items():
+        np.save(directory / f"{name}.npy", np.ascontiguousarray(arr))
+    return directory
+
+
+def attach_arrays(directory: Path) -> dict[str, np.ndarray]:
+    """Returns read-only memory-mapped views of the arrays in `directory`"""
+    return {
+        p.stem: np.load(p, mmap_mode="r") for p in sorted(Path(directory).glob("*.npy"))
+    }
+
+
+def parallel_apply(
+    func: Callable,
+    data: np.ndarray | pd.Series | pd.DataFrame,
+    workers: int | None = None,
+    axis: int = 0,
+    executor: Executor | None = None,
+    initializer: Callable | None = None,
+    initargs: tuple = (),
+) -> list:
+    """
+    Splits `data` into one contiguous partition per worker along `axis`, runs
+    `func(partition)` in a ProcessPoolExecutor and returns the results in
+    partition order. The input is copied once into shared memory and each
+    worker maps its slice instead of receiving a pickled copy. 1-D string data
+    is shared as utf-8 bytes plus offsets and handed to `func` as a StringDType
+    array, with missing values as empty strings. `func` must be picklable and
+    must not return views of its partition. Pass `executor` to reuse a pool
+    across calls, otherwise one is created with `initializer(*initargs)`.
+    """
+    arr = data.to_numpy() if isinstance(data, (pd.Series, pd.DataFrame)) else data
+    arr = np.asarray(arr)
+    workers = workers or getattr(executor, "_max_workers", None) or os.cpu_count()
+    n = arr.shape[axis]
+    if n == 0:
+        return []
+    bounds = np.linspace(0, n, min(workers, n) + 1, dtype=np.int64)
+    text = arr.dtype.kind in "OUT"
+    if text and arr.ndim != 1:
+        raise ValueError("parallel_apply only partitions 1-D string data")
+    buffers = []
+    try:
+        if text:
+            encoded = [v.encode() if isinstance(v, str) else b"" for v in arr]
+            offsets = np.zeros(n + 1, dtype=np.int64)
+            np.cumsum([len(b) for b in encoded], out=offsets[1:])
+            raw = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+            buffers = [_to_shared(raw), _to_shared(offsets)]
+        else:
+            buffers = [_to_shared(arr)]
+        specs = [(shm.name, shape, dtype) for shm, shape, dtype in buffers]
+        pool = executor or ProcessPoolExecutor(
+            max_workers=workers, initializer=initializer, initargs=initargs
+        )
+        try:
+            futures = [
+                pool.submit(_apply_partition, func, specs, text, axis, lo, hi)
+                for lo, hi in zip(bounds[:-1].tolist(), bounds[1:].tolist())
+            ]
+            return [f.result() for f in futures]
+        finally:
+            if executor is None:
+                pool.shutdown()
+    finally:
+        for shm, _, _ in buffers:
+            shm.close()
+            shm.unlink()
+
+
+def _to_shared(arr: np.ndarray) -> tuple[shared_memory.SharedMemory, tuple, str]:
+    """Copies `arr` into a new shared memory block"""
+    shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+    np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+    return shm, arr.shape, arr.dtype.str
+
+
+def _apply_partition(func, specs, text: bool, axis: int, lo: int, hi: int):
+    """Worker side of `parallel_apply`: maps rows lo:hi and applies `func`"""
+    handles = [shared_memory.SharedMemory(name=name) for name, _, _ in specs]
+    try:
+        part = _read_partition(handles, specs, text, axis, lo, hi)
+        result = func(part)
+        if isinstance(result, np.ndarray) and np.may_share_memory(result, part):
+            result = result.copy()
+        del part
+        return result
+    finally:
+        for h in handles:
+            try:
+                h.close()
+            except BufferError:
+                # A failing `func` can leave views alive in its traceback;
+                # the mapping is released when the worker exits
+                pass
+
+
+def _read_partition(handles, specs, text: bool, axis: int, lo: int, hi: int):
+    """Returns rows lo:hi of the shared input, a read-only view when numeric"""
+    views = [
+        np.ndarray(shape, dtype=dtype, buffer=h.buf)
+        for h, (_, shape, dtype) in zip(handles, specs)
+    ]
+    if text:
+        raw, offsets = views
+        start = offsets[lo]
+        chunk = raw[start : offsets[hi]].tobytes()
+        return np.array(
+            [
+                chunk[a - start : b - start].decode()
+                for a, b in zip(offsets[lo:hi], offsets[lo + 1 : hi + 1])
+            ],
+            dtype=np.dtypes.StringDType(),
+        )
+    index = [slice(None)] * views[0].ndim
+    index[axis] = slice(lo, hi)
+    part = views[0][tuple(index)]
+    part.flags.writeable = False
+    return part
+
+
+def get_meter_cols(df: pd.DataFrame) -> list[str]:
+    """Returns a list of relevant meter series column names for this exercise"""
+    return [col for col in df.columns if col.startswith("MT_")]
+
+
+def corr(df: pd.DataFrame, selected_cols: list[str]) -> np.ndarray:
+    """Returns the correlation matrix of `df` as an ndarray"""
+    return np.corrcoef(df[selected_cols].values.T)
+
+
+def top_k_neighbors(
+    mat: np.ndarray,
+    k: int,
+    block_size: int | None = None,
+    rows: np.ndarray | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the `k` most correlated column indices and values for every row of
+    the square matrix `mat` (only `rows` when given), best first. The diagonal
+    and NaN entries are masked to -inf so they are never selected ahead of a
+    real correlation. Rows are scored `block_size` at a time (all at once by
+    default), so a memory-mapped `mat` from `open_corr_matrix` is read one row
+    block at a time.
+    """
+    n = mat.shape[1]
+    rows = np.arange(mat.shape[0]) if rows is None else np.asarray(rows, np.int64)
+    k = min(k, n - 1)
+    if k <= 0:
+        return (
+            np.empty((len(rows), 0), dtype=np.int32),
+            np.empty((len(rows), 0), dtype=mat.dtype),
+        )
+    idx = np.empty((len(rows), k), dtype=np.int32)
+    vals = np.empty((len(rows), k), dtype=mat.dtype)
+    step = block_size or max(len(rows), 1)
+    for start in range(0, len(rows), step):
+        block = rows[start : start + step]
+        # Fancy indexing copies, also out of a read-only memory map
+        scores = np.asarray(mat[block])
+        scores[np.arange(len(block)), block] = -np.inf
+        idx[start : start + step], vals[start : start + step] = _top_k_scores(scores, k)
+    return idx, vals
+
+
+def _top_k_scores(scores: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """Best `k` columns of each row of `scores`, masking NaN in place"""
+    n = scores.shape[1]
+    scores[np.isnan(scores)] = -np.inf
+    part = np.argpartition(scores, n - k, axis=1)[:, n - k :]
+    part_vals = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_vals, axis=1, kind="stable")
+    idx = np.take_along_axis(part, order, axis=1).astype(np.int32)
+    return idx, np.take_along_axis(part_vals, order, axis=1)
+
+
+def top_k_row(row: np.ndarray, k: int, exclude: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    `top_k_neighbors` for a single correlation `row`, such as one from
+    `window_corr_row`, with the meter's own column `exclude` masked
+    """
+    k = min(k, len(row) - 1)
+    if k <= 0:
+        return np.empty(0, dtype=np.int32), np.empty(0, dtype=row.dtype)
+    scores = np.array(row)[None, :]
+    scores[0, exclude] = -np.inf
+    idx, vals = _top_k_scores(scores, k)
+    return idx[0], vals[0]
+
+
+def corr_blocked(
+    values: np.ndarray,
+    path: Path,
+    block_size: int = 1024,
+    chunksize: int | None = None,
+    dtype: type = np.float32,
+) -> Path:
+    """
+    Writes the correlation matrix of the columns of `values` (rows, meters),
+    typically the memory map of `load_meter_binary`, to `path` as an (n, n)
+    `dtype` .npy without holding the matrix in memory. A first pass over
+    `chunksize` rows at a time (default `block_size`) gathers the column means
+    and standard deviations. Each stripe of `block_size` columns is then
+    correlated with itself and every later column in one more pass, written to
+    the memory-mapped output and mirrored below the diagonal. Peak memory is
+    about a `block_size` x n float64 stripe plus a `chunksize` x n chunk,
+    independent of n squared. Read the result with `open_corr_matrix`.
+    """
+    path = Path(path)
+    rows, n = values.shape
+    chunksize = chunksize or block_size
+    count = 0
+    mean = np.zeros(n)
+    m2 = np.zeros(n)
+    for start in range(0, rows, chunksize):
+        chunk = np.asarray(values[start : start + chunksize], dtype=np.float64)
+        n_b = chunk.shape[0]
+        mean_b = chunk.mean(axis=0)
+        m2_b = ((chunk - mean_b) ** 2).sum(axis=0)
+        delta = mean_b - mean
+        total = count + n_b
+        m2 += m2_b + delta**2 * (count * n_b / total)
+        mean += delta * (n_b / total)
+        count = total
+    std = np.sqrt(m2)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.tmp")
+    try:
+        out = np.lib.format.open_memmap(tmp, mode="w+", dtype=dtype, shape=(n, n))
+        for lo in range(0, n, block_size):
+            hi = min(lo + block_size, n)
+            stripe = np.zeros((hi - lo, n - lo))
+            for start in range(0, rows, chunksize):
+                chunk = np.asarray(
+                    values[start : start + chunksize, lo:], dtype=np.float64
+                )
+                chunk -= mean[lo:]
+                stripe += chunk[:, : hi - lo].T @ chunk
+            with np.errstate(divide="ignore", invalid="ignore"):
+                stripe /= std[lo:hi, None]
+                stripe /= std[None, lo:]
+            np.clip(stripe, -1, 1, out=stripe)
+            out[lo:hi, lo:] = stripe
+            out[lo:, lo:hi] = stripe.T
+            out.flush()
+        del out
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+    logging.info(
+        "corr_matrix_written",
+        path=str(path),
+        meters=n,
+        block_size=block_size,
+        mb=round(path.stat().st_size / (1024**2), 2),
+    )
+    return path
+
+
+def open_corr_matrix(path: Path) -> np.ndarray:
+    """
+    Opens a matrix written by `corr_blocked` as a read-only memory map: a row
+    (`mat[i]`) or tile (`mat[r0:r1, c0:c1]`) is read from disk when indexed
+    """
+    return np.load(path, mmap_mode="r")
+
+
+def _source_identity(path: Path) -> dict:
+    """Size and mtime of the meter CSV `path`, or of its binary conversion"""
+    for candidate in (Path(path), meter_binary_paths(path)["values"]):
+        if candidate.exists():
+            st = candidate.stat()
+            return {
+                "path": str(candidate),
+                "size": st.st_size,
+                "mtime_ns": st.st_mtime_ns,
+            }
+    raise FileNotFoundError(f"Neither {path} nor its binary conversion exist")
+
+
+def prefix_sums_current(directory: Path, source: Path) -> bool:
+    """
+    True when `directory` holds `daily_prefix_sums` written from the meter data
+    at `source` as it is now, so they can be attached instead of rebuilt
+    """
+    try:
+        meta = json.loads((Path(directory) / "source.json").read_text())
+        return meta == _source_identity(source)
+    except (OSError, ValueError):
+        return False
+
+
+def daily_prefix_sums(
+    values: np.ndarray,
+    timestamps: np.ndarray,
+    directory: Path,
+    block_size: int | None = None,
+    dtype: type = np.float32,
+    source: Path | None = None,
+) -> Path:
+    """
+    Writes per-day prefix sums of the (rows, meters) `values`, ordered by
+    `timestamps`, to `directory` so the correlation row of any whole-day window
+    takes O(meters) to compute (see `window_corr_row`). Every array has one
+    entry per day plus a leading zero: `count` (rows), float64 `sums` and
+    `squares` (days + 1, n) and `dtype` `cross` (days + 1, n, n) products,
+    plus `days`, the date of each day. Values are shifted by their column means
+    first so differences of large prefix sums stay accurate. float32 `cross`
+    halves the disk use, but its rounding error grows with the prefix, so
+    short windows late in a long history suffer most: about 1e-5 in the
+    correlation after a year of 15-minute readings and 1e-4 after four. Pass
+    float64 when that matters. Days without rows repeat the previous entry.
+
+    `cross` is written through a memory map, one stripe of `block_size` meters
+    (all by default) per pass over `values`, so memory is a `block_size` x n
+    accumulator plus a day of rows; disk use is days x n x n x itemsize. With
+    `source`, the meter data's size and mtime are recorded for
+    `prefix_sums_current`. Read the result back with `attach_arrays`.
+    """
+    directory = Path(directory)
+    rows, n = values.shape
+    day_of_row = np.asarray(timestamps).astype("datetime64[D]")
+    if rows == 0 or np.any(day_of_row[1:] < day_of_row[:-1]):
+        raise ValueError("timestamps must be non-empty and sorted")
+    first = day_of_row[0]
+    n_days = int((day_of_row[-1] - first).astype(np.int64)) + 1
+    bounds = np.searchsorted(
+        (day_of_row - first).astype(np.int64), np.arange(n_days + 1)
+    )
+    shift = np.asarray(values).mean(axis=0, dtype=np.float64)
+    block_size = block_size or n
+
+    directory.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(dir=directory.parent, prefix=".tmp-"))
+    try:
+        count = np.zeros(n_days + 1, dtype=np.int64)
+        sums = np.zeros((n_days + 1, n))
+        squares = np.zeros((n_days + 1, n))
+        cross = np.lib.format.open_memmap(
+            tmp_dir / "cross.npy", mode="w+", dtype=dtype, shape=(n_days + 1, n, n)
+        )
+        cross[0] = 0
+        for lo in range(0, n, block_size):
+            hi = min(lo + block_size, n)
+            acc = np.zeros((hi - lo, n))
+            for d in range(n_days):
+                block = np.asarray(values[bounds[d] : bounds[d + 1]], dtype=np.float64)
+                block -= shift
+                acc += block[:, lo:hi].T @ block
+                cross[d + 1, lo:hi] = acc
+                squares[d + 1, lo:hi] = acc[:, lo:hi].diagonal()
+                if lo == 0:
+                    count[d + 1] = count[d] + block.shape[0]
+                    sums[d + 1] = sums[d] + block.sum(axis=0)
+            cross.flush()
+        del cross
+        share_arrays(
+            tmp_dir,
+            days=first + np.arange(n_days),
+            count=count,
+            sums=sums,
+            squares=squares,
+        )
+        if source is not None:
+            (tmp_dir / "source.json").write_text(json.dumps(_source_identity(source)))
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(tmp_dir, directory)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    logging.info(
+        "daily_prefix_sums_written",
+        path=str(directory),
+        days=n_days,
+        meters=n,
+        block_size=block_size,
+        mb=round((n_days + 1) * n * n * np.dtype(dtype).itemsize / (1024**2), 2),
+    )
+    return directory
+
+
+# Window variances below this fraction of the window's shifted sum of squares
+# are cancellation error of a constant meter, not signal
+_WINDOW_VAR_RTOL = 1e-9
+
+
+def window_corr_row(
+    prefix: dict[str, np.ndarray], i: int, lo: int, hi: int
+) -> np.ndarray:
+    """
+    Returns the correlation of meter `i` with every meter over days `lo` to
+    `hi` - 1 of the `daily_prefix_sums` arrays `prefix`, reading one row of
+    each prefix array at both ends of the window. Meters that are constant
+    over the window correlate as NaN.
+    """
+    rows = prefix["count"][hi] - prefix["count"][lo]
+    s = prefix["sums"][hi] - prefix["sums"][lo]
+    q = prefix["squares"][hi] - prefix["squares"][lo]
+    xy = prefix["cross"][hi, i] - prefix["cross"][lo, i]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        var = q - s * s / rows
+        var = np.where(var > q * _WINDOW_VAR_RTOL, var, np.nan)
+        c = (xy - s[i] * s / rows) / np.sqrt(var[i] * var)
+    return np.clip(c, -1, 1, out=c)
+
+
+def corr_stream(
+    path: Path, selected_cols: list[str], chunksize: int = 10_000, **kwargs
+) -> np.ndarray:
+    """
+    Returns the correlation matrix of `selected_cols` in the CSV at `path`
+    without loading the whole file. Rows are read `chunksize` at a time and each
+    chunk's mean and centered cross-products are merged into running float64
+    totals (Chan et al. pairwise update), so peak memory depends on the chunk
+    size and the number of columns, not the number of rows. Extra `kwargs` are
+    passed through to `pandas.read_csv`; a usable `convert_meter_csv`
+    conversion of `path` is read instead of the CSV.
+    """
+    m = len(selected_cols)
+    count = 0
+    mean = np.zeros(m)
+    m2 = np.zeros((m, m))
+    if _meter_binary_meta(path) is not None:
+        blocks = iter_meter_chunks(path, chunksize, selected_cols, np.float64)
+    else:
+        blocks = (
+            chunk[selected_cols].to_numpy(dtype=np.float64)
+            for chunk in pd.read_csv(
+                path, usecols=selected_cols, chunksize=chunksize, **kwargs
+            )
+        )
+    for block in blocks:
+        n_b = block.shape[0]
+        if n_b == 0:
+            continue
+        mean_b = block.mean(axis=0)
+        block -= mean_b
+        m2_b = block.T @ block
+        delta = mean_b - mean
+        total = count + n_b
+        m2 += m2_b + np.outer(delta, delta) * (count * n_b / total)
+        mean += delta * (n_b / total)
+        count = total
+    std = np.sqrt(np.diag(m2))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        c = m2 / std[:, None] / std[None, :]
+    return np.clip(c, -1, 1, out=c)
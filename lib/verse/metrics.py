@@ -0,0 +1,364 @@
+import bisect
+import math
+import threading
+import time
+from collections.abc import Callable, Iterable
+from typing import TYPE_CHECKING
+
+from . import common
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+# Content type of the Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Request latency buckets in seconds: 100us doubling up to ~13s
+LATENCY_BUCKETS = tuple(round(0.0001 * 2**i, 7) for i in range(18))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = ",".join(f'{n}="{_escape(str(v))}"' for n, v in zip(names, values))
+    return f"{{{pairs}}}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Metric:
+    """
+    Base class of a labelled metric family. Values are keyed by a tuple of
+    label values given positionally in `labelnames` order, and every update
+    takes a per-family lock that is uncontended on an asyncio event loop.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values: dict[tuple, object] = {}
+        self.lock = threading.Lock()
+        if not self.labelnames and self.kind in ("counter", "gauge"):
+            self.values[()] = 0.0
+
+    def samples(self) -> Iterable[tuple[str, str, float]]:
+        """Yields (name suffix, formatted labels, value) for every sample"""
+        with self.lock:
+            items = list(self.values.items())
+        for labels, value in items:
+            yield "", _format_labels(self.labelnames, labels), value
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {_escape(self.documentation)}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0.0) + amount
+
+
+class Gauge(Metric):
+    """A gauge, read from `function` at render time when one is given"""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple = (),
+        function: Callable[[], float] | None = None,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0.0) - amount
+
+    def set(self, value: float, *labels: str) -> None:
+        with self.lock:
+            self.values[labels] = value
+
+    def samples(self):
+        if self.function is not None:
+            yield "", "", self.function()
+            return
+        yield from super().samples()
+
+
+class Histogram(Metric):
+    """
+    Histogram over fixed `buckets` upper bounds. Observations land in a
+    non-cumulative bucket found by bisection; buckets are only summed into
+    Prometheus' cumulative `le` form when rendered.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple = (),
+        buckets: tuple = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels: str) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(labels)
+            if state is None:
+                state = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][i] += 1
+            state[1] += value
+
+    def samples(self):
+        with self.lock:
+            items = [(k, list(v[0]), v[1]) for k, v in self.values.items()]
+        names = (*self.labelnames, "le")
+        bounds = [*self.buckets, math.inf]
+        for labels, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                le = _format_value(bound)
+                yield "_bucket", _format_labels(names, (*labels, le)), cumulative
+            yield "_sum", _format_labels(self.labelnames, labels), total
+            yield "_count", _format_labels(self.labelnames, labels), cumulative
+
+
+class Registry:
+    """Ordered collection of metric families rendered together"""
+
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Returns every metric in the Prometheus text exposition format"""
+        return "\n".join(m.render() for m in self.metrics.values()) + "\n"
+
+
+REGISTRY = Registry()
+REQUESTS = REGISTRY.register(
+    Counter(
+        "verse_requests_total",
+        "Requests handled, by method, route and response code.",
+        ("method", "route", "code"),
+    )
+)
+LATENCY = REGISTRY.register(
+    Histogram(
+        "verse_request_duration_seconds",
+        "Request latency in seconds, by method and route.",
+        ("method", "route"),
+    )
+)
+IN_FLIGHT = REGISTRY.register(
+    Gauge("verse_requests_in_flight", "Requests currently being handled.")
+)
+RSS = REGISTRY.register(
+    Gauge(
+        "process_resident_memory_bytes",
+        "Resident memory size in bytes.",
+        # The background sampler's reading, so scrapes never read /proc
+        function=lambda: common.get_memory_usage() * 1024**2,
+    )
+)
+
+
+def render() -> str:
+    """Returns the default registry in the Prometheus text exposition format"""
+    return REGISTRY.render()
+
+
+def observe_request(method: str, route: str, code: str, seconds: float) -> None:
+    """Counts one finished request and records its latency"""
+    REQUESTS.inc(method, route, code)
+    LATENCY.observe(seconds, method, route)
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording every HTTP request in the default registry.
+    Requests are labelled by their route template (e.g. "/corr/{meter_id}") so
+    path parameters do not explode the label set; unrouted requests share the
+    "unmatched" route.
+
+        app.add_middleware(metrics.MetricsMiddleware)
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            IN_FLIGHT.dec()
+            # The router stores the matched route in the shared scope dict
+            route = getattr(scope.get("route"), "path", "unmatched")
+            observe_request(scope["method"], route, str(status), elapsed)
+
+
+def grpc_interceptor():
+    """
+    Returns a `grpc.aio.ServerInterceptor` recording every RPC in the default
+    registry with method "GRPC", the full RPC name as the route and the status
+    code name. Response-streaming handlers are expected to be async generators.
+
+        grpc.aio.server(interceptors=[metrics.grpc_interceptor()])
+    """
+    import asyncio
+
+    import grpc
+
+    def _finish(route, context, start, status):
+        elapsed = time.perf_counter() - start
+        IN_FLIGHT.dec()
+        # A code set through the context (abort, set_code) wins
+        code = context.code() or status
+        observe_request("GRPC", route, getattr(code, "name", str(code)), elapsed)
+
+    def _wrap_unary(behavior, route):
+        async def timed(request, context):
+            IN_FLIGHT.inc()
+            start = time.perf_counter()
+            status = grpc.StatusCode.UNKNOWN
+            try:
+                response = await behavior(request, context)
+                status = grpc.StatusCode.OK
+                return response
+            except asyncio.CancelledError:
+                status = grpc.StatusCode.CANCELLED
+                raise
+            finally:
+                _finish(route, context, start, status)
+
+        return timed
+
+    def _wrap_stream(behavior, route):
+        async def timed(request, context):
+            IN_FLIGHT.inc()
+            start = time.perf_counter()
+            status = grpc.StatusCode.UNKNOWN
+            try:
+                async for response in behavior(request, context):
+                    yield response
+                status = grpc.StatusCode.OK
+            except (asyncio.CancelledError, GeneratorExit):
+                # The client went away mid-stream
+                status = grpc.StatusCode.CANCELLED
+                raise
+            finally:
+                _finish(route, context, start, status)
+
+        return timed
+
+    wrappers = {
+        "unary_unary": (_wrap_unary, grpc.unary_unary_rpc_method_handler),
+        "stream_unary": (_wrap_unary, grpc.stream_unary_rpc_method_handler),
+        "unary_stream": (_wrap_stream, grpc.unary_stream_rpc_method_handler),
+        "stream_stream": (_wrap_stream, grpc.stream_stream_rpc_method_handler),
+    }
+
+    class MetricsInterceptor(grpc.aio.ServerInterceptor):
+        def __init__(self):
+            # method -> (handler from the continuation, wrapped handler), so
+            # each RPC only pays for the wrapping once per method
+            self._wrapped = {}
+
+        async def intercept_service(self, continuation, handler_call_details):
+            handler = await continuation(handler_call_details)
+            if handler is None:
+                return None
+            method = handler_call_details.method
+            cached = self._wrapped.get(method)
+            if cached is not None and cached[0] is handler:
+                return cached[1]
+            wrapped = handler
+            for kind, (wrap, make_handler) in wrappers.items():
+                behavior = getattr(handler, kind)
+                if behavior is not None:
+                    wrapped = make_handler(
+                        wrap(behavior, method),
+                        request_deserializer=handler.request_deserializer,
+                        response_serializer=handler.response_serializer,
+                    )
+                    break
+            self._wrapped[method] = (handler, wrapped)
+            return wrapped
+
+    return MetricsInterceptor()
+
+
+def start_http_server(port: int, host: str = "0.0.0.0") -> "ThreadingHTTPServer":
+    """
+    Serves the default registry at GET /metrics from a daemon thread, for
+    processes such as the gRPC server that have no HTTP app of their own.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(
+        target=server.serve_forever, name="verse-metrics-http", daemon=True
+    ).start()
+    return server
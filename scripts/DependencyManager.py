@@ -1,13 +1,24 @@
+import hashlib
+import json
 import os
 import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
+from math import prod
 from pathlib import Path
 import subprocess
 import tomlkit
 import toml
 from collections import defaultdict
 from packaging.requirements import Requirement
+from packaging.utils import canonicalize_name
+from MetadataIndex import MetadataIndex, parse_requirements
 import logging
 
+logger = logging.getLogger(__name__)
+
 
 class DependencyManager:
     """
@@ -19,8 +30,21 @@ class DependencyManager:
     PYPROJECT_TOML = "pyproject.toml"
     PYPROJECT_TOML_BCK = "pyproject.toml.bck"
     DOCKERFILE = "Dockerfile"
-    DOCKERFILE_TEMP = "Dockerfile.temp"
+    REQUIREMENTS = "requirements.txt"
     APPS = "apps"
+    VERDICT_CACHE = ".dependency_cache.json"
+    # Local wheels/metadata used by the offline pre-check, see MetadataIndex
+    METADATA_INDEX = "wheel_index"
+    # Seconds a verification container runs before its logs are inspected
+    RUN_SETTLE_SECS = 5
+
+    # Verification verdicts, "broken" means it ran but logged errors and
+    # "error" that Docker failed for reasons other than the pins, which is
+    # never cached so the next run verifies the pins again
+    PASSED = "passed"
+    FAILED = "failed"
+    BROKEN = "broken"
+    ERROR = "error"
 
     upgrades = {
         "numpy": ["2.2.1", "2.3.0", "2.3.1"],
@@ -29,11 +53,27 @@ class DependencyManager:
         "structlog": ["24.4.0", "25.1.0", "25.2.0"],
     }
 
-    def __init__(self):
+    def __init__(self, jobs: int = 1, index_dir: Path | None = None):
+        """
+        Args:
+        jobs : Maximum number of Docker verifications run concurrently
+        index_dir : Wheel/metadata directory for the offline pre-check,
+                    defaults to DEPS_INDEX_DIR or <repo>/wheel_index
+        """
+        self.jobs = max(1, jobs)
+        if index_dir is None:
+            index_dir = os.environ.get(
+                "DEPS_INDEX_DIR",
+                Path(self.CURRENT_DIR).resolve().parent / self.METADATA_INDEX,
+            )
+        self.metadata_index = MetadataIndex(Path(index_dir))
+        logger.info(f"Pre-check index holds {len(self.metadata_index)} releases")
+        self.verdict_lock = threading.Lock()
+        self.verdicts = self.load_verdict_cache()
+        self.builds = 0
         self.project_dependencies = self.load_pyproject_deps()
         self.package_updates = None
         if self.project_dependencies:
-            self.inject_base_dependencies()
             self.package_updates = self.find_alignment()
         else:
             print("No Dependencies")
@@ -47,21 +87,66 @@ class DependencyManager:
 
     def find_alignment(self) -> defaultdict:
         """
-        If alignment is possible update the Dockerfile and pyproject.toml
+        Search the joint version space of every package in `upgrades` for the
+        newest combination all apps run with, instead of one package at a time.
+
+        Combinations are walked newest-first. Each new package==version is first
+        verified alone per app (memoized and cached), so one failing version
+        prunes every combination containing it. Only a combination whose
+        members all pass alone is verified jointly, once per app.
         Returns defaultdict of [{numpy: 'new_version'},..]
         """
         dependencies = defaultdict(list)
-        total_apps = self.get_apps_count()
-        for package, version in self.load_pyproject_deps().items():
-            upgrades = self.search_dependencies_alignment(package, version[2:])
-            if len(upgrades.keys()) == total_apps:
-                # Check if the current version is in list
-                if version[2:] in upgrades.values():
+        current = {
+            pkg: spec[2:]
+            for pkg, spec in self.load_pyproject_deps().items()
+            if pkg in self.upgrades and spec[2:] in self.upgrades[pkg]
+        }
+        choices = {
+            pkg: self.upgrades[pkg][self.upgrades[pkg].index(version) :][::-1]
+            for pkg, version in current.items()
+        }
+        apps = self.get_apps()
+        exhaustive = (prod(len(v) for v in choices.values()) - 1) * len(apps)
+        failed: set[tuple[str, str]] = set()
+        failed_joint = 0
+        self.builds = 0
+
+        for combo in product(*choices.values()):
+            pins = {
+                pkg: version
+                for pkg, version in zip(choices, combo)
+                if version != current[pkg]
+            }
+            if not pins:
+                break
+            if any(pin in failed for pin in pins.items()):
+                continue
+            singles = [{pkg: version} for pkg, version in pins.items()]
+            for single, verdicts in zip(singles, self.verify_all(apps, singles)):
+                if any(v != self.PASSED for v in verdicts.values()):
+                    failed.update(single.items())
+            if any(pin in failed for pin in pins.items()):
+                continue
+            if len(pins) > 1:
+                (verdicts,) = self.verify_all(apps, [pins])
+                if any(v != self.PASSED for v in verdicts.values()):
+                    failed_joint += 1
+                    logger.info(f"Joint verification failed for {pins}")
                     continue
-                else:
-                    new_version = list(upgrades.values())[0]
-                    dependencies[package] = new_version
+            dependencies.update(pins)
+            break
+        self.save_verdict_cache()
 
+        logger.info(
+            f"Alignment search ran {self.builds} builds, avoided "
+            f"{exhaustive - self.builds} of {exhaustive} exhaustive builds "
+            f"({len(failed)} failing versions pruned, {failed_joint} joint failures)"
+        )
+        print(
+            f"Alignment search: {self.builds} builds, "
+            f"{exhaustive - self.builds} avoided vs exhaustive search"
+        )
         return dependencies
 
     def remove_file(self, file_path: Path) -> bool:
@@ -73,7 +158,7 @@ class DependencyManager:
             file_path.unlink()
             return True
         except Exception as e:
-            logging.info(f"Unable to remove file {file_path.name}, error {e}")
+            logger.info(f"Unable to remove file {file_path.name}, error {e}")
             return False
 
     def test_pyproject(self) -> bool:
@@ -99,13 +184,13 @@ class DependencyManager:
                 check=True,
             )
         except subprocess.CalledProcessError as e:
-            logging.info("Build base failed with exit code", e)
-            logging.info("Output: ", e.output)
+            logger.info("Build base failed with exit code", e)
+            logger.info("Output: ", e.output)
             self.remove_file(pyproject_path)
             return False
         else:
-            logging.info("Build-base success")
-            logging.info("Output \n", completed.stdout)
+            logger.info("Build-base success")
+            logger.info("Output \n", completed.stdout)
             self.remove_file(pyproject_path_backup)
             return True
 
@@ -138,10 +223,10 @@ class DependencyManager:
 
             proj_file.write_text(tomlkit.dumps(toml_data), encoding="utf-8")
         except (FileNotFoundError, tomlkit.TOMLKitError, OSError, shutil.Error) as e:
-            logging.info(f"Failed to update pyproject.toml: {e}")
+            logger.info(f"Failed to update pyproject.toml: {e}")
             if backup_file.exists():
                 shutil.copy2(backup_file, proj_file)
-                logging.info(f"Restored original from {backup_file}")
+                logger.info(f"Restored original from {backup_file}")
             return []
 
         return updates
@@ -161,79 +246,211 @@ class DependencyManager:
                 count += 1
         return count
 
-    def search_dependencies_alignment(self, package: str, version: str) -> defaultdict:
+    def get_apps(self) -> list[Path]:
         """
-        Given a package check if docker build and docker run succeeds.
-        Args:
-        package : Check possible alignments for package prefix
+        Get the app directories in /apps, named by delimiter "-"
+        Returns: list of Path
         """
-        parent_dir = Path(self.CURRENT_DIR).resolve().parent
-        apps_dir = parent_dir / self.APPS
-        successful = defaultdict(str)
-        for ch in apps_dir.iterdir():
-            if not ch.is_dir():
-                continue
-            directory_content = ch.name.split("-")
-            if len(directory_content) < 1:
-                continue
-            prefix, suffix = directory_content[0], directory_content[1]
-            job_dir = apps_dir / f"{prefix}-{suffix}"
-            dockerfile, dockerfile_temp = (
-                job_dir / self.DOCKERFILE,
-                job_dir / self.DOCKERFILE_TEMP,
-            )
-            orig_text = dockerfile.read_text().splitlines()
-            start_idx = self.upgrades[package].index(version)
-            for candidate in self.upgrades[package][start_idx + 1 :]:
-                # build a temp Dockerfile
-                new_lines = []
-                for ln in orig_text:
-                    if ln.strip().startswith("FROM python-base"):
-                        new_lines.append(ln)
-                        new_lines.extend(
-                            [
-                                f"RUN pip install {package}=={candidate} pytest",
-                            ]
-                        )
-                    else:
-                        new_lines.append(ln)
-                dockerfile_temp.write_text("\n".join(new_lines) + "\n")
-                tag = f"verify-{prefix}-{suffix}-{candidate}"
-                try:
-                    subprocess.run(
-                        ["docker", "build", "-f", str(dockerfile_temp), "-t", tag, "."],
-                        cwd=parent_dir,
-                        check=True,
-                        stdout=subprocess.DEVNULL,
-                    )
-                    container_id = (
-                        subprocess.check_output(
-                            ["docker", "run", "-d", tag], cwd=parent_dir
-                        )
-                        .decode()
-                        .strip()
-                    )
-                    logs = subprocess.check_output(
-                        ["docker", "logs", container_id]
-                    ).decode()
-                    if "Traceback" in logs or "ERROR" in logs:
-                        break
-                    key = f"{prefix}-{suffix}"
-                    successful[key] = candidate
-                    break
-                except subprocess.CalledProcessError:
-                    logging.info(
-                        f"{prefix}-{suffix} failed with {package}=={candidate}"
+        apps_dir = Path(self.CURRENT_DIR).resolve().parent / self.APPS
+        return [
+            ch
+            for ch in sorted(apps_dir.iterdir())
+            if ch.is_dir() and len(ch.name.split("-")) > 1
+        ]
+
+    def verify_all(
+        self, apps: list[Path], pin_sets: list[dict[str, str]]
+    ) -> list[dict[str, str]]:
+        """
+        Verify every app against every set of pins, pre-checking offline first
+        and fanning the remaining Docker verifications out over `self.jobs`.
+        Returns: one {app name: verdict} dict per pin set, in order
+        """
+        results = [{} for _ in pin_sets]
+        pending = []
+        for i, pins in enumerate(pin_sets):
+            for app_dir in apps:
+                reasons = self.precheck_pins(app_dir, pins)
+                if reasons:
+                    logger.info(
+                        f"{app_dir.name} pre-check rejected {self.pin_label(pins)}: "
+                        + "; ".join(reasons)
                     )
-                finally:
-                    dockerfile_temp.unlink(missing_ok=True)
-                    subprocess.run(["docker", "stop", container_id], check=False)
-                    subprocess.run(["docker", "rmi", "-f", tag], check=False)
-            else:
-                logging.info("No changes need to be made")
-                dockerfile_temp.unlink(missing_ok=True)
+                    results[i][app_dir.name] = self.FAILED
+                else:
+                    pending.append((i, app_dir))
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            futures = [
+                (i, app_dir, pool.submit(self.verify_pins, app_dir, pin_sets[i]))
+                for i, app_dir in pending
+            ]
+        for i, app_dir, future in futures:
+            results[i][app_dir.name] = future.result()
+        return results
+
+    def pin_label(self, pins: dict[str, str]) -> str:
+        """Returns: "name==version" pins joined by commas, sorted by name"""
+        return ",".join(f"{pkg}=={version}" for pkg, version in sorted(pins.items()))
+
+    def precheck_pins(self, app_dir: Path, pins: dict[str, str]) -> list[str]:
+        """
+        Offline check of the pins against the base pyproject.toml
+        dependencies and the app's requirements.txt, using the local
+        metadata index instead of a Docker build.
+        Returns: list of conflict reasons, empty if the pins may proceed
+        """
+        targets = {canonicalize_name(pkg) for pkg in pins}
+        base = [
+            Requirement(f"{pkg}{spec}")
+            for pkg, spec in (self.project_dependencies or {}).items()
+            if canonicalize_name(pkg) not in targets
+        ]
+        app_requirements = parse_requirements(app_dir / self.REQUIREMENTS)
+        reasons = []
+        for package, candidate in pins.items():
+            others = [
+                Requirement(f"{pkg}=={version}")
+                for pkg, version in pins.items()
+                if pkg != package
+            ]
+            reasons += self.metadata_index.conflicts(
+                base + others + app_requirements, package, candidate
+            )
+        return reasons
+
+    def verdict_key(self, app_dir: Path, pins: dict[str, str]) -> str:
+        """
+        Cache key of a verification: the app, hashes of its Dockerfile and
+        requirements.txt, the base pyproject.toml hash and the pins.
+        Returns: str
+        """
+
+        def digest(path: Path) -> str:
+            if not path.exists():
+                return "-"
+            return hashlib.sha256(path.read_bytes()).hexdigest()[:16]
+
+        parent_dir = Path(self.CURRENT_DIR).resolve().parent
+        return "|".join(
+            [
+                app_dir.name,
+                digest(app_dir / self.DOCKERFILE),
+                digest(app_dir / self.REQUIREMENTS),
+                digest(parent_dir / self.PYPROJECT_TOML),
+                self.pin_label(pins),
+            ]
+        )
 
-        return successful
+    def load_verdict_cache(self) -> dict[str, str]:
+        """
+        Load previous verification verdicts from the local cache file.
+        Returns: dict of verdict_key -> verdict
+        """
+        cache_file = Path(self.CURRENT_DIR).resolve().parent / self.VERDICT_CACHE
+        try:
+            return json.loads(cache_file.read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def save_verdict_cache(self) -> bool:
+        """
+        Atomically write the verdicts to the local cache file.
+        Returns: boolean
+        """
+        cache_file = Path(self.CURRENT_DIR).resolve().parent / self.VERDICT_CACHE
+        tmp_file = cache_file.with_name(cache_file.name + ".tmp")
+        try:
+            with self.verdict_lock:
+                tmp_file.write_text(json.dumps(self.verdicts, indent=2, sort_keys=True))
+            os.replace(tmp_file, cache_file)
+            return True
+        except OSError as e:
+            logger.info(f"Unable to save verdict cache {cache_file.name}, error {e}")
+            return False
+
+    def verify_pins(self, app_dir: Path, pins: dict[str, str]) -> str:
+        """
+        Verify app_dir with the pins installed, reusing a cached verdict when
+        the app, its requirements and the base are unchanged.
+        Returns: one of PASSED, FAILED, BROKEN, ERROR
+        """
+        key = self.verdict_key(app_dir, pins)
+        with self.verdict_lock:
+            cached = self.verdicts.get(key)
+        if cached is not None:
+            logger.info(f"{app_dir.name} {self.pin_label(pins)} cached: {cached}")
+            return cached
+        verdict = self.docker_verify(app_dir, pins)
+        with self.verdict_lock:
+            if verdict != self.ERROR:
+                self.verdicts[key] = verdict
+            self.builds += 1
+        return verdict
+
+    def docker_verify(self, app_dir: Path, pins: dict[str, str]) -> str:
+        """
+        Build the app image with the pins installed and run it.
+        The pins are installed right before CMD so the base, static data and
+        requirements layers are shared by every candidate build, and the
+        Dockerfile is piped over stdin so concurrent builds never collide.
+        Only a failing pin install step is FAILED, any other Docker failure
+        (daemon, network, base image, run or logs) is ERROR.
+        Returns: one of PASSED, FAILED, BROKEN, ERROR
+        """
+        parent_dir = Path(self.CURRENT_DIR).resolve().parent
+        label = self.pin_label(pins)
+        install = " ".join(f"{pkg}=={version}" for pkg, version in sorted(pins.items()))
+        install_step = f"pip install {install} pytest"
+        new_lines = []
+        for ln in (app_dir / self.DOCKERFILE).read_text().splitlines():
+            if ln.strip().startswith("CMD"):
+                new_lines.append(f"RUN {install_step}")
+            new_lines.append(ln)
+        suffix = hashlib.sha1(label.encode()).hexdigest()[:12]
+        tag = f"verify-{app_dir.name}-{suffix}".lower()
+        container_id = None
+        try:
+            subprocess.run(
+                ["docker", "build", "-f", "-", "-t", tag, "."],
+                input="\n".join(new_lines) + "\n",
+                cwd=parent_dir,
+                check=True,
+                text=True,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+            )
+            container_id = (
+                subprocess.check_output(["docker", "run", "-d", tag], cwd=parent_dir)
+                .decode()
+                .strip()
+            )
+            time.sleep(self.RUN_SETTLE_SECS)
+            logs = subprocess.check_output(
+                ["docker", "logs", container_id], stderr=subprocess.STDOUT
+            ).decode()
+            if "Traceback" in logs or "ERROR" in logs:
+                logger.info(f"{app_dir.name} errored with {label}")
+                return self.BROKEN
+            return self.PASSED
+        except subprocess.CalledProcessError as e:
+            logger.info(f"{app_dir.name} failed with {label}: {e.stderr or e}")
+            # Docker names the failing step, only the install step is the pins'
+            if install_step in (e.stderr or ""):
+                return self.FAILED
+            return self.ERROR
+        finally:
+            if container_id:
+                subprocess.run(
+                    ["docker", "rm", "-f", container_id],
+                    check=False,
+                    stdout=subprocess.DEVNULL,
+                )
+            subprocess.run(
+                ["docker", "rmi", "-f", tag],
+                check=False,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
 
     def load_pyproject_deps(self) -> dict[str, str]:
         """
@@ -252,55 +469,3 @@ class DependencyManager:
                 result[req.name] = str(req.specifier)
             return result
         return None
-
-    def inject_deps_once(self, dockerfile: Path, deps: dict[str, str]) -> bool:
-        """
-        Checks if dependencies have already been injected into the Dockerfile.
-        Args:
-            Dockerfile: Path to the Dockerfile
-            Deps: Dictionary of package dependencies (e.g., {"numpy": "==1.21.0"})
-
-        Returns:
-            bool: True if all dependencies are found, False otherwise
-        """
-        try:
-            text = dockerfile.read_text()
-        except IOError:
-            return False
-        dep_patterns = [f"{pkg}{ver}" for pkg, ver in deps.items()]
-        return all(pattern in text for pattern in dep_patterns)
-
-    def inject_base_dependencies(self) -> bool:
-        """
-        Try pkg==version into each app’s Dockerfile by generating a Dockerfile.temp.
-        Return True if at least one temp-Dockerfile was written.
-        """
-        parent_dir = Path(self.CURRENT_DIR).resolve().parent
-        apps_dir = parent_dir / self.APPS
-        any_injected = False
-        for app_dir in apps_dir.iterdir():
-            if not app_dir.is_dir():
-                continue
-            dockerfile = app_dir / self.DOCKERFILE
-            if not dockerfile.exists():
-                continue
-            if self.inject_deps_once(dockerfile, self.project_dependencies):
-                continue
-
-            lines = dockerfile.read_text().splitlines()
-            new_lines = []
-            injected = False
-
-            for line in lines:
-                new_lines.append(line)
-                if not injected and line.strip().startswith("FROM python-base"):
-                    for pkg, ver in self.project_dependencies.items():
-                        new_lines.append(f"RUN pip install {pkg}=={ver}")
-                    injected = True
-
-            if injected:
-                temp_dockerfile = app_dir / self.DOCKERFILE_TEMP
-                temp_dockerfile.write_text("\n".join(new_lines) + "\n")
-                any_injected = True
-
-        return any_injected
@@ -1,5 +1,13 @@
+import hashlib
+import json
 import os
-import subprocess
+import shutil
+import threading
+import time
+import urllib.error
+import urllib.request
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 
@@ -8,53 +16,271 @@ class DownloadFile:
     Downloads a ZIP file from a URL or directly downloads a CSV file, extracts or renames it,
     and saves the result in a specified static_data directory.
 
+    Downloads are split into byte ranges fetched in parallel into a <name>.part
+    file whose progress is kept in <name>.part.json, so an interrupted run
+    resumes with the missing ranges only. Servers without range support fall
+    back to one streamed request. ZIP members are streamed straight into their
+    destination. Every result is recorded in static_data/SHA256SUMS (the
+    `sha256sum -c` format) and verified against it; a destination that
+    already matches its entry is not downloaded again.
+
     Attributes:
         url (str): The download URL.
-        type (str): The type of download: 'csv' for direct CSV or 'txt' for zipped ZIP-to-CSV.
+        type (str): The type of download: 'csv' for direct CSV or 'zip' for zipped ZIP-to-CSV.
         SCRIPT_DIR (Path): Directory where this script resides.
     """
 
     # Define constants at class level if desired
     SCRIPT_DIR = Path(__file__).resolve().parent
+    STATIC_DATA_DIR = SCRIPT_DIR.parent / "static_data"
+    MANIFEST = "SHA256SUMS"
+    # Member extracted from ZIP downloads, saved with a .csv suffix
+    ZIP_MEMBER = "LD2011_2014.txt"
+    CHUNK_SIZE = 8 * 1024 * 1024
+    RETRIES = 3
+    TIMEOUT_SECS = 60
+
+    # Serializes manifest updates between concurrent downloads
+    _manifest_lock = threading.Lock()
 
-    def __init__(self, url: str, download_type: str) -> None:
+    def __init__(
+        self,
+        url: str,
+        download_type: str,
+        dest_dir: Path | None = None,
+        workers: int = 4,
+        sha256: str | None = None,
+    ) -> None:
         """
         Initialize the downloader with a URL and download type.
 
         Args:
             url (str): The URL to download; either points to a .csv or a .zip.
-            download_type (str): 'csv' to download directly, 'txt' to unzip and rename.
+            download_type (str): 'csv' to download directly, 'zip' to unzip and rename.
+            dest_dir (Path | None): Output directory, defaults to <repo>/static_data.
+            workers (int): Byte ranges downloaded concurrently.
+            sha256 (str | None): Expected digest of the result; takes precedence
+                over the manifest entry.
         """
         self.url = url
         self.type = download_type
+        self.dest_dir = Path(dest_dir) if dest_dir else self.STATIC_DATA_DIR
+        self.workers = max(1, workers)
+        self.sha256 = sha256
+        name = os.path.basename(url.split("?", 1)[0])
+        if download_type == "zip":
+            self.destination = self.dest_dir / f"{Path(self.ZIP_MEMBER).stem}.csv"
+            self.archive = self.dest_dir / name
+        else:
+            self.destination = self.dest_dir / name
+            self.archive = self.destination
 
     def download_file(self) -> bool:
         """
-        Executes the bash helper to perform the download and conversion.
+        Downloads (or resumes) the file, extracts it for 'zip' and verifies it.
         Returns:
             bool: True if the operation succeeded, False otherwise.
         """
         try:
-            # Construct path to the shell script helper
-            script = self.SCRIPT_DIR / "download_static_data.sh"
-            if not script.exists() or not os.access(script, os.X_OK):
-                raise FileNotFoundError(f"Script not found or not executable: {script}")
+            if self.type not in ("csv", "zip"):
+                raise ValueError(
+                    f"Invalid type: {self.type!r} (must be 'csv' or 'zip')"
+                )
+            self.dest_dir.mkdir(parents=True, exist_ok=True)
+            expected = self.sha256 or self.read_manifest().get(self.destination.name)
+            if self.destination.exists() and expected:
+                if self.file_sha256(self.destination) == expected:
+                    print(f"{self.destination.name} is up to date, skipping download")
+                    return True
+                print(
+                    f"{self.destination.name} does not match its checksum, refetching"
+                )
 
-            # Call the helper script with type and URL
-            subprocess.run([str(script), self.type, self.url], check=True)
-            return True
+            if self.type == "csv" or not self.archive.exists():
+                # A complete archive left by a failed extraction is reused
+                self.fetch(self.archive)
+            if self.type == "zip":
+                digest = self.extract_member(self.archive, self.destination)
+                self.archive.unlink()
+            else:
+                digest = self.file_sha256(self.destination)
 
-        except subprocess.CalledProcessError as e:
-            # Log non-zero exit codes
-            print(f"Download script failed with exit code {e.returncode}")
-            return False
+            if expected and digest != expected:
+                self.destination.unlink()
+                raise ValueError(
+                    f"Checksum mismatch for {self.destination.name}: "
+                    f"expected {expected}, got {digest}"
+                )
+            if not expected:
+                print(
+                    f"No expected checksum for {self.destination.name}, "
+                    "trusting this download"
+                )
+            self.update_manifest(self.destination.name, digest)
+            print(f"Saved {self.destination} (sha256 {digest})")
+            return True
 
-        except FileNotFoundError as e:
-            # Handle missing or non-executable script
-            print(f"Error locating download script: {e}")
+        except (OSError, ValueError, zipfile.BadZipFile) as e:
+            # urllib errors are OSErrors; partial progress is kept for a resume
+            print(f"Download of {self.url} failed: {e}")
             return False
 
         except Exception as e:
             # Catch-all for unexpected errors
             print(f"Unexpected error in download_file: {e}")
             return False
+
+    def fetch(self, target: Path) -> None:
+        """
+        Downloads self.url to target through target.part, in parallel ranges
+        when the server reports a size and accepts ranges.
+        """
+        part = target.with_name(target.name + ".part")
+        state_path = target.with_name(target.name + ".part.json")
+        size, etag, ranges = self.probe()
+        if size is None or not ranges:
+            print(f"Downloading {self.url} in a single request...")
+            self.fetch_whole(part)
+            state_path.unlink(missing_ok=True)
+            part.replace(target)
+            return
+
+        identity = {
+            "url": self.url,
+            "size": size,
+            "etag": etag,
+            "chunk_size": self.CHUNK_SIZE,
+        }
+        chunks = range(0, size, self.CHUNK_SIZE)
+        try:
+            state = json.loads(state_path.read_text())
+            done = set(state["done"]) if state["identity"] == identity else set()
+        except (OSError, ValueError, KeyError):
+            done = set()
+        if not part.exists() or part.stat().st_size != size:
+            done = set()
+        todo = [start for start in chunks if start not in done]
+        print(
+            f"Downloading {self.url} ({size / 1024**2:.1f} MB, "
+            f"{len(todo)}/{len(chunks)} chunks, {self.workers} workers)..."
+        )
+        lock = threading.Lock()
+        fd = os.open(part, os.O_RDWR | os.O_CREAT)
+        try:
+            os.ftruncate(fd, size)
+
+            def fetch_chunk(start: int) -> None:
+                end = min(start + self.CHUNK_SIZE, size) - 1
+                data = self.request_range(start, end)
+                os.pwrite(fd, data, start)
+                with lock:
+                    done.add(start)
+                    self.write_json(
+                        state_path, {"identity": identity, "done": sorted(done)}
+                    )
+
+            with ThreadPoolExecutor(self.workers) as pool:
+                # list() re-raises the first failed chunk
+                list(pool.map(fetch_chunk, todo))
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        state_path.unlink(missing_ok=True)
+        part.replace(target)
+
+    def probe(self) -> tuple[int | None, str | None, bool]:
+        """Returns (size, ETag, range support) from a HEAD request"""
+        request = urllib.request.Request(self.url, method="HEAD")
+        try:
+            with urllib.request.urlopen(request, timeout=self.TIMEOUT_SECS) as response:
+                headers = response.headers
+        except urllib.error.HTTPError:
+            # Some hosts reject HEAD; a plain GET still works
+            return None, None, False
+        length = headers.get("Content-Length")
+        ranges = headers.get("Accept-Ranges", "").lower() == "bytes"
+        etag = headers.get("ETag") or headers.get("Last-Modified")
+        return (int(length) if length else None), etag, ranges
+
+    def request_range(self, start: int, end: int) -> bytes:
+        """Returns bytes start..end (inclusive), retrying transient failures"""
+        request = urllib.request.Request(
+            self.url, headers={"Range": f"bytes={start}-{end}"}
+        )
+        for attempt in range(self.RETRIES):
+            try:
+                with urllib.request.urlopen(
+                    request, timeout=self.TIMEOUT_SECS
+                ) as response:
+                    if response.status != 206:
+                        raise ValueError(f"Range request answered {response.status}")
+                    data = response.read()
+                if len(data) != end - start + 1:
+                    raise OSError(f"Short read for bytes {start}-{end}")
+                return data
+            except OSError:
+                if attempt == self.RETRIES - 1:
+                    raise
+                time.sleep(2**attempt)
+
+    def fetch_whole(self, part: Path) -> None:
+        with (
+            urllib.request.urlopen(self.url, timeout=self.TIMEOUT_SECS) as response,
+            open(part, "wb") as f,
+        ):
+            shutil.copyfileobj(response, f, 1024 * 1024)
+
+    def extract_member(self, archive: Path, destination: Path) -> str:
+        """
+        Streams self.ZIP_MEMBER out of archive into destination, hashing it on
+        the way. The member's CRC is checked by zipfile as it is read.
+        Returns:
+            str: sha256 hex digest of the extracted file.
+        """
+        digest = hashlib.sha256()
+        tmp = destination.with_name(destination.name + ".part")
+        with zipfile.ZipFile(archive) as zf:
+            member = next(
+                n for n in zf.namelist() if os.path.basename(n) == self.ZIP_MEMBER
+            )
+            with zf.open(member) as src, open(tmp, "wb") as dst:
+                while block := src.read(1024 * 1024):
+                    digest.update(block)
+                    dst.write(block)
+        tmp.replace(destination)
+        return digest.hexdigest()
+
+    @staticmethod
+    def file_sha256(path: Path) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            while block := f.read(1024 * 1024):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def write_json(path: Path, data: dict) -> None:
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(json.dumps(data))
+        tmp.replace(path)
+
+    def read_manifest(self) -> dict[str, str]:
+        """Returns filename -> sha256 from the static_data manifest"""
+        path = self.dest_dir / self.MANIFEST
+        if not path.exists():
+            return {}
+        entries = {}
+        for line in path.read_text().splitlines():
+            digest, _, name = line.partition("  ")
+            if digest and name:
+                entries[name] = digest
+        return entries
+
+    def update_manifest(self, name: str, digest: str) -> None:
+        with self._manifest_lock:
+            entries = self.read_manifest()
+            entries[name] = digest
+            lines = [f"{d}  {n}\n" for n, d in sorted(entries.items())]
+            tmp = self.dest_dir / (self.MANIFEST + ".tmp")
+            tmp.write_text("".join(lines))
+            tmp.replace(self.dest_dir / self.MANIFEST)
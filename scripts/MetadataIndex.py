@@ -0,0 +1,197 @@
+import logging
+import zipfile
+from collections import defaultdict
+from pathlib import Path
+
+from packaging.metadata import Metadata
+from packaging.requirements import InvalidRequirement, Requirement
+from packaging.utils import canonicalize_name
+from packaging.version import InvalidVersion, Version
+
+logger = logging.getLogger(__name__)
+
+
+class MetadataIndex:
+    """
+    Offline view of package metadata used to pre-check dependency upgrades
+    before paying for a Docker build.
+
+    The index directory holds wheels (*.whl) and/or bare core metadata files
+    (*.metadata, the PEP 658 files served next to wheels, or METADATA files
+    copied out of a *.dist-info). Nothing is fetched from the network.
+
+    Attributes:
+        packages (dict): canonical name -> {Version: Metadata}
+    """
+
+    # Interpreter of the python-base image, used to evaluate markers
+    PYTHON_VERSION = "3.11.9"
+
+    def __init__(self, index_dir: Path | None) -> None:
+        """
+        Load every metadata record found in index_dir.
+
+        Args:
+            index_dir (Path | None): Directory of wheels/metadata files; a
+                missing directory yields an empty index.
+        """
+        self.packages: dict[str, dict[Version, Metadata]] = defaultdict(dict)
+        self.environment = {
+            "python_version": ".".join(self.PYTHON_VERSION.split(".")[:2]),
+            "python_full_version": self.PYTHON_VERSION,
+            "extra": "",
+        }
+        if index_dir is None or not Path(index_dir).is_dir():
+            return
+        for path in sorted(Path(index_dir).iterdir()):
+            meta = self.read_metadata(path)
+            if meta is None:
+                continue
+            try:
+                version = Version(str(meta.version))
+            except InvalidVersion:
+                continue
+            self.packages[canonicalize_name(meta.name)][version] = meta
+
+    def __len__(self) -> int:
+        return sum(len(versions) for versions in self.packages.values())
+
+    def read_metadata(self, path: Path) -> Metadata | None:
+        """
+        Parse core metadata from a wheel or a metadata file.
+        Returns:
+            Metadata or None if the file is not a readable metadata record.
+        """
+        try:
+            if path.suffix == ".whl":
+                with zipfile.ZipFile(path) as whl:
+                    name = next(
+                        n
+                        for n in whl.namelist()
+                        if n.count("/") == 1 and n.endswith(".dist-info/METADATA")
+                    )
+                    raw = whl.read(name)
+            elif path.suffix == ".metadata" or path.name == "METADATA":
+                raw = path.read_bytes()
+            else:
+                return None
+            return Metadata.from_email(raw, validate=False)
+        except (OSError, StopIteration, ValueError, zipfile.BadZipFile) as e:
+            logger.info(f"Skipping unreadable metadata {path.name}: {e}")
+            return None
+
+    def get(self, name: str, version: str) -> Metadata | None:
+        """Return the metadata of name==version if indexed."""
+        try:
+            return self.packages.get(canonicalize_name(name), {}).get(Version(version))
+        except InvalidVersion:
+            return None
+
+    def requires(self, meta: Metadata) -> list[Requirement]:
+        """Return the run-time requirements of meta that apply to python-base."""
+        return [
+            req
+            for req in (meta.requires_dist or [])
+            if req.marker is None or req.marker.evaluate(self.environment)
+        ]
+
+    def conflicts(
+        self, requirements: list[Requirement], package: str, candidate: str
+    ) -> list[str]:
+        """
+        Check package==candidate against a set of app requirements.
+
+        A candidate is rejected when:
+          * an app requirement on the package excludes the candidate,
+          * the candidate declares a Requires-Python excluding python-base,
+          * the candidate requires a version a pinned requirement excludes,
+          * a pinned requirement requires a package version excluding the
+            candidate,
+          * every indexed version of an unpinned requirement excludes the
+            candidate.
+        Packages missing from the index are not held against the candidate;
+        Docker verification remains the final word for them.
+
+        Returns:
+            list[str]: human readable reasons, empty if no conflict was found.
+        """
+        target = canonicalize_name(package)
+        version = Version(candidate)
+        reasons = []
+        pinned: dict[str, Version] = {target: version}
+        for req in requirements:
+            name = canonicalize_name(req.name)
+            if name == target:
+                if not req.specifier.contains(version, prereleases=True):
+                    reasons.append(f"{req} excludes {package}=={candidate}")
+                continue
+            pins = [s.version for s in req.specifier if s.operator in ("==", "===")]
+            if len(pins) == 1 and "*" not in pins[0]:
+                try:
+                    pinned[name] = Version(pins[0])
+                except InvalidVersion:
+                    pass
+
+        meta = self.get(package, candidate)
+        if meta is not None:
+            if meta.requires_python and not meta.requires_python.contains(
+                self.PYTHON_VERSION
+            ):
+                reasons.append(
+                    f"{package}=={candidate} requires Python {meta.requires_python}"
+                )
+            for dep in self.requires(meta):
+                have = pinned.get(canonicalize_name(dep.name))
+                if have is not None and not dep.specifier.contains(
+                    have, prereleases=True
+                ):
+                    reasons.append(
+                        f"{package}=={candidate} requires {dep}, pinned {have}"
+                    )
+
+        for req in requirements:
+            name = canonicalize_name(req.name)
+            if name == target:
+                continue
+            if name in pinned:
+                dep_meta = self.get(name, str(pinned[name]))
+                if dep_meta is not None and not self.accepts(dep_meta, target, version):
+                    reasons.append(f"{req} does not allow {package}=={candidate}")
+                continue
+            indexed = [
+                m
+                for v, m in self.packages.get(name, {}).items()
+                if req.specifier.contains(v, prereleases=False)
+            ]
+            if indexed and not any(self.accepts(m, target, version) for m in indexed):
+                reasons.append(
+                    f"no indexed {req} release allows {package}=={candidate}"
+                )
+        return reasons
+
+    def accepts(self, meta: Metadata, target: str, version: Version) -> bool:
+        """True if meta places no requirement on target that excludes version."""
+        return all(
+            dep.specifier.contains(version, prereleases=True)
+            for dep in self.requires(meta)
+            if canonicalize_name(dep.name) == target
+        )
+
+
+def parse_requirements(path: Path) -> list[Requirement]:
+    """
+    Parse a requirements.txt into Requirements, skipping comments, options
+    (-r, -e, --index-url...) and lines packaging cannot parse.
+    """
+    requirements = []
+    if not path.exists():
+        return requirements
+    for line in path.read_text().splitlines():
+        line = line.split(" #", 1)[0].strip()
+        if not line or line.startswith(("#", "-")):
+            continue
+        try:
+            requirements.append(Requirement(line))
+        except InvalidRequirement:
+            logger.info(f"Skipping unparsable requirement {line!r} in {path}")
+    return requirements
@@ -1,30 +1,64 @@
+import argparse
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from DownloadFile import DownloadFile
 from DependencyManager import DependencyManager
-##from lib.verse import common
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "lib"))
+from verse import common
 
 ENRON_EMAIL_URL = "https://raw.githubusercontent.com/adriancampos1/Enron_Email_Analysis/master/data/enron_emails_1702.csv"
 ELECTRICITY_LOAD_DIAGRAM_URL = (
     "https://archive.ics.uci.edu/static/public/321/electricityloaddiagrams20112014.zip"
 )
+# Expected SHA256 of the saved enron_emails_1702.csv and LD2011_2014.csv (the
+# extracted member, not the ZIP), from `sha256sum` of a trusted copy. Unset, the
+# first download is trusted as is and recorded in static_data/SHA256SUMS.
+ENRON_EMAIL_SHA256 = os.environ.get("ENRON_EMAIL_SHA256")
+ELECTRICITY_LOAD_DIAGRAM_SHA256 = os.environ.get("ELECTRICITY_LOAD_DIAGRAM_SHA256")
 
 
 def download_and_extract():
     """
-    Run download file using Download class
+    Run download file using Download class, fetching both datasets concurrently
+    Return: None
+    """
+    ENRON_STATUS = DownloadFile(ENRON_EMAIL_URL, "csv", sha256=ENRON_EMAIL_SHA256)
+    ELECTRICITY_DIAGRAM = DownloadFile(
+        ELECTRICITY_LOAD_DIAGRAM_URL, "zip", sha256=ELECTRICITY_LOAD_DIAGRAM_SHA256
+    )
+    with ThreadPoolExecutor(2) as pool:
+        enron = pool.submit(ENRON_STATUS.download_file)
+        electricity = pool.submit(ELECTRICITY_DIAGRAM.download_file)
+        print("Enron download", enron.result())
+        electricity_ok = electricity.result()
+        print("Electricity download", electricity_ok)
+    if electricity_ok:
+        convert_meter_data(ELECTRICITY_DIAGRAM.destination)
+
+
+def convert_meter_data(csv_path: Path):
+    """
+    Writes the float32 .npy meter matrix, timestamps and column sidecar next to
+    the meter CSV so the apps can memory-map it instead of parsing the CSV.
+    An up to date conversion is kept.
     Return: None
     """
-    ENRON_STATUS = DownloadFile(ENRON_EMAIL_URL, "csv")
-    print("Enron download", ENRON_STATUS.download_file())
-    ELECTRICITY_DIAGRAM = DownloadFile(ELECTRICITY_LOAD_DIAGRAM_URL, "zip")
-    print("Electricity download", ELECTRICITY_DIAGRAM.download_file())
+    paths = common.convert_meter_csv(csv_path)
+    print("Meter data conversion", ", ".join(p.name for p in paths.values()))
 
 
-def align_python_deps():
+def align_python_deps(jobs: int = 1, index_dir: str | None = None):
     """
     Run update dependencies using DependencyManager class.
+    Args:
+    jobs : Maximum number of concurrent Docker verifications
+    index_dir : Local wheel/metadata directory for the offline pre-check
     Returns: None
     """
-    al = DependencyManager()
+    al = DependencyManager(jobs=jobs, index_dir=index_dir)
     if al.alignment_available():
         possible_updates = al.update_pyproject()
         if not possible_updates:
@@ -36,9 +70,26 @@ def align_python_deps():
         print("No alignment available")
 
 
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="maximum number of concurrent Docker verifications",
+    )
+    parser.add_argument(
+        "--index-dir",
+        default=None,
+        help="local wheel/metadata directory used to pre-check upgrades offline",
+    )
+    return parser.parse_args()
+
+
 def main():
+    args = parse_args()
     download_and_extract()
-    align_python_deps()
+    align_python_deps(jobs=args.jobs, index_dir=args.index_dir)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,237 @@
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+# DependencyManager imports its sibling MetadataIndex as a top-level module
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+from scripts.DependencyManager import DependencyManager
+
+UPGRADES = {
+    "numpy": ["2.2.1", "2.3.0", "2.3.1"],
+    "pandas": ["2.2.3", "2.3.0", "2.3.1"],
+}
+BASE = {"numpy": "==2.2.1", "pandas": "==2.2.3"}
+
+
+class TestDependencyManager(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name)
+        (self.root / "scripts").mkdir()
+        (self.root / "pyproject.toml").write_text('[project]\nname = "test"\n')
+        for name in ("app-a", "app-b"):
+            app_dir = self.root / "apps" / name
+            app_dir.mkdir(parents=True)
+            (app_dir / "Dockerfile").write_text("FROM base\nCMD python app.py\n")
+            (app_dir / "requirements.txt").write_text("")
+        for target, value in (
+            ("CURRENT_DIR", str(self.root / "scripts")),
+            ("upgrades", UPGRADES),
+        ):
+            patcher = mock.patch.object(DependencyManager, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(
+            DependencyManager, "load_pyproject_deps", return_value=dict(BASE)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # (app, package, version) verifying as broken, or hitting a Docker error
+        self.failing: set[tuple[str, str, str]] = set()
+        self.erroring: set[tuple[str, str, str]] = set()
+
+        def verify(manager, app_dir, pins):
+            for pin in pins.items():
+                if (app_dir.name, *pin) in self.erroring:
+                    return DependencyManager.ERROR
+                if (app_dir.name, *pin) in self.failing:
+                    return DependencyManager.BROKEN
+            return DependencyManager.PASSED
+
+        self.real_docker_verify = DependencyManager.docker_verify
+        patcher = mock.patch.object(
+            DependencyManager, "docker_verify", autospec=True, side_effect=verify
+        )
+        self.docker_verify = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def manager(self, failing=()):
+        """
+        Runs the alignment search with Docker verification mocked: a pin set
+        fails in an app when it contains one of the (app, package, version)
+        in `failing`. Returns the manager and the mock, reset beforehand.
+        """
+        self.failing = set(failing)
+        self.docker_verify.reset_mock()
+        manager = DependencyManager(index_dir=self.root / "wheel_index")
+        return manager, self.docker_verify
+
+    def verified(self, docker_verify) -> list[tuple[str, dict]]:
+        return [
+            (call.args[1].name, call.args[2]) for call in docker_verify.call_args_list
+        ]
+
+    def failing_docker(self, command: str, stderr: str | None):
+        """
+        Returns stand-ins for subprocess.run and subprocess.check_output
+        where `docker <command>` fails
+        """
+
+        def run(args, *_, **__):
+            if args[1] == command:
+                raise subprocess.CalledProcessError(1, args, stderr=stderr)
+            return subprocess.CompletedProcess(args, 0, stdout=b"container\n")
+
+        return run, lambda args, **_: run(args).stdout
+
+    def test_newest_first(self):
+        """
+        Test the search verifies the newest versions first, alone and then
+        jointly, and stops at the first combination every app passes
+        """
+        manager, docker_verify = self.manager()
+        self.assertEqual(
+            dict(manager.package_updates), {"numpy": "2.3.1", "pandas": "2.3.1"}
+        )
+        self.assertEqual(
+            self.verified(docker_verify),
+            [
+                ("app-a", {"numpy": "2.3.1"}),
+                ("app-b", {"numpy": "2.3.1"}),
+                ("app-a", {"pandas": "2.3.1"}),
+                ("app-b", {"pandas": "2.3.1"}),
+                ("app-a", {"numpy": "2.3.1", "pandas": "2.3.1"}),
+                ("app-b", {"numpy": "2.3.1", "pandas": "2.3.1"}),
+            ],
+        )
+        self.assertEqual(manager.builds, 6)
+
+    def test_failing_version_is_pruned(self):
+        """
+        Test a version failing alone in one app is never verified again,
+        neither alone nor in any combination
+        """
+        manager, docker_verify = self.manager({("app-b", "numpy", "2.3.1")})
+        self.assertEqual(
+            dict(manager.package_updates), {"numpy": "2.3.0", "pandas": "2.3.1"}
+        )
+        calls = self.verified(docker_verify)
+        self.assertEqual(
+            [pins for _, pins in calls if pins.get("numpy") == "2.3.1"],
+            [{"numpy": "2.3.1"}, {"numpy": "2.3.1"}],
+        )
+        # pandas==2.3.1 alone passed with numpy==2.3.1 and is reused
+        self.assertEqual(calls.count(("app-a", {"pandas": "2.3.1"})), 1)
+        self.assertEqual(manager.builds, 8)
+
+    def test_no_alignment(self):
+        """
+        Test no updates are proposed when every newer version fails somewhere
+        """
+        failing = {
+            ("app-a", pkg, version)
+            for pkg, versions in UPGRADES.items()
+            for version in versions[1:]
+        }
+        manager, docker_verify = self.manager(failing)
+        self.assertFalse(manager.alignment_available())
+        self.assertTrue(all(len(pins) == 1 for _, pins in self.verified(docker_verify)))
+
+    def test_cached_verdicts_skip_docker(self):
+        """
+        Test verdicts are saved and a second run answers every verification
+        from the cache without building
+        """
+        first, _ = self.manager({("app-b", "numpy", "2.3.1")})
+        self.assertTrue((self.root / DependencyManager.VERDICT_CACHE).exists())
+        second, docker_verify = self.manager({("app-b", "numpy", "2.3.1")})
+        docker_verify.assert_not_called()
+        self.assertEqual(second.builds, 0)
+        self.assertEqual(second.package_updates, first.package_updates)
+        # A changed app invalidates only that app's verdicts
+        (self.root / "apps" / "app-b" / "requirements.txt").write_text("psutil\n")
+        third, docker_verify = self.manager({("app-b", "numpy", "2.3.1")})
+        self.assertEqual(third.package_updates, first.package_updates)
+        self.assertEqual({app for app, _ in self.verified(docker_verify)}, {"app-b"})
+
+    def test_docker_errors_not_cached(self):
+        """
+        Test a Docker error fails the version for the run but is not cached,
+        so the next run verifies it again and can take it
+        """
+        self.erroring = {("app-b", "numpy", "2.3.1")}
+        first, _ = self.manager()
+        self.assertEqual(first.package_updates["numpy"], "2.3.0")
+        self.erroring = set()
+        second, docker_verify = self.manager()
+        self.assertEqual(
+            dict(second.package_updates), {"numpy": "2.3.1", "pandas": "2.3.1"}
+        )
+        self.assertEqual(
+            self.verified(docker_verify),
+            [
+                ("app-b", {"numpy": "2.3.1"}),
+                ("app-a", {"numpy": "2.3.1", "pandas": "2.3.1"}),
+                ("app-b", {"numpy": "2.3.1", "pandas": "2.3.1"}),
+            ],
+        )
+
+    def test_docker_verify_verdicts(self):
+        """
+        Test only a failing pin install step is FAILED and any other failing
+        Docker command an ERROR
+        """
+        manager, _ = self.manager()
+        app_dir = self.root / "apps" / "app-a"
+        pins = {"numpy": "2.3.1"}
+        install = 'process "/bin/sh -c pip install numpy==2.3.1 pytest" failed'
+        for command, stderr, verdict in (
+            ("build", install, DependencyManager.FAILED),
+            ("build", "Cannot connect to the Docker daemon", DependencyManager.ERROR),
+            ("build", None, DependencyManager.ERROR),
+            ("run", None, DependencyManager.ERROR),
+        ):
+            run, check_output = self.failing_docker(command, stderr)
+            with (
+                self.subTest(command=command, stderr=stderr),
+                mock.patch("subprocess.run", side_effect=run),
+                mock.patch("subprocess.check_output", side_effect=check_output),
+                mock.patch("time.sleep"),
+            ):
+                self.assertEqual(
+                    self.real_docker_verify(manager, app_dir, pins), verdict
+                )
+
+    def test_verify_all_precheck(self):
+        """
+        Test verify_all rejects a pin set the app requirements exclude without
+        running Docker and verifies the rest per app
+        """
+        manager, docker_verify = self.manager()
+        docker_verify.reset_mock()
+        (self.root / "apps" / "app-a" / "requirements.txt").write_text("numpy<2.3\n")
+        apps = manager.get_apps()
+        results = manager.verify_all(apps, [{"numpy": "2.3.0"}, {"pandas": "2.3.0"}])
+        self.assertEqual(
+            results,
+            [
+                {"app-a": DependencyManager.FAILED, "app-b": DependencyManager.PASSED},
+                {"app-a": DependencyManager.PASSED, "app-b": DependencyManager.PASSED},
+            ],
+        )
+        self.assertEqual(
+            self.verified(docker_verify),
+            [
+                ("app-b", {"numpy": "2.3.0"}),
+                ("app-a", {"pandas": "2.3.0"}),
+                ("app-b", {"pandas": "2.3.0"}),
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,140 @@
+import io
+import json
+import tempfile
+import threading
+import unittest
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import ClassVar
+
+from scripts.DownloadFile import DownloadFile
+
+
+class _RangeHandler(BaseHTTPRequestHandler):
+    """Serves `files` with HEAD and single byte-range GET support"""
+
+    files: ClassVar[dict[str, bytes]] = {}
+    requests: ClassVar[list[tuple[str, str, str | None]]] = []
+    ranges = True
+
+    def do_HEAD(self):
+        self._respond(head=True)
+
+    def do_GET(self):
+        self._respond(head=False)
+
+    def _respond(self, head: bool):
+        body = self.files.get(self.path)
+        self.requests.append((self.command, self.path, self.headers.get("Range")))
+        if body is None:
+            self.send_error(404)
+            return
+        status, start, end = 200, 0, len(body) - 1
+        spec = self.headers.get("Range")
+        if spec and self.ranges:
+            lo, hi = spec.removeprefix("bytes=").split("-")
+            status, start, end = 206, int(lo), min(int(hi), len(body) - 1)
+        self.send_response(status)
+        if self.ranges:
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("ETag", '"v1"')
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(body)}")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        if not head:
+            self.wfile.write(body[start : end + 1])
+
+    def log_message(self, *args):
+        pass
+
+
+class TestDownloadFile(unittest.TestCase):
+    def setUp(self):
+        self.csv = b"".join(b"%d;row %d\n" % (i, i) for i in range(5000))
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("LD2011_2014.txt", self.csv)
+        _RangeHandler.files = {"/data.csv": self.csv, "/data.zip": archive.getvalue()}
+        _RangeHandler.requests = []
+        _RangeHandler.ranges = True
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _RangeHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base = f"http://127.0.0.1:{self.server.server_port}"
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dest = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    def downloader(self, name: str, kind: str, **kwargs) -> DownloadFile:
+        dl = DownloadFile(f"{self.base}/{name}", kind, dest_dir=self.dest, **kwargs)
+        dl.CHUNK_SIZE = 4096
+        return dl
+
+    def range_gets(self) -> list[str]:
+        return [r for c, _, r in _RangeHandler.requests if c == "GET" and r]
+
+    def test_parallel_download_and_skip(self):
+        """
+        Test a ranged parallel download, its manifest entry and that a second
+        run with a matching file does not download again
+        """
+        self.assertTrue(self.downloader("data.csv", "csv").download_file())
+        self.assertEqual((self.dest / "data.csv").read_bytes(), self.csv)
+        self.assertEqual(len(self.range_gets()), -(-len(self.csv) // 4096))
+        self.assertIn("  data.csv", (self.dest / "SHA256SUMS").read_text())
+        self.assertEqual(
+            sorted(p.name for p in self.dest.iterdir()), ["SHA256SUMS", "data.csv"]
+        )
+        _RangeHandler.requests = []
+        self.assertTrue(self.downloader("data.csv", "csv").download_file())
+        self.assertEqual(_RangeHandler.requests, [])
+
+    def test_resume(self):
+        """
+        Test an interrupted download only fetches the chunks it is missing
+        """
+        dl = self.downloader("data.csv", "csv")
+        part = self.dest / "data.csv.part"
+        part.write_bytes(self.csv[:4096] + b"\0" * (len(self.csv) - 4096))
+        identity = {
+            "url": dl.url,
+            "size": len(self.csv),
+            "etag": '"v1"',
+            "chunk_size": 4096,
+        }
+        (self.dest / "data.csv.part.json").write_text(
+            json.dumps({"identity": identity, "done": [0]})
+        )
+        self.assertTrue(dl.download_file())
+        self.assertEqual((self.dest / "data.csv").read_bytes(), self.csv)
+        self.assertNotIn("bytes=0-4095", self.range_gets())
+        self.assertFalse(part.exists())
+
+    def test_zip_and_single_request_fallback(self):
+        """
+        Test the ZIP member is extracted to <member>.csv and the archive
+        removed, using one plain GET when the server has no range support
+        """
+        _RangeHandler.ranges = False
+        self.assertTrue(self.downloader("data.zip", "zip").download_file())
+        self.assertEqual((self.dest / "LD2011_2014.csv").read_bytes(), self.csv)
+        self.assertFalse((self.dest / "data.zip").exists())
+        self.assertEqual(self.range_gets(), [])
+
+    def test_checksum_mismatch(self):
+        """
+        Test a download that does not match the expected digest is rejected
+        """
+        dl = self.downloader("data.csv", "csv", sha256="0" * 64)
+        self.assertFalse(dl.download_file())
+        self.assertFalse((self.dest / "data.csv").exists())
+        self.assertFalse(self.downloader("missing.csv", "csv").download_file())
+
+
+if __name__ == "__main__":
+    unittest.main()
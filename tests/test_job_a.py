@@ -0,0 +1,79 @@
+import importlib.util
+import sys
+import unittest
+from itertools import pairwise
+from pathlib import Path
+
+import numpy as np
+
+import lib.verse
+from lib.verse import common
+
+ROOT = Path(__file__).resolve().parent.parent
+# Documented agreement of streaming_pca with sklearn's svd_solver="full" PCA
+RTOL = 1e-10
+
+
+def setUpModule():
+    """Loads job-a, which needs scikit-learn installed"""
+    global app
+    if importlib.util.find_spec("sklearn") is None:
+        raise unittest.SkipTest("scikit-learn is required")
+    # The app imports `verse` as its image lays it out; serve it lib.verse
+    # without leaving a top-level `verse` shadowing tests/verse
+    aliases = {"verse": lib.verse, "verse.common": common}
+    sys.modules.update(aliases)
+    try:
+        spec = importlib.util.spec_from_file_location(
+            "job_a_app", ROOT / "apps" / "job-a" / "app.py"
+        )
+        app = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(app)
+    finally:
+        for name in aliases:
+            del sys.modules[name]
+
+
+def _fixed_signs(scores: np.ndarray) -> np.ndarray:
+    """Flips each component so its largest absolute score is positive"""
+    peaks = scores[np.abs(scores).argmax(axis=0), np.arange(scores.shape[1])]
+    return scores * np.sign(peaks)
+
+
+class TestStreamingPCA(unittest.TestCase):
+    def test_matches_full_pca(self):
+        """
+        Test chunked streaming_pca matches sklearn's full-SVD PCA of the
+        standardized transposed matrix within the documented tolerance, with
+        uneven chunks and a constant meter
+        """
+        from sklearn.decomposition import PCA
+        from sklearn.preprocessing import StandardScaler
+
+        rng = np.random.default_rng(0)
+        # (timestamps, meters): four latent series of decreasing strength, noise
+        # and a constant meter
+        latent = rng.normal(size=(1000, 4))
+        loadings = rng.normal(size=(4, 30)) * np.array([8.0, 4.0, 2.0, 1.0])[:, None]
+        x = latent @ loadings + rng.normal(scale=0.1, size=(1000, 30))
+        x[:, 7] = 3.0
+        # Uneven chunks, including single-row ones
+        bounds = [0, 1, 129, 130, 512, 997, 1000]
+        for n_components in (1, 2, 5):
+            with self.subTest(n_components=n_components):
+                chunks = (x[lo:hi] for lo, hi in pairwise(bounds))
+                streamed = app.streaming_pca(chunks, n_components)
+                expected = PCA(n_components, svd_solver="full").fit_transform(
+                    StandardScaler().fit_transform(x.T)
+                )
+                self.assertEqual(streamed.shape, (30, n_components))
+                np.testing.assert_allclose(
+                    streamed,
+                    _fixed_signs(expected),
+                    rtol=RTOL,
+                    atol=RTOL * np.abs(expected).max(),
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import importlib.util
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+import lib.verse
+from lib.verse import common
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def setUpModule():
+    """Loads job-b, which needs torch and sentence-transformers installed"""
+    global EmbeddingStore
+    for dependency in ("torch", "sentence_transformers"):
+        if importlib.util.find_spec(dependency) is None:
+            raise unittest.SkipTest(f"{dependency} is required")
+    # The app imports `verse` as its image lays it out; serve it lib.verse
+    # without leaving a top-level `verse` shadowing tests/verse
+    aliases = {"verse": lib.verse, "verse.common": common}
+    sys.modules.update(aliases)
+    try:
+        spec = importlib.util.spec_from_file_location(
+            "job_b_app", ROOT / "apps" / "job-b" / "app.py"
+        )
+        app = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(app)
+    finally:
+        for name in aliases:
+            del sys.modules[name]
+    EmbeddingStore = app.EmbeddingStore
+
+
+class TestEmbeddingStore(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = Path(tmp.name) / "store"
+
+    def store(self, model: str = "model", dim: int = 3):
+        return EmbeddingStore(self.dir, model, dim)
+
+    def keys(self, texts: str) -> list[bytes]:
+        return [EmbeddingStore.key(t) for t in texts]
+
+    def vectors(self, store, texts: str) -> list[list[float]]:
+        return store.vectors()[store.lookup(self.keys(texts))].tolist()
+
+    def test_duplicate_keys_in_batch(self):
+        """Test a key repeated in one batch stores its first row only"""
+        store = self.store()
+        vectors = np.arange(12, dtype=np.float32).reshape(4, 3)
+        store.append(self.keys("abac"), vectors)
+        self.assertEqual(len(store), 3)
+        self.assertEqual(store.lookup(self.keys("abcz")).tolist(), [0, 1, 2, -1])
+        self.assertEqual(
+            self.vectors(store, "abc"), [[0, 1, 2], [3, 4, 5], [9, 10, 11]]
+        )
+        self.assertEqual(store.vectors().shape, (3, 3))
+
+    def test_keys_already_stored(self):
+        """
+        Test appending a stored key keeps its vector and new keys land on the
+        rows after it, also once reopened
+        """
+        store = self.store()
+        store.append(self.keys("ab"), np.array([[1, 1, 1], [2, 2, 2]], np.float32))
+        store.append(self.keys("bc"), np.array([[9, 9, 9], [3, 3, 3]], np.float32))
+        store.append(self.keys("ab"), np.zeros((2, 3), np.float32))
+        expected = [[1, 1, 1], [2, 2, 2], [3, 3, 3]]
+        self.assertEqual(len(store), 3)
+        self.assertEqual(self.vectors(store, "abc"), expected)
+        reopened = self.store()
+        self.assertEqual(reopened.lookup(self.keys("abc")).tolist(), [0, 1, 2])
+        self.assertEqual(self.vectors(reopened, "abc"), expected)
+
+    def test_wiped_on_model_change(self):
+        """Test a different model name or dimension starts an empty store"""
+        self.store().append(self.keys("a"), np.ones((1, 3), np.float32))
+        self.assertEqual(len(self.store()), 1)
+        self.assertEqual(len(self.store(model="other")), 0)
+        self.store(model="other").append(self.keys("a"), np.ones((1, 3), np.float32))
+        store = self.store(model="other", dim=4)
+        self.assertEqual(len(store), 0)
+        self.assertEqual(store.vectors().shape, (0, 4))
+
+    def test_partial_tail_truncated(self):
+        """
+        Test an interrupted append, vectors written without their keys or a
+        torn row, is dropped on open and the store keeps appending after it
+        """
+        store = self.store()
+        store.append(self.keys("ab"), np.array([[1, 1, 1], [2, 2, 2]], np.float32))
+        with open(store.vectors_path, "ab") as f:
+            f.write(np.full((1, 3), 7, np.float32).tobytes() + b"\x00\x01")
+        with open(store.keys_path, "ab") as f:
+            f.write(EmbeddingStore.key("c")[:5])
+        store = self.store()
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store.vectors_path.stat().st_size, 2 * 3 * 4)
+        self.assertEqual(store.keys_path.stat().st_size, 2 * EmbeddingStore.KEY_BYTES)
+        self.assertEqual(store.lookup(self.keys("c")).tolist(), [-1])
+        store.append(self.keys("c"), np.full((1, 3), 3, np.float32))
+        self.assertEqual(
+            self.vectors(self.store(), "abc"), [[1, 1, 1], [2, 2, 2], [3, 3, 3]]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+import argparse
+import importlib.util
+import io
+import sys
+import tempfile
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+import lib.verse
+from lib.verse import common
+
+ROOT = Path(__file__).resolve().parent.parent
+CONTENT = [
+    "Message body\n---- Forwarded by Jeff on 05/01 ----\nEnron, ENRON and enron",
+    np.nan,
+    "",
+    "one line, no keyword",
+    "Ünïcode ✓ " * 20,
+    "enronenron\n\n",
+    None,
+]
+
+
+def setUpModule():
+    """Loads job-c as `job_c_app`"""
+    global app
+    # The app imports `verse` as its image lays it out; serve it lib.verse
+    # without leaving a top-level `verse` shadowing tests/verse
+    aliases = {"verse": lib.verse, "verse.common": common}
+    sys.modules.update(aliases)
+    try:
+        spec = importlib.util.spec_from_file_location(
+            "job_c_app", ROOT / "apps" / "job-c" / "app.py"
+        )
+        app = importlib.util.module_from_spec(spec)
+        # Registered so the pool can pickle text_features by reference
+        sys.modules[spec.name] = app
+        spec.loader.exec_module(app)
+    finally:
+        for name in aliases:
+            del sys.modules[name]
+
+
+class TestJobC(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = Path(tmp.name)
+
+    def test_features(self):
+        """
+        Test the features of a chunk, with missing and empty content counted
+        as an empty email
+        """
+        content = pd.Series(CONTENT, index=range(10, 10 + len(CONTENT)))
+        features = app.process_chunk(content, "Enron")
+        self.assertEqual(features.index.tolist(), content.index.tolist())
+        lengths = [len(c) if isinstance(c, str) else 0 for c in CONTENT]
+        self.assertEqual(features.length.tolist(), lengths)
+        self.assertEqual(features.lines.tolist(), [3, 1, 1, 1, 1, 3, 1])
+        self.assertEqual(features.forwarded_at.tolist(), [18, -1, -1, -1, -1, -1, -1])
+        self.assertEqual(features.keyword_count.tolist(), [3, 0, 0, 0, 0, 2, 0])
+        self.assertEqual(features.preview.iloc[4], CONTENT[4][: app.PREVIEW_CHARS])
+        self.assertEqual(features.preview.iloc[1], "")
+
+    def test_pool_matches_single_process(self):
+        """Test splitting a chunk across a pool gives the single-process result"""
+        content = pd.Series(CONTENT * 3, index=range(5, 5 + 3 * len(CONTENT)))
+        expected = app.process_chunk(content, "enron")
+        with ProcessPoolExecutor(2) as pool:
+            for chunk in (content, content.iloc[:1], content.iloc[4:9]):
+                with self.subTest(rows=len(chunk)):
+                    pd.testing.assert_frame_equal(
+                        app.process_chunk(chunk, "enron", pool),
+                        expected.loc[chunk.index],
+                    )
+
+    def run_main(self, limit: int, chunksize: int, workers: int = 1) -> str:
+        """Runs the job over CONTENT repeated and returns the output CSV text"""
+        data = self.dir / "emails.csv"
+        files = [f"inbox/{i}." for i in range(5 * len(CONTENT))]
+        pd.DataFrame({"file": files, "content": CONTENT * 5}).to_csv(data, index=False)
+        output = self.dir / f"output-{limit}-{chunksize}-{workers}.csv"
+        args = argparse.Namespace(
+            limit=limit,
+            chunksize=chunksize,
+            keyword="enron",
+            workers=workers,
+            output=str(output),
+        )
+        with mock.patch.object(app, "DATA_PATH", str(data)):
+            app.main(args)
+        return output.read_text()
+
+    def test_chunked_output(self):
+        """
+        Test chunked and pooled runs write one header and contiguous ids,
+        honor `limit` and match a single-chunk run
+        """
+        rows = 5 * len(CONTENT)
+        for limit in (0, 11):
+            expected = self.run_main(limit, chunksize=rows)
+            for chunksize, workers in ((4, 1), (1, 1), (4, 2)):
+                with self.subTest(limit=limit, chunksize=chunksize, workers=workers):
+                    text = self.run_main(limit, chunksize, workers)
+                    self.assertEqual(text.count("id,length,"), 1)
+                    written = pd.read_csv(io.StringIO(text))
+                    self.assertEqual(written.id.tolist(), list(range(limit or rows)))
+                    self.assertEqual(text, expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+import tempfile
+import unittest
+import zipfile
+from pathlib import Path
+
+from packaging.requirements import Requirement
+
+from scripts.MetadataIndex import MetadataIndex, parse_requirements
+
+
+def _metadata(name: str, version: str, requires=(), requires_python=None) -> str:
+    lines = ["Metadata-Version: 2.1", f"Name: {name}", f"Version: {version}"]
+    if requires_python:
+        lines.append(f"Requires-Python: {requires_python}")
+    lines += [f"Requires-Dist: {req}" for req in requires]
+    return "\n".join(lines) + "\n"
+
+
+class TestMetadataIndex(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = Path(tmp.name)
+        records = [
+            ("numpy", "2.3.0", (), ">=3.11"),
+            ("numpy", "2.4.0", (), ">=3.12"),
+            ("pandas", "2.3.0", ("numpy>=1.26",), None),
+            ("pandas", "2.3.1", ("numpy>=2.3; python_version >= '3.11'",), None),
+            ("pandas", "2.4.0", ("numpy>=2.4",), None),
+            ("scipy", "1.15.0", ("numpy<2.3",), None),
+            ("scipy", "1.16.0", ("numpy<2.4", "pytest; python_version < '3'"), None),
+        ]
+        for name, version, requires, python in records:
+            path = self.dir / f"{name}-{version}-py3-none-any.whl.metadata"
+            path.write_text(_metadata(name, version, requires, python))
+        with zipfile.ZipFile(
+            self.dir / "structlog-25.1.0-py3-none-any.whl", "w"
+        ) as whl:
+            whl.writestr(
+                "structlog-25.1.0.dist-info/METADATA",
+                _metadata("structlog", "25.1.0", ("typing-extensions",)),
+            )
+        (self.dir / "broken-1.0-py3-none-any.whl").write_bytes(b"not a zip")
+        (self.dir / "README.txt").write_text("ignored")
+        self.index = MetadataIndex(self.dir)
+
+    def conflicts(self, requirements: list[str], package: str, candidate: str):
+        reqs = [Requirement(r) for r in requirements]
+        return self.index.conflicts(reqs, package, candidate)
+
+    def test_load(self):
+        """
+        Test metadata files and wheels are indexed, unreadable wheels and
+        other files skipped, and a missing directory gives an empty index
+        """
+        self.assertEqual(len(self.index), 8)
+        self.assertEqual(
+            [str(r) for r in self.index.requires(self.index.get("scipy", "1.16.0"))],
+            ["numpy<2.4"],
+        )
+        self.assertIsNotNone(self.index.get("Structlog", "25.1.0"))
+        self.assertIsNone(self.index.get("numpy", "not-a-version"))
+        self.assertEqual(len(MetadataIndex(self.dir / "missing")), 0)
+        self.assertEqual(len(MetadataIndex(None)), 0)
+
+    def test_app_requirement_excludes_candidate(self):
+        """Test an app requirement on the package itself rejects the candidate"""
+        reasons = self.conflicts(["numpy<2.3"], "numpy", "2.3.0")
+        self.assertEqual(reasons, ["numpy<2.3 excludes numpy==2.3.0"])
+        self.assertEqual(self.conflicts(["numpy>=2"], "numpy", "2.3.0"), [])
+
+    def test_requires_python(self):
+        """Test a candidate requiring a newer Python than python-base fails"""
+        reasons = self.conflicts([], "numpy", "2.4.0")
+        self.assertEqual(reasons, ["numpy==2.4.0 requires Python >=3.12"])
+
+    def test_candidate_requires_excluded_pin(self):
+        """Test the candidate's own requirement must accept the pinned versions"""
+        reasons = self.conflicts(["numpy==2.2.1"], "pandas", "2.3.1")
+        self.assertEqual(len(reasons), 1)
+        self.assertIn("requires numpy>=2.3", reasons[0])
+        self.assertEqual(self.conflicts(["numpy==2.3.0"], "pandas", "2.3.1"), [])
+
+    def test_pinned_requirement_rejects_candidate(self):
+        """Test a pinned package whose metadata excludes the candidate"""
+        reasons = self.conflicts(["scipy==1.16.0"], "numpy", "2.4.0")
+        self.assertIn("scipy==1.16.0 does not allow numpy==2.4.0", reasons)
+        self.assertEqual(self.conflicts(["scipy==1.16.0"], "numpy", "2.3.0"), [])
+
+    def test_unpinned_requirement(self):
+        """
+        Test an unpinned requirement conflicts only when no indexed release
+        it allows accepts the candidate
+        """
+        reasons = self.conflicts(["scipy>=1.15"], "numpy", "2.3.0")
+        self.assertEqual(reasons, [])
+        reasons = self.conflicts(["scipy<1.16"], "numpy", "2.3.0")
+        self.assertEqual(reasons, ["no indexed scipy<1.16 release allows numpy==2.3.0"])
+
+    def test_unknown_packages_allowed(self):
+        """Test packages missing from the index are not held against a candidate"""
+        self.assertEqual(self.conflicts(["requests==2.0"], "numpy", "2.3.0"), [])
+        self.assertEqual(self.conflicts(["scipy<1.16"], "psutil", "7.0.0"), [])
+
+    def test_parse_requirements(self):
+        """
+        Test comments, options and blank lines are skipped and unparsable
+        lines are dropped instead of raising
+        """
+        path = self.dir / "requirements.txt"
+        path.write_text(
+            "# pinned for the job\n"
+            "-r base.txt\n"
+            "--index-url https://example.invalid/simple\n"
+            "\n"
+            "numpy==2.3.0  # inline comment\n"
+            "pandas>=2.2,<3\n"
+            "not a requirement!!\n"
+            "scipy; python_version >= '3.11'\n"
+        )
+        self.assertEqual(
+            [str(r) for r in parse_requirements(path)],
+            ["numpy==2.3.0", "pandas<3,>=2.2", 'scipy; python_version >= "3.11"'],
+        )
+        self.assertEqual(parse_requirements(self.dir / "missing.txt"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
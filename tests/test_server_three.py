@@ -0,0 +1,160 @@
+import asyncio
+import importlib.util
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+import grpc
+
+import lib.verse
+from lib.verse import common, metrics
+
+ROOT = Path(__file__).resolve().parent.parent
+APP_DIR = ROOT / "apps" / "server-three"
+SERVICE = "/demo.v1.VerseService"
+
+
+def setUpModule():
+    """
+    Generates the gRPC stubs from service.proto into a temporary directory, as
+    the image build does, and loads the app against them
+    """
+    global server, pb, rpc
+    try:
+        from grpc_tools import protoc
+    except ImportError as e:
+        raise unittest.SkipTest(f"grpcio-tools is required: {e}")
+    stubs = tempfile.TemporaryDirectory()
+    unittest.addModuleCleanup(stubs.cleanup)
+    status = protoc.main(
+        [
+            "grpc_tools.protoc",
+            f"-I{APP_DIR}",
+            f"--python_out={stubs.name}",
+            f"--grpc_python_out={stubs.name}",
+            str(APP_DIR / "service.proto"),
+        ]
+    )
+    if status != 0:
+        raise RuntimeError(f"protoc exited with {status}")
+    # The app imports `verse` and the stubs as its image lays them out; serve
+    # it lib.verse without leaving a top-level `verse` shadowing tests/verse
+    aliases = {"verse": lib.verse, "verse.common": common, "verse.metrics": metrics}
+    sys.modules.update(aliases)
+    sys.path.insert(0, stubs.name)
+    try:
+        spec = importlib.util.spec_from_file_location(
+            "server_three_app", APP_DIR / "app.py"
+        )
+        server = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(server)
+    finally:
+        sys.path.remove(stubs.name)
+        for name in aliases:
+            del sys.modules[name]
+    pb, rpc = server.pb, server.rpc
+
+
+class TestServerThree(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = grpc.aio.server(interceptors=[metrics.grpc_interceptor()])
+        rpc.add_VerseServiceServicer_to_server(server.ServerThree(), self.server)
+        port = self.server.add_insecure_port("127.0.0.1:0")
+        await self.server.start()
+        self.channel = grpc.aio.insecure_channel(f"127.0.0.1:{port}")
+        self.stub = rpc.VerseServiceStub(self.channel)
+
+    async def asyncTearDown(self):
+        await self.channel.close()
+        await self.server.stop(None)
+
+    def requests(self, method: str, code: str) -> int:
+        return metrics.REQUESTS.values.get(("GRPC", f"{SERVICE}/{method}", code), 0)
+
+    async def test_echo_batch(self):
+        """Test a batch echoes every message in request order"""
+        msgs = ["a", "", "ü" * 100, "b"]
+        reply = await self.stub.EchoBatch(pb.EchoBatchRequest(msgs=msgs))
+        self.assertEqual(list(reply.msgs), msgs)
+        reply = await self.stub.EchoBatch(pb.EchoBatchRequest())
+        self.assertEqual(list(reply.msgs), [])
+
+    async def test_echo_stream(self):
+        """
+        Test the stream answers every request in order, both for a request
+        iterator and for interleaved writes and reads
+        """
+
+        async def requests():
+            for i in range(50):
+                yield pb.EchoRequest(msg=str(i))
+
+        replies = [r.msg async for r in self.stub.EchoStream(requests())]
+        self.assertEqual(replies, [str(i) for i in range(50)])
+
+        call = self.stub.EchoStream()
+        for msg in ("ping", "pong"):
+            await call.write(pb.EchoRequest(msg=msg))
+            self.assertEqual((await call.read()).msg, msg)
+        await call.done_writing()
+        self.assertIs(await call.read(), grpc.aio.EOF)
+        self.assertEqual(await call.code(), grpc.StatusCode.OK)
+
+    async def test_stream_memory(self):
+        """
+        Test `count` samples arrive at no less than the clamped interval with
+        increasing timestamps
+        """
+        start = time.perf_counter()
+        samples = [
+            s
+            async for s in self.stub.StreamMemory(
+                pb.StreamMemoryRequest(interval_ms=1, count=3)
+            )
+        ]
+        elapsed = time.perf_counter() - start
+        self.assertEqual(len(samples), 3)
+        self.assertTrue(all(s.usage > 0 for s in samples))
+        timestamps = [s.timestamp for s in samples]
+        self.assertEqual(timestamps, sorted(timestamps))
+        self.assertGreaterEqual(elapsed, 2 * server.MIN_STREAM_INTERVAL_MS / 1000)
+
+    async def test_stream_memory_cancel(self):
+        """
+        Test an endless stream stops when the client cancels it and is
+        recorded as cancelled
+        """
+        before = self.requests("StreamMemory", "CANCELLED")
+        call = self.stub.StreamMemory(pb.StreamMemoryRequest(interval_ms=10))
+        for _ in range(3):
+            self.assertGreater((await call.read()).usage, 0)
+        self.assertTrue(call.cancel())
+        with self.assertRaises(asyncio.CancelledError):
+            await call.read()
+        self.assertEqual(await call.code(), grpc.StatusCode.CANCELLED)
+        # The server side observes the cancellation asynchronously
+        for _ in range(100):
+            if self.requests("StreamMemory", "CANCELLED") > before:
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual(self.requests("StreamMemory", "CANCELLED"), before + 1)
+        self.assertEqual(metrics.IN_FLIGHT.values.get((), 0), 0)
+
+    async def test_get_metrics(self):
+        """Test GetMetrics renders the counts the interceptor recorded"""
+        before = self.requests("Echo", "OK")
+        self.assertEqual((await self.stub.Echo(pb.EchoRequest(msg="hi"))).msg, "hi")
+        reply = await self.stub.GetMetrics(pb.MetricsRequest())
+        self.assertEqual(self.requests("Echo", "OK"), before + 1)
+        self.assertIn(
+            f'verse_requests_total{{method="GRPC",route="{SERVICE}/Echo",code="OK"}} '
+            f"{before + 1}",
+            reply.text,
+        )
+        self.assertIn("process_resident_memory_bytes", reply.text)
+
+
+if __name__ == "__main__":
+    unittest.main()
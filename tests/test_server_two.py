@@ -0,0 +1,218 @@
+import importlib.util
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+import lib.verse
+from lib.verse import common, metrics  # noqa: F401  (bound on the package for the app)
+
+ROOT = Path(__file__).resolve().parent.parent
+# The app imports `verse` as its image lays it out; serve it lib.verse while it
+# loads, without leaving a top-level `verse` that shadows tests/verse
+sys.modules["verse"] = lib.verse
+try:
+    _spec = importlib.util.spec_from_file_location(
+        "server_two_app", ROOT / "apps" / "server-two" / "app.py"
+    )
+    server = importlib.util.module_from_spec(_spec)
+    _spec.loader.exec_module(server)
+finally:
+    del sys.modules["verse"]
+
+METERS = [f"MT_{i:03d}" for i in range(1, 7)]
+
+
+class TestServerTwo(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        rng = np.random.default_rng(0)
+        base = rng.normal(size=(500, 3))
+        noise = rng.normal(size=(500, len(METERS)))
+        # Meters 1-2, 3-4 and 5-6 share a signal at decreasing strength
+        values = base.repeat(2, axis=1) * [4, 4, 2, 2, 1, 1] + noise
+        server.app.corr_matrix = np.corrcoef(values.T)
+        # Four readings a day from 2012-01-01, with no data from 2012-02-20 to
+        # 2012-02-24
+        hours = np.arange(500) * 6 + np.where(np.arange(500) < 200, 0, 5 * 24)
+        cls.values = values
+        cls.timestamps = np.datetime64("2012-01-01T00", "h") + hours
+        # A neighbor index narrower than the meter count, so larger k are
+        # served from the correlation matrix rows
+        with mock.patch.object(server, "TOP_K", 2):
+            server._build_neighbor_index(METERS)
+        cls.client = TestClient(server.app)
+
+    def setUp(self):
+        server._corr_body.cache_clear()
+
+    def expected_neighbors(self, meter: str) -> list[str]:
+        row = server.app.corr_matrix[METERS.index(meter)].copy()
+        row[METERS.index(meter)] = -np.inf
+        return [METERS[j] for j in np.argsort(-row, kind="stable")[:-1]]
+
+    def test_corr(self):
+        """
+        Test the most correlated meter and the top `k` within and beyond the
+        precomputed neighbor index
+        """
+        response = self.client.get("/corr/MT_001")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["meter"], "MT_002")
+        self.assertAlmostEqual(
+            response.json()["corr"], server.app.corr_matrix[0, 1], places=6
+        )
+        for k in (2, 4, len(METERS) + 3):
+            neighbors = self.client.get("/corr/MT_003", params={"k": k}).json()
+            self.assertEqual(
+                [n["meter"] for n in neighbors["neighbors"]],
+                self.expected_neighbors("MT_003")[:k],
+            )
+
+    def test_k_bounds(self):
+        """Test `k` below 1 is rejected on both endpoints"""
+        for k in (0, -1):
+            self.assertEqual(
+                self.client.get("/corr/MT_001", params={"k": k}).status_code, 422
+            )
+            response = self.client.post("/corr", json={"meters": ["MT_001"], "k": k})
+            self.assertEqual(response.status_code, 422)
+        self.assertEqual(
+            self.client.get("/corr/MT_001", params={"k": "two"}).status_code, 422
+        )
+
+    def test_unknown_meter(self):
+        """Test an unknown meter is a 404 and errors are never cached"""
+        for _ in range(2):
+            response = self.client.get("/corr/MT_999")
+            self.assertEqual(response.status_code, 404)
+            self.assertEqual(response.json()["detail"], "Unknown meter MT_999")
+        cache = self.client.get("/metrics/cache").json()
+        self.assertEqual((cache["hits"], cache["misses"], cache["size"]), (0, 2, 0))
+
+    def test_cache_counts(self):
+        """Test repeated queries are served from the response cache"""
+        self.assertIsNone(self.client.get("/metrics/cache").json()["hit_rate"])
+        first = self.client.get("/corr/MT_001").content
+        self.assertEqual(self.client.get("/corr/MT_001").content, first)
+        self.client.get("/corr/MT_001", params={"k": 3})
+        cache = self.client.get("/metrics/cache").json()
+        self.assertEqual(cache["hits"], 1)
+        self.assertEqual(cache["misses"], 2)
+        self.assertEqual(cache["size"], 2)
+        self.assertEqual(cache["maxsize"], server.CORR_CACHE_SIZE)
+        self.assertAlmostEqual(cache["hit_rate"], 1 / 3)
+
+    def test_batch(self):
+        """
+        Test a batch answers like the single endpoint in request order, with
+        null for unknown meters
+        """
+        meters = ["MT_004", "MT_999", "MT_001"]
+        for k in (None, 1, 4):
+            body = {"meters": meters} if k is None else {"meters": meters, "k": k}
+            response = self.client.post("/corr", json=body)
+            self.assertEqual(response.status_code, 200)
+            results = response.json()["results"]
+            self.assertIsNone(results[1])
+            for meter, result in zip(meters[::2], results[::2]):
+                params = {} if k is None else {"k": k}
+                single = self.client.get(f"/corr/{meter}", params=params).json()
+                self.assertEqual(result.keys(), single.keys())
+                if k is None:
+                    self.assertEqual(result["meter"], single["meter"])
+                    self.assertAlmostEqual(result["corr"], single["corr"], places=6)
+                else:
+                    self.assertEqual(
+                        [n["meter"] for n in result["neighbors"]],
+                        [n["meter"] for n in single["neighbors"]],
+                    )
+
+    def test_batch_limit(self):
+        """Test a batch over CORR_BATCH_LIMIT meters is rejected with a 413"""
+        with mock.patch.object(server, "BATCH_LIMIT", 3):
+            ok = self.client.post("/corr", json={"meters": METERS[:3]})
+            over = self.client.post("/corr", json={"meters": METERS[:4]})
+        self.assertEqual(ok.status_code, 200)
+        self.assertEqual(over.status_code, 413)
+        self.assertEqual(over.json()["detail"], "At most 3 meters per request")
+
+    def expected_window(self, meter: str, start: str | None, end: str | None):
+        """Correlation row of `meter` over the readings from `start` to `end`"""
+        days = self.timestamps.astype("datetime64[D]")
+        rows = np.ones(len(days), dtype=bool)
+        if start is not None:
+            rows &= days >= np.datetime64(start)
+        if end is not None:
+            rows &= days <= np.datetime64(end)
+        row = np.corrcoef(self.values[rows].T)[METERS.index(meter)]
+        row[METERS.index(meter)] = -np.inf
+        return row
+
+    def test_windows(self):
+        """
+        Test windowed queries match np.corrcoef over the same days, with an
+        inclusive end, open ends and the covered days echoed, and answer 400
+        for windows without data
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            common.daily_prefix_sums(
+                self.values, self.timestamps, Path(tmp) / "windows", dtype=np.float64
+            )
+            windows = common.attach_arrays(Path(tmp) / "windows")
+            with mock.patch.object(server.app, "windows", windows, create=True):
+                self.check_windows()
+                self.check_empty_windows()
+
+    def check_windows(self):
+        for start, end, covered in (
+            ("2012-01-03", "2012-01-03", ("2012-01-03", "2012-01-03")),
+            ("2012-01-10", "2012-03-10", ("2012-01-10", "2012-03-10")),
+            ("2012-02-22", None, ("2012-02-22", "2012-05-09")),
+            (None, "2012-01-20", ("2012-01-01", "2012-01-20")),
+            ("2011-06-01", "2099-01-01", ("2012-01-01", "2012-05-09")),
+        ):
+            params = {"start": start, "end": end}
+            params = {key: value for key, value in params.items() if value}
+            expected = self.expected_window("MT_003", start, end)
+            order = np.argsort(-expected, kind="stable")
+            with self.subTest(start=start, end=end):
+                best = self.client.get("/corr/MT_003", params=params).json()
+                self.assertEqual((best["start"], best["end"]), covered)
+                self.assertEqual(best["meter"], METERS[order[0]])
+                self.assertAlmostEqual(best["corr"], expected[order[0]], places=9)
+                top = self.client.get("/corr/MT_003", params={**params, "k": 3})
+                neighbors = top.json()["neighbors"]
+                self.assertEqual(
+                    [n["meter"] for n in neighbors], [METERS[j] for j in order[:3]]
+                )
+                np.testing.assert_allclose(
+                    [n["corr"] for n in neighbors], expected[order[:3]], rtol=1e-9
+                )
+
+    def check_empty_windows(self):
+        for start, end in (
+            ("2012-01-05", "2012-01-04"),
+            ("2011-01-01", "2011-12-31"),
+            ("2012-05-10", None),
+            ("2012-02-20", "2012-02-24"),
+        ):
+            params = {"start": start} if end is None else {"start": start, "end": end}
+            with self.subTest(start=start, end=end):
+                response = self.client.get("/corr/MT_001", params=params)
+                self.assertEqual(response.status_code, 400)
+        response = self.client.get("/corr/MT_999", params={"start": "2012-01-01"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_windows_disabled(self):
+        """Test windowed queries answer 501 unless CORR_WINDOWS is set"""
+        response = self.client.get("/corr/MT_001", params={"start": "2012-01-01"})
+        self.assertEqual(response.status_code, 501)
+
+
+if __name__ == "__main__":
+    unittest.main()
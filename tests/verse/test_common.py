@@ -1,3 +1,6 @@
+import json
+import subprocess
+import sys
 import unittest
 import pandas as pd
 import numpy as np
@@ -5,13 +8,34 @@ from unittest.mock import patch
 import tempfile
 import psutil
 from pathlib import Path
+from lib.verse import common
 from lib.verse.common import (
     get_memory_usage,
+    get_memory_stats,
     load_data,
     get_meter_cols,
     corr,
     profile_memory,
     elapsed_time,
+    top_k_neighbors,
+    corr_stream,
+    load_meter_data,
+    share_arrays,
+    attach_arrays,
+    iter_meter_chunks,
+    convert_meter_csv,
+    load_meter_binary,
+    read_meter_cols,
+    corr_blocked,
+    open_corr_matrix,
+    top_k_row,
+    daily_prefix_sums,
+    prefix_sums_current,
+    window_corr_row,
+    parallel_apply,
+    span,
+    span_summary,
+    write_span_summary,
 )
 
 
@@ -21,13 +45,27 @@ class TestCommon(unittest.TestCase):
         Test get_memory_usage function by unit and value must be > 0
         Test expected is almost equal to function usage
         """
-        usage = get_memory_usage()
+        usage = get_memory_usage(max_age=0)
         process = psutil.Process()
         expected_mb = process.memory_info().rss / (1024**2)
         self.assertIsInstance(usage, float)
         self.assertGreater(usage, 0)
         self.assertAlmostEqual(usage, expected_mb)
 
+    def test_get_memory_usage_cached(self):
+        """
+        Test cached readings are reused within max_age and refreshed after it
+        """
+        get_memory_usage(max_age=0)
+        stats = get_memory_stats()
+        self.assertLess(stats["age_s"], 1)
+        self.assertGreaterEqual(stats["peak_rss_mb"], stats["rss_mb"])
+        with patch.object(psutil.Process, "memory_info") as memory_info:
+            memory_info.return_value.rss = 2 * 1024**2
+            self.assertNotEqual(get_memory_usage(max_age=60), 2.0)
+            self.assertEqual(get_memory_usage(max_age=0), 2.0)
+        get_memory_usage(max_age=0)
+
     def test_profile_memory(self):
         expected = "Hello world"
 
@@ -139,6 +177,320 @@ class TestCommon(unittest.TestCase):
         # Pearson correlation matrix
         self.assertAlmostEqual(mat[0, 1], -1.0, places=6)
 
+    def test_top_k_neighbors(self):
+        """
+        Test top_k_neighbors orders best first, skips the diagonal and NaNs
+        """
+        mat = np.array(
+            [
+                [1.0, 0.2, 0.9, np.nan],
+                [0.2, 1.0, -0.5, 0.7],
+                [0.9, -0.5, 1.0, 0.1],
+                [np.nan, 0.7, 0.1, 1.0],
+            ]
+        )
+        idx, vals = top_k_neighbors(mat, 2)
+        self.assertEqual(idx.shape, (4, 2))
+        np.testing.assert_array_equal(idx[0], [2, 1])
+        np.testing.assert_array_equal(idx[1], [3, 0])
+        np.testing.assert_allclose(vals[2], [0.9, 0.1])
+        self.assertFalse(np.any(idx == np.arange(4)[:, None]))
+        # Requesting more neighbors than exist is clamped to n - 1
+        idx, vals = top_k_neighbors(mat, 10)
+        self.assertEqual(idx.shape, (4, 3))
+        self.assertTrue(np.isneginf(vals[0, -1]))
+        # Row blocks and row subsets agree with scoring the whole matrix
+        idx, vals = top_k_neighbors(mat, 2)
+        blocked = top_k_neighbors(mat, 2, block_size=3)
+        np.testing.assert_array_equal(blocked[0], idx)
+        subset = top_k_neighbors(mat, 2, rows=np.array([3, 0]))
+        np.testing.assert_array_equal(subset[0], idx[[3, 0]])
+
+    def test_corr_blocked(self):
+        """
+        Test the tiled on-disk correlation matches np.corrcoef, including a
+        partial last tile and a constant column, and is opened memory-mapped
+        """
+        rng = np.random.default_rng(0)
+        values = rng.normal(size=(50, 7)).astype(np.float32)
+        values[:, 4] = 2.0
+        with np.errstate(invalid="ignore"):
+            expected = np.corrcoef(values.T.astype(np.float64))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = corr_blocked(values, Path(tmp) / "corr.npy", 3, chunksize=8)
+            mat = open_corr_matrix(path)
+            self.assertIsInstance(mat, np.memmap)
+            self.assertEqual((mat.shape, mat.dtype), ((7, 7), np.float32))
+            np.testing.assert_allclose(mat, expected, atol=1e-6)
+            self.assertEqual(sorted(p.name for p in Path(tmp).iterdir()), ["corr.npy"])
+            del mat
+
+    def test_corr_stream(self):
+        """
+        Test corr_stream matches np.corrcoef across uneven chunk boundaries
+        """
+        rng = np.random.default_rng(0)
+        data = rng.normal(1000.0, 5.0, size=(257, 5))
+        data[:, 1] = data[:, 0] * 2 + rng.normal(size=257)
+        df = pd.DataFrame(data, columns=[f"MT_{i}" for i in range(5)])
+        df.insert(0, "ts", np.arange(257))
+        with tempfile.NamedTemporaryFile(mode="w+", suffix=".csv") as temp_file:
+            df.to_csv(temp_file.name, sep=";", decimal=",", index=False)
+            cols = get_meter_cols(df)
+            expected = corr(df, cols)
+            for chunksize in (1, 50, 1000):
+                actual = corr_stream(
+                    Path(temp_file.name),
+                    cols,
+                    chunksize=chunksize,
+                    delimiter=";",
+                    decimal=",",
+                )
+                np.testing.assert_allclose(actual, expected, rtol=0, atol=1e-9)
+
+    def test_load_data_cache(self):
+        """
+        Test load_data(cache=True) round trips the frame, skips pandas.read_csv
+        on a cache hit and rebuilds after the CSV changes
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "meters.csv"
+            path.write_text(
+                ";MT_001;MT_002;note\n"
+                "2011-01-01 00:15:00;1,5;2;a\n"
+                "2011-01-01 00:30:00;2,5;3;\n"
+            )
+            kwargs = {"delimiter": ";", "decimal": ","}
+            expected = load_data(path, cache=True, **kwargs)
+            with patch("pandas.read_csv", wraps=pd.read_csv) as mock_read:
+                cached = load_data(path, cache=True, **kwargs)
+                mock_read.assert_not_called()
+            pd.testing.assert_frame_equal(cached, expected)
+            self.assertTrue(pd.isna(cached["note"][1]))
+
+            path.write_text(";MT_001\n2011-01-01 00:15:00;7\n")
+            changed = load_data(path, cache=True, **kwargs)
+            self.assertEqual(list(changed.columns), ["Unnamed: 0", "MT_001"])
+            self.assertEqual(changed["MT_001"][0], 7)
+
+    def test_load_meter_data(self):
+        """
+        Test load_meter_data parses a DatetimeIndex, downcasts meters to float32
+        and only keeps the selected columns
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "meters.csv"
+            path.write_text(
+                ";MT_001;MT_002;other\n"
+                "2011-01-01 00:15:00;1,5;2;x\n"
+                "2011-01-01 00:30:00;2,5;3;y\n"
+            )
+            df = load_meter_data(path, cache=False)
+            self.assertIsInstance(df.index, pd.DatetimeIndex)
+            self.assertEqual(list(df.columns), ["MT_001", "MT_002"])
+            self.assertTrue((df.dtypes == np.float32).all())
+            self.assertAlmostEqual(df["MT_001"].iloc[1], 2.5)
+            df = load_meter_data(path, ["MT_002"], cache=False)
+            self.assertEqual(list(df.columns), ["MT_002"])
+
+    def test_share_and_attach_arrays(self):
+        """
+        Test arrays written by share_arrays attach as read-only memory maps
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            mat = np.arange(9, dtype=np.float64).reshape(3, 3)
+            names = np.array(["MT_001", "MT_002", "MT_003"])
+            share_arrays(Path(tmp), corr=mat, meter_cols=names)
+            arrays = attach_arrays(Path(tmp))
+            self.assertEqual(set(arrays), {"corr", "meter_cols"})
+            np.testing.assert_array_equal(arrays["corr"], mat)
+            self.assertEqual(arrays["meter_cols"].tolist(), names.tolist())
+            self.assertIsInstance(arrays["corr"], np.memmap)
+            with self.assertRaises(ValueError):
+                arrays["corr"][0, 0] = 1.0
+
+    def test_iter_meter_chunks(self):
+        """
+        Test iter_meter_chunks yields float32 meter blocks covering every row
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "meters.csv"
+            rows = [f"2011-01-01 00:{i:02d}:00;{i},5;{2 * i}" for i in range(5)]
+            path.write_text(";MT_001;MT_002\n" + "\n".join(rows) + "\n")
+            chunks = list(iter_meter_chunks(path, chunksize=2))
+            self.assertEqual([c.shape for c in chunks], [(2, 2), (2, 2), (1, 2)])
+            self.assertTrue(all(c.dtype == np.float32 for c in chunks))
+            np.testing.assert_allclose(np.vstack(chunks)[:, 0], np.arange(5) + 0.5)
+
+    def test_convert_meter_csv(self):
+        """
+        Test the binary conversion round-trips through load_meter_binary, is
+        read in place of the CSV, and is ignored once the CSV changes
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "meters.csv"
+            rows = [f"2011-01-01 00:{i:02d}:00;{i},5;{2 * i};x" for i in range(5)]
+            path.write_text(";MT_001;MT_002;other\n" + "\n".join(rows) + "\n\n")
+            expected = load_meter_data(path, cache=False)
+            paths = convert_meter_csv(path, chunksize=2)
+            values, timestamps, columns = load_meter_binary(path)
+            self.assertEqual(columns, ["MT_001", "MT_002"])
+            self.assertEqual((values.shape, values.dtype), ((5, 2), np.float32))
+            self.assertIsInstance(values, np.memmap)
+            np.testing.assert_array_equal(values, expected.to_numpy())
+            np.testing.assert_array_equal(timestamps, expected.index.to_numpy())
+
+            path.unlink()
+            df = load_meter_data(path, ["MT_002"])
+            np.testing.assert_array_equal(df["MT_002"], expected["MT_002"])
+            self.assertTrue(df.index.equals(expected.index))
+            chunks = list(iter_meter_chunks(path, chunksize=2))
+            self.assertEqual([c.shape for c in chunks], [(2, 2), (2, 2), (1, 2)])
+            self.assertEqual(read_meter_cols(path), columns)
+
+            path.write_text(";MT_009\n2011-01-01 00:15:00;1\n")
+            self.assertEqual(read_meter_cols(path), ["MT_009"])
+            self.assertEqual(
+                list(load_meter_data(path, cache=False).columns), ["MT_009"]
+            )
+            convert_meter_csv(path)
+            self.assertEqual(json.loads(paths["columns"].read_text())["rows"], 1)
+
+    def test_window_corr_row(self):
+        """
+        Test window correlations from the daily prefix sums match np.corrcoef
+        over the same days, including a meter that is constant in the window
+        and a day without readings
+        """
+        rng = np.random.default_rng(1)
+        index = pd.date_range("2011-01-01 00:15", periods=6 * 24, freq="h")
+        index = index[(index < "2011-01-03") | (index >= "2011-01-04")]
+        values = rng.gamma(2.0, 5.0, size=(len(index), 5)).astype(np.float32)
+        values[index < "2011-01-03", 3] = 0
+        with tempfile.TemporaryDirectory() as tmp:
+            daily_prefix_sums(values, index.to_numpy(), Path(tmp) / "windows")
+            prefix = attach_arrays(Path(tmp) / "windows")
+            # Building in meter stripes writes the same sums
+            daily_prefix_sums(
+                values, index.to_numpy(), Path(tmp) / "striped", block_size=2
+            )
+            striped = attach_arrays(Path(tmp) / "striped")
+            for name in ("cross", "squares", "sums", "count"):
+                np.testing.assert_allclose(striped[name], prefix[name], rtol=1e-6)
+            del striped
+            self.assertEqual(len(prefix["days"]), 6)
+            self.assertEqual(prefix["cross"].shape, (7, 5, 5))
+            for lo, hi in [(0, 6), (1, 4), (0, 2)]:
+                days = index.normalize()
+                mask = (days >= prefix["days"][lo]) & (days <= prefix["days"][hi - 1])
+                with np.errstate(invalid="ignore"):
+                    expected = np.corrcoef(values[mask].T.astype(np.float64))[0]
+                row = window_corr_row(prefix, 0, lo, hi)
+                np.testing.assert_allclose(row, expected, atol=1e-5)
+            self.assertTrue(np.isnan(window_corr_row(prefix, 0, 0, 2)[3]))
+            idx, vals = top_k_row(row, 10, 0)
+            self.assertEqual(len(idx), 4)
+            self.assertNotIn(0, idx)
+            self.assertTrue(np.isneginf(vals[-1]))
+            del prefix
+
+            source = Path(tmp) / "meters.csv"
+            source.write_text(";MT_001\n")
+            directory = Path(tmp) / "sourced"
+            self.assertFalse(prefix_sums_current(directory, source))
+            daily_prefix_sums(values, index.to_numpy(), directory, source=source)
+            self.assertTrue(prefix_sums_current(directory, source))
+            source.write_text(";MT_001;MT_002\n")
+            self.assertFalse(prefix_sums_current(directory, source))
+
+    def test_import_is_lazy(self):
+        """
+        Test importing verse.common does not import pandas, numpy or structlog
+        until a data helper or the logger is used
+        """
+        code = (
+            "import sys\n"
+            "from lib.verse import common\n"
+            "heavy = {'pandas', 'numpy', 'structlog'}\n"
+            "print(sorted(heavy & set(sys.modules)))\n"
+            "common.get_meter_cols\n"
+            "print(sorted(heavy & set(sys.modules)))\n"
+        )
+        out = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        ).stdout.splitlines()
+        self.assertEqual(out, ["[]", "['numpy', 'pandas']"])
+
+    def test_parallel_apply(self):
+        """
+        Test parallel_apply returns per-partition results in order for numeric
+        rows, numeric columns and string data
+        """
+        arr = np.arange(20, dtype=np.float64).reshape(10, 2)
+        parts = parallel_apply(np.sum, arr, workers=3)
+        self.assertEqual(len(parts), 3)
+        self.assertEqual(sum(parts), arr.sum())
+        cols = parallel_apply(np.ravel, pd.DataFrame(arr), workers=2, axis=1)
+        np.testing.assert_array_equal(cols[1], arr[:, 1])
+        texts = pd.Series(["a", "bb", None, "dddd", "é"])
+        lengths = parallel_apply(np.strings.str_len, texts, workers=2)
+        np.testing.assert_array_equal(np.concatenate(lengths), [1, 2, 0, 4, 1])
+        self.assertEqual(parallel_apply(np.sum, np.empty((0, 2))), [])
+
+    def test_span(self):
+        """
+        Test spans nest by path, record timing and RSS fields, work as a
+        decorator and aggregate into the JSON summary
+        """
+
+        @span("inner", log=False)
+        def inner():
+            return np.ones(1_000_000).sum()
+
+        with span("outer", trace_allocations=3, log=False) as record:
+            self.assertEqual(inner(), 1_000_000)
+            self.assertEqual(inner(), 1_000_000)
+        self.assertEqual(record["path"], "outer")
+        self.assertGreater(record["duration_ms"], 0)
+        self.assertGreaterEqual(record["rss_peak_mb"], record["rss_before_mb"])
+        self.assertLessEqual(len(record["top_allocations"]), 3)
+        summary = span_summary()["spans"]
+        self.assertGreaterEqual(summary["outer/inner"]["count"], 2)
+        before = summary["outer/inner"]["count"]
+        with span("outer", log=False):
+            for _ in range(100):
+                inner()
+        summary = span_summary()["spans"]
+        self.assertEqual(summary["outer/inner"]["count"], before + 100)
+        self.assertGreater(summary["outer/inner"]["max_ms"], 0)
+        self.assertGreaterEqual(summary["outer"]["total_ms"], record["duration_ms"])
+        # Timing-only spans, as elapsed_time uses, never read /proc
+        timed_func = elapsed_time(lambda: None)
+        with patch("lib.verse.common.get_memory_usage") as read:
+            with span("timed", log=False, memory=False) as timed:
+                pass
+            timed_func()
+        read.assert_not_called()
+        self.assertNotIn("rss_peak_mb", timed)
+        self.assertGreaterEqual(timed["duration_ms"], 0)
+        summary = span_summary()["spans"]
+        self.assertEqual(summary["timed"]["count"], 1)
+        self.assertNotIn("rss_peak_mb", summary["timed"])
+        self.assertIn("TestCommon.test_span.<locals>.<lambda>", summary)
+        # Concurrent spans with equal records keep their own peaks
+        with span("twin", log=False) as first, span("twin", log=False) as second:
+            second.update(first)
+            common._rss_sampler.remove(second)
+            self.assertIn(id(first), common._rss_sampler.active)
+            self.assertNotIn(id(second), common._rss_sampler.active)
+            common._rss_sampler.add(second)
+        with self.assertRaises(ValueError), span("failing", log=False) as failed:
+            raise ValueError
+        self.assertEqual(failed["error"], "ValueError")
+        with tempfile.TemporaryDirectory() as d:
+            path = write_span_summary(Path(d) / "profile.json")
+            self.assertIn("outer/inner", json.loads(path.read_text())["spans"])
+
 
 if __name__ == "__main__":
     unittest.main()
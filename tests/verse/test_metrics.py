@@ -0,0 +1,108 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from lib.verse.metrics import (
+    LATENCY,
+    REQUESTS,
+    Counter,
+    Gauge,
+    Histogram,
+    MetricsMiddleware,
+    Registry,
+    grpc_interceptor,
+    render,
+)
+
+
+class TestMetrics(unittest.TestCase):
+    def test_registry_render(self):
+        """
+        Test counters, gauges and histograms render in the Prometheus text
+        format with escaped labels and cumulative buckets
+        """
+        registry = Registry()
+        requests = registry.register(Counter("req_total", "Requests.", ("route",)))
+        gauge = registry.register(Gauge("in_flight", "In flight."))
+        latency = registry.register(
+            Histogram("latency_seconds", "Latency.", ("route",), buckets=(0.1, 1.0))
+        )
+        requests.inc('/a"b')
+        requests.inc('/a"b')
+        gauge.inc()
+        gauge.dec()
+        for value in (0.05, 0.5, 0.1, 5.0):
+            latency.observe(value, "/a")
+        text = registry.render()
+        self.assertIn("# TYPE req_total counter", text)
+        self.assertIn('req_total{route="/a\\"b"} 2', text)
+        self.assertIn("in_flight 0", text)
+        self.assertIn('latency_seconds_bucket{route="/a",le="0.1"} 2', text)
+        self.assertIn('latency_seconds_bucket{route="/a",le="1"} 3', text)
+        self.assertIn('latency_seconds_bucket{route="/a",le="+Inf"} 4', text)
+        self.assertIn('latency_seconds_count{route="/a"} 4', text)
+        self.assertIn('latency_seconds_sum{route="/a"} 5.65', text)
+        with self.assertRaises(ValueError):
+            registry.register(Counter("req_total", "Again."))
+
+    def test_metrics_middleware(self):
+        """
+        Test the ASGI middleware counts requests by route template and status
+        """
+
+        async def app(scope, receive, send):
+            scope["route"] = SimpleNamespace(path="/items/{item_id}")
+            await send({"type": "http.response.start", "status": 404})
+
+        async def send(message):
+            pass
+
+        scope = {"type": "http", "method": "GET", "path": "/items/7"}
+        before = REQUESTS.values.get(("GET", "/items/{item_id}", "404"), 0)
+        asyncio.run(MetricsMiddleware(app)(scope, None, send))
+        self.assertEqual(
+            REQUESTS.values[("GET", "/items/{item_id}", "404")], before + 1
+        )
+        self.assertIn(("GET", "/items/{item_id}"), LATENCY.values)
+        self.assertIn("process_resident_memory_bytes", render())
+
+    def test_rss_gauge(self):
+        """Test the RSS gauge reports the memory sampler's reading in bytes"""
+        with patch("lib.verse.common.get_memory_usage", return_value=1.5):
+            self.assertIn("\nprocess_resident_memory_bytes 1572864\n", render())
+
+    def test_grpc_interceptor(self):
+        """
+        Test the gRPC interceptor records unary calls under the RPC name and
+        wraps each method's handler only once
+        """
+        import grpc
+
+        async def echo(request, context):
+            return request
+
+        handler = grpc.unary_unary_rpc_method_handler(echo)
+
+        async def continuation(details):
+            return handler
+
+        context = SimpleNamespace(code=lambda: None)
+        details = SimpleNamespace(method="/test.Service/Echo")
+        interceptor = grpc_interceptor()
+        key = ("GRPC", "/test.Service/Echo", "OK")
+        before = REQUESTS.values.get(key, 0)
+
+        async def call():
+            wrapped = await interceptor.intercept_service(continuation, details)
+            return wrapped, await wrapped.unary_unary(b"x", context)
+
+        (first, response), (second, _) = asyncio.run(call()), asyncio.run(call())
+        self.assertEqual(response, b"x")
+        self.assertIs(first, second)
+        self.assertIsNot(first, handler)
+        self.assertEqual(REQUESTS.values[key], before + 2)
+
+
+if __name__ == "__main__":
+    unittest.main()